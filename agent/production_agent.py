@@ -11,7 +11,6 @@ import time
 import json
 import psutil
 import socket
-import requests
 import subprocess
 import threading
 import signal
@@ -23,15 +22,1167 @@ from logging.handlers import RotatingFileHandler
 import hashlib
 import uuid
 import re
+import random
+import gzip
+import codecs
+import selectors
+import heapq
+import math
+import shutil
 from typing import Dict, List, Optional, Any
-import sqlite3
-from pathlib import Path
-import websocket
-import ssl
-from urllib.parse import urlparse
+from collections import deque
+
+# requests, websocket и sqlite3 импортируются при первом использовании:
+# агент начинает сбор сразу, а память под подсистемы тратится только если они нужны
+
+# Адрес панели по умолчанию - установщик панели подставляет сюда реальные значения
+DEFAULT_PANEL_ADDRESS = "localhost"
+DEFAULT_PANEL_PORT = 5000
+
+class SocketIOClient:
+    """Minimal Socket.IO v5 (Engine.IO v4) client on top of websocket-client"""
+    
+    def __init__(self, url, logger, on_connect=None, reconnect_min=1, reconnect_max=60, namespace='/', auth=None):
+        self.url = url
+        self.logger = logger
+        self.on_connect = on_connect
+        # Пакеты не-корневого namespace имеют префикс "/name,"
+        self.namespace = namespace
+        self.ns_prefix = '' if namespace == '/' else namespace + ','
+        # auth - callable: токен может появиться после регистрации, берём свежий при каждом подключении
+        self.auth = auth
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.handlers = {}
+        self.ws = None
+        self.connected = False
+        self.running = False
+        self.reconnect_attempts = 0
+        
+        # Engine.IO heartbeat (значения по умолчанию уточняются в handshake)
+        self.ping_interval = 25
+        self.ping_timeout = 20
+        self.last_packet = time.monotonic()
+        
+        # Acknowledgements
+        self.ack_callbacks = {}
+        self.ack_counter = 0
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+    
+    def on(self, event, handler):
+        """Register handler(event, data, ack) for event"""
+        self.handlers[event] = handler
+    
+    def emit(self, event, data=None, callback=None):
+        """Emit event, optionally requesting an acknowledgement delivered to callback"""
+        packet = '42' + self.ns_prefix
+        if callback:
+            with self.lock:
+                self.ack_counter += 1
+                ack_id = self.ack_counter
+                self.ack_callbacks[ack_id] = callback
+            packet += str(ack_id)
+        
+        args = [event] if data is None else [event, data]
+        if not self.connected:
+            return False
+        return self._send(packet + json.dumps(args, default=str))
+    
+    def _send(self, packet):
+        """Send raw Engine.IO packet"""
+        try:
+            with self.send_lock:
+                if self.ws:
+                    self.ws.send(packet)
+                    return True
+        except Exception as e:
+            self.logger.error(f"Socket.IO send error: {e}")
+        return False
+    
+    def run_forever(self):
+        """Connect and keep the connection alive until stop() is called"""
+        import websocket
+        
+        self.running = True
+        
+        while self.running:
+            self.last_packet = time.monotonic()
+            self.ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close
+            )
+            
+            watchdog = threading.Thread(target=self._watchdog, args=(self.ws,), daemon=True)
+            watchdog.start()
+            
+            try:
+                self.ws.run_forever()
+            except Exception as e:
+                self.logger.error(f"Socket.IO connection error: {e}")
+            
+            self.connected = False
+            self._drop_pending_acks()
+            
+            if not self.running:
+                break
+            
+            # Экспоненциальная задержка с jitter перед переподключением
+            self.reconnect_attempts += 1
+            delay = min(self.reconnect_max, self.reconnect_min * (2 ** (self.reconnect_attempts - 1)))
+            time.sleep(random.uniform(delay / 2, delay))
+    
+    def stop(self):
+        """Close connection and stop reconnecting"""
+        self.running = False
+        self.connected = False
+        try:
+            if self.ws:
+                self._send('41')
+                self.ws.close()
+        except Exception:
+            pass
+    
+    def _watchdog(self, ws):
+        """Close half-open connection when server pings stop arriving"""
+        while self.running and self.ws is ws:
+            time.sleep(1)
+            if time.monotonic() - self.last_packet > self.ping_interval + self.ping_timeout:
+                self.logger.warning("Socket.IO ping timeout, reconnecting")
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+                return
+    
+    def _drop_pending_acks(self):
+        """Forget acknowledgements that can no longer arrive"""
+        with self.lock:
+            pending = len(self.ack_callbacks)
+            self.ack_callbacks.clear()
+        if pending:
+            self.logger.warning(f"Dropped {pending} pending Socket.IO acknowledgements")
+    
+    def _on_open(self, ws):
+        self.logger.debug("WebSocket transport opened")
+    
+    def _on_error(self, ws, error):
+        self.logger.error(f"WebSocket error: {error}")
+    
+    def _on_close(self, ws, close_status_code, close_msg):
+        if self.connected:
+            self.logger.warning("WebSocket connection closed")
+        self.connected = False
+    
+    def _on_message(self, ws, message):
+        self.last_packet = time.monotonic()
+        if not isinstance(message, str) or not message:
+            return
+        
+        try:
+            packet_type, body = message[0], message[1:]
+            
+            if packet_type == '0':  # Engine.IO open
+                handshake = json.loads(body)
+                self.ping_interval = handshake.get('pingInterval', 25000) / 1000.0
+                self.ping_timeout = handshake.get('pingTimeout', 20000) / 1000.0
+                self._connect_namespace()
+            elif packet_type == '2':  # ping -> pong
+                self._send('3' + body)
+            elif packet_type == '1':  # close
+                ws.close()
+            elif packet_type == '4':
+                self._handle_socketio_packet(body)
+        except Exception as e:
+            self.logger.error(f"Error processing WebSocket message: {e}")
+    
+    def _connect_namespace(self):
+        """Socket.IO CONNECT to our namespace with auth payload"""
+        auth = self.auth() if self.auth else None
+        self._send('40' + self.ns_prefix + (json.dumps(auth) if auth else ''))
+    
+    def _handle_socketio_packet(self, packet):
+        packet_type, body = packet[:1], packet[1:]
+        
+        # Пакеты чужих namespace игнорируем
+        namespace = '/'
+        if body.startswith('/'):
+            namespace, _, body = body.partition(',')
+        if namespace != self.namespace:
+            return
+                
+        if packet_type == '0':  # CONNECT
+            self.connected = True
+            self.reconnect_attempts = 0
+            self.logger.info("WebSocket connection established")
+            if self.on_connect:
+                self.on_connect()
+        
+        elif packet_type == '1':  # DISCONNECT
+            self.logger.warning("Socket.IO namespace disconnected by server")
+            self.ws.close()
+        
+        elif packet_type == '4':  # CONNECT_ERROR
+            self.logger.error(f"Socket.IO connect error: {body}")
+            self.ws.close()
+        
+        elif packet_type in ('2', '3'):  # EVENT / ACK
+            match = re.match(r'(\d*)(.*)', body, re.S)
+            ack_id = int(match.group(1)) if match.group(1) else None
+            args = json.loads(match.group(2)) if match.group(2) else []
+            
+            if packet_type == '2':
+                self._dispatch_event(args, ack_id)
+            else:
+                with self.lock:
+                    callback = self.ack_callbacks.pop(ack_id, None)
+                if callback:
+                    callback(*args)
+    
+    def _dispatch_event(self, args, ack_id):
+        if not args:
+            return
+        
+        event = args[0]
+        data = args[1] if len(args) > 1 else None
+        handler = self.handlers.get(event)
+        if not handler:
+            self.logger.debug(f"Ignoring unknown Socket.IO event: {event}")
+            return
+        
+        ack = None
+        if ack_id is not None:
+            def ack(*response):
+                self._send(f'43{self.ns_prefix}{ack_id}' + json.dumps(list(response), default=str))
+        
+        handler(event, data, ack)
+
+class AgentExecutor:
+    """Bounded worker pool for panel requests with a reserved lane for light queries"""
+    
+    def __init__(self, logger, workers=4, max_queue=100, reserved_light_workers=1):
+        self.logger = logger
+        self.workers = max(2, workers)
+        self.max_queue = max_queue
+        # Тяжелые задачи никогда не занимают все потоки
+        self.max_heavy = max(1, self.workers - max(1, reserved_light_workers))
+        self.light_tasks = deque()
+        self.heavy_tasks = deque()
+        self.heavy_running = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.threads = []
+        self.stats = {
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timed_out': 0
+        }
+    
+    def start(self):
+        """Start worker threads"""
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"agent-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+    
+    def stop(self):
+        """Stop worker threads after current tasks"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+    
+    def submit(self, func, respond, light=False, timeout=30):
+        """Queue func for execution; respond(result, error) is called exactly once"""
+        task = {
+            'func': func,
+            'respond': respond,
+            'light': light,
+            'timeout': timeout,
+            'deadline': time.monotonic() + timeout,
+            'done': False,
+            'lock': threading.Lock()
+        }
+        
+        with self.condition:
+            if len(self.light_tasks) + len(self.heavy_tasks) >= self.max_queue:
+                self.stats['rejected'] += 1
+                return False
+            
+            (self.light_tasks if light else self.heavy_tasks).append(task)
+            self.condition.notify()
+        return True
+    
+    def get_stats(self):
+        """Get queue depth and task counters"""
+        with self.condition:
+            return dict(
+                self.stats,
+                queued_light=len(self.light_tasks),
+                queued_heavy=len(self.heavy_tasks),
+                heavy_running=self.heavy_running
+            )
+    
+    def _worker(self):
+        while True:
+            with self.condition:
+                while self.running and not (
+                    self.light_tasks or (self.heavy_tasks and self.heavy_running < self.max_heavy)
+                ):
+                    self.condition.wait()
+                
+                if not self.running:
+                    return
+                
+                if self.light_tasks:
+                    task = self.light_tasks.popleft()
+                else:
+                    task = self.heavy_tasks.popleft()
+                    self.heavy_running += 1
+            
+            try:
+                self._run(task)
+            finally:
+                if not task['light']:
+                    with self.condition:
+                        self.heavy_running -= 1
+                        self.condition.notify()
+    
+    def _run(self, task):
+        remaining = task['deadline'] - time.monotonic()
+        if remaining <= 0:
+            self._expire(task)
+            return
+        
+        timer = threading.Timer(remaining, self._expire, args=(task,))
+        timer.daemon = True
+        timer.start()
+        
+        try:
+            result = task['func']()
+            error = None
+        except Exception as e:
+            self.logger.error(f"Agent task failed: {e}")
+            result, error = None, str(e)
+        finally:
+            timer.cancel()
+        
+        if self._finish(task, result, error):
+            with self.condition:
+                self.stats['failed' if error else 'completed'] += 1
+    
+    def _expire(self, task):
+        if self._finish(task, None, f"Request timed out after {task['timeout']} seconds"):
+            with self.condition:
+                self.stats['timed_out'] += 1
+    
+    def _finish(self, task, result, error):
+        with task['lock']:
+            if task['done']:
+                return False
+            task['done'] = True
+        
+        try:
+            task['respond'](result, error)
+        except Exception as e:
+            self.logger.error(f"Error delivering agent task result: {e}")
+        return True
+
+class LogFollower:
+    """Incremental log file reader that survives rotation (tracks inode and offset)"""
+    
+    def __init__(self, path, inode=None, offset=None, max_read=256 * 1024):
+        self.path = path
+        self.max_read = max_read
+        self.file = None
+        self.inode = None
+        self.partial = b''
+        # Последняя позиция, подтвержденная отправкой данных на панель
+        self.committed = (inode, offset)
+        self._open(inode, offset)
+    
+    def _open(self, inode=None, offset=None):
+        try:
+            self.file = open(self.path, 'rb')
+        except OSError:
+            self.file = None
+            return
+        
+        st = os.fstat(self.file.fileno())
+        self.inode = st.st_ino
+        self.partial = b''
+        
+        if inode == st.st_ino and offset is not None and offset <= st.st_size:
+            self.file.seek(offset)
+        elif inode is None:
+            # Первый запуск - не отправляем всю историю файла
+            self.file.seek(0, os.SEEK_END)
+    
+    def read_lines(self):
+        """Read complete lines appended since the previous call"""
+        if not self.file:
+            self._open(inode=-1)
+            if not self.file:
+                return []
+        
+        data = self.partial + self.file.read(self.max_read)
+        
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            st = None
+        
+        if st is not None and st.st_ino != self.inode:
+            # Файл ротирован - дочитываем старый и переходим на новый с начала
+            data += self.file.read(self.max_read)
+            if data and not data.endswith(b'\n'):
+                data += b'\n'
+            self.file.close()
+            self._open(inode=-1)
+            if self.file:
+                data += self.file.read(self.max_read)
+        elif st is not None and st.st_size < self.file.tell():
+            # Файл усечен (copytruncate)
+            self.file.seek(0)
+            data = self.file.read(self.max_read)
+        
+        lines = data.split(b'\n')
+        self.partial = lines.pop()
+        return [line.decode('utf-8', errors='replace') for line in lines if line]
+    
+    def position(self):
+        """Current (inode, offset) excluding a trailing partial line"""
+        if not self.file:
+            return (None, None)
+        return (self.inode, self.file.tell() - len(self.partial))
+    
+    def commit(self):
+        """Mark lines read so far as delivered"""
+        self.committed = self.position()
+        return self.committed
+    
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class AuthFailureTracker:
+    """Per-IP aggregation of SSH authentication failures parsed from auth log lines"""
+    
+    FAILED_RE = re.compile(
+        r'Failed (?:password|publickey|none|keyboard-interactive/pam) for (?:invalid user )?(\S+) from (\S+) port'
+    )
+    INVALID_USER_RE = re.compile(r'Invalid user (\S*) from (\S+)')
+    ISO_TIME_RE = re.compile(r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})')
+    SYSLOG_TIME_RE = re.compile(r'^([A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2})')
+    
+    def __init__(self, window=86400, max_ips=10000, max_users=10):
+        self.window = window
+        self.max_ips = max_ips
+        self.max_users = max_users
+        self.by_ip = {}
+        self.total = 0
+    
+    def feed(self, lines):
+        """Parse new auth log lines"""
+        for line in lines:
+            if 'sshd' not in line:
+                continue
+            
+            match = self.FAILED_RE.search(line)
+            if match:
+                self._record(match.group(2), match.group(1), line, counted=True)
+                continue
+            
+            # "Invalid user" предшествует строке Failed - запоминаем только имя
+            match = self.INVALID_USER_RE.search(line)
+            if match:
+                self._record(match.group(2), match.group(1), line, counted=False)
+    
+    def summary(self, limit=50):
+        """Top IPs by failure count within the window"""
+        cutoff = time.time() - self.window
+        for ip in [ip for ip, entry in self.by_ip.items() if entry['last_seen'] < cutoff]:
+            del self.by_ip[ip]
+        
+        entries = heapq.nlargest(
+            limit,
+            (entry for entry in self.by_ip.values() if entry['count']),
+            key=lambda entry: entry['count']
+        )
+        return [{
+            'ip': entry['ip'],
+            'count': entry['count'],
+            'users': list(entry['users']),
+            'first_seen': datetime.fromtimestamp(entry['first_seen']).isoformat(),
+            'last_seen': datetime.fromtimestamp(entry['last_seen']).isoformat(),
+            'timestamp': datetime.fromtimestamp(entry['last_seen']).isoformat()
+        } for entry in entries]
+    
+    def _record(self, ip, user, line, counted):
+        seen = self._parse_time(line)
+        entry = self.by_ip.get(ip)
+        
+        if entry is None:
+            if len(self.by_ip) >= self.max_ips:
+                oldest = min(self.by_ip, key=lambda key: self.by_ip[key]['last_seen'])
+                del self.by_ip[oldest]
+            entry = self.by_ip[ip] = {
+                'ip': ip,
+                'count': 0,
+                'users': [],
+                'first_seen': seen,
+                'last_seen': seen
+            }
+        
+        if counted:
+            entry['count'] += 1
+            self.total += 1
+        entry['first_seen'] = min(entry['first_seen'], seen)
+        entry['last_seen'] = max(entry['last_seen'], seen)
+        if user and user not in entry['users'] and len(entry['users']) < self.max_users:
+            entry['users'].append(user)
+    
+    def _parse_time(self, line):
+        try:
+            match = self.ISO_TIME_RE.match(line)
+            if match:
+                return datetime.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S').timestamp()
+            
+            match = self.SYSLOG_TIME_RE.match(line)
+            if match:
+                now = datetime.now()
+                seen = datetime.strptime(f"{now.year} {match.group(1)}", '%Y %b %d %H:%M:%S')
+                if seen > now + timedelta(days=1):
+                    seen = seen.replace(year=now.year - 1)
+                return seen.timestamp()
+        except ValueError:
+            pass
+        return time.time()
+
+class ConnectionTable:
+    """Aggregated view of the TCP socket table read straight from /proc/net/tcp{,6}"""
+    
+    TCP_STATES = {
+        '01': 'ESTABLISHED', '02': 'SYN_SENT', '03': 'SYN_RECV', '04': 'FIN_WAIT1',
+        '05': 'FIN_WAIT2', '06': 'TIME_WAIT', '07': 'CLOSE', '08': 'CLOSE_WAIT',
+        '09': 'LAST_ACK', '0A': 'LISTEN', '0B': 'CLOSING'
+    }
+    IPV4_MAPPED_PREFIX = '0000000000000000FFFF0000'
+    
+    def __init__(self, proc_root='/proc/net', max_ip_cache=4096):
+        self.proc_root = proc_root
+        self.max_ip_cache = max_ip_cache
+        self.ip_cache = {}
+    
+    @staticmethod
+    def available(proc_root='/proc/net'):
+        return os.path.exists(os.path.join(proc_root, 'tcp'))
+    
+    def summarize(self, top=20):
+        """Counts by state, listening ports, top remote IPs and per-port connection counts"""
+        states = {}
+        listening = set()
+        established = []
+        total = 0
+        
+        for name in ('tcp', 'tcp6'):
+            try:
+                with open(os.path.join(self.proc_root, name), 'r') as f:
+                    f.readline()
+                    for line in f:
+                        # sl local_address rem_address st ...
+                        fields = line.split(None, 4)
+                        if len(fields) < 4:
+                            continue
+                        total += 1
+                        st = fields[3]
+                        states[st] = states.get(st, 0) + 1
+                        local = fields[1]
+                        if st == '0A':
+                            listening.add(int(local[-4:], 16))
+                        elif st != '06':
+                            # TIME_WAIT не держит клиента - в топ IP и счётчики портов не попадает
+                            established.append((local, fields[2]))
+            except OSError:
+                continue
+        
+        per_port = {}
+        remote_ips = {}
+        for local, remote in established:
+            port = int(local[-4:], 16)
+            if port in listening:
+                per_port[port] = per_port.get(port, 0) + 1
+            ip = self.decode_ip(remote[:-5])
+            remote_ips[ip] = remote_ips.get(ip, 0) + 1
+        
+        return {
+            'total': total,
+            'by_state': {self.TCP_STATES.get(st, st): count for st, count in states.items()},
+            'listening_ports': sorted(listening),
+            'per_port': [
+                {'port': port, 'connections': count}
+                for port, count in heapq.nlargest(top, per_port.items(), key=lambda item: item[1])
+            ],
+            'top_remote_ips': [
+                {'ip': ip, 'connections': count}
+                for ip, count in heapq.nlargest(top, remote_ips.items(), key=lambda item: item[1])
+            ],
+            'udp_sockets': self.count_lines('udp') + self.count_lines('udp6')
+        }
+    
+    def count_lines(self, name):
+        try:
+            with open(os.path.join(self.proc_root, name), 'rb') as f:
+                return max(sum(1 for _ in f) - 1, 0)
+        except OSError:
+            return 0
+    
+    def decode_ip(self, hex_ip):
+        """Kernel hex address (host byte order per 32-bit word) -> textual IP"""
+        ip = self.ip_cache.get(hex_ip)
+        if ip is not None:
+            return ip
+        
+        try:
+            if len(hex_ip) == 8:
+                ip = socket.inet_ntop(socket.AF_INET, bytes.fromhex(hex_ip)[::-1])
+            elif hex_ip.startswith(self.IPV4_MAPPED_PREFIX):
+                # ::ffff:a.b.c.d - считаем как обычный IPv4
+                ip = socket.inet_ntop(socket.AF_INET, bytes.fromhex(hex_ip[24:])[::-1])
+            else:
+                raw = bytes.fromhex(hex_ip)
+                raw = b''.join(raw[i:i + 4][::-1] for i in range(0, 16, 4))
+                ip = socket.inet_ntop(socket.AF_INET6, raw)
+        except ValueError:
+            ip = hex_ip
+        
+        if len(self.ip_cache) >= self.max_ip_cache:
+            self.ip_cache.clear()
+        self.ip_cache[hex_ip] = ip
+        return ip
+
+class ProcReader:
+    """Allocation-light reader of hot Linux metrics straight from /proc"""
+    
+    MEMINFO_KEYS = (b'MemTotal', b'MemFree', b'MemAvailable', b'Buffers', b'Cached',
+                    b'SReclaimable', b'SwapTotal', b'SwapFree')
+    SECTOR_SIZE = 512
+    
+    def __init__(self, proc_root='/proc', buffer_size=64 * 1024):
+        self.proc_root = proc_root
+        self.buffer = bytearray(buffer_size)
+        # Сэмплер и heartbeat читают из разных потоков: общий буфер, файлы и prev_cpu - под одной блокировкой
+        self.lock = threading.RLock()
+        self.files = {}
+        self.meminfo_index = None
+        self.disks = None
+        # Первый снимок CPU - чтобы первый же тик дал проценты без sleep
+        self.prev_cpu = self.read_cpu_times()
+    
+    @staticmethod
+    def available(proc_root='/proc'):
+        return all(os.path.exists(os.path.join(proc_root, name))
+                   for name in ('stat', 'meminfo', 'net/dev', 'diskstats', 'loadavg'))
+    
+    def close(self):
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+    
+    def read(self, name):
+        """Re-read a /proc file into the shared buffer without reopening it"""
+        with self.lock:
+            return self._read(name)
+    
+    def _read(self, name):
+        f = self.files.get(name)
+        if f is None:
+            f = self.files[name] = open(os.path.join(self.proc_root, name), 'rb', buffering=0)
+        f.seek(0)
+        size = 0
+        while True:
+            # memoryview отпускаем до resize: bytearray с живыми экспортами расширить нельзя
+            with memoryview(self.buffer) as view, view[size:] as tail:
+                n = f.readinto(tail)
+            if not n:
+                break
+            size += n
+            if size == len(self.buffer):
+                # Файл не влез - удваиваем буфер и дочитываем
+                self.buffer.extend(bytes(len(self.buffer)))
+        return bytes(self.buffer[:size])
+    
+    def read_cpu_times(self):
+        """[(busy, total)] for the aggregate line followed by each core"""
+        times = []
+        for line in self.read('stat').split(b'\n'):
+            if not line.startswith(b'cpu'):
+                break
+            # user nice system idle iowait irq softirq steal (guest уже учтён в user)
+            values = [int(x) for x in line.split()[1:9]]
+            idle = values[3] + values[4]
+            total = sum(values)
+            times.append((total - idle, total))
+        return times
+    
+    def cpu_percent(self):
+        """(overall, per_core) usage since the previous call"""
+        current = self.read_cpu_times()
+        previous = self.prev_cpu or current
+        self.prev_cpu = current
+        
+        usage = []
+        for (busy, total), (prev_busy, prev_total) in zip(current, previous):
+            delta = total - prev_total
+            usage.append(round((busy - prev_busy) * 100.0 / delta, 1) if delta > 0 else 0.0)
+        if not usage:
+            return 0.0, []
+        return usage[0], usage[1:]
+    
+    def memory(self):
+        """Memory and swap in bytes, same semantics as psutil on Linux"""
+        lines = self.read('meminfo').split(b'\n')
+        if self.meminfo_index is None:
+            # Позиции нужных строк в meminfo не меняются - ищем их один раз
+            self.meminfo_index = {}
+            for i, line in enumerate(lines):
+                key = line.split(b':', 1)[0]
+                if key in self.MEMINFO_KEYS:
+                    self.meminfo_index[key] = i
+        
+        values = {}
+        for key, i in self.meminfo_index.items():
+            values[key] = int(lines[i].split()[1]) * 1024
+        
+        total = values.get(b'MemTotal', 0)
+        free = values.get(b'MemFree', 0)
+        buffers = values.get(b'Buffers', 0)
+        cached = values.get(b'Cached', 0) + values.get(b'SReclaimable', 0)
+        available = values.get(b'MemAvailable', free + buffers + cached)
+        used = total - available
+        
+        swap_total = values.get(b'SwapTotal', 0)
+        swap_free = values.get(b'SwapFree', 0)
+        swap_used = swap_total - swap_free
+        
+        return {
+            'total': total,
+            'available': available,
+            'used': used,
+            'percent': round(used * 100.0 / total, 1) if total else 0.0,
+            'cached': cached,
+            'buffers': buffers
+        }, {
+            'total': swap_total,
+            'used': swap_used,
+            'free': swap_free,
+            'percent': round(swap_used * 100.0 / swap_total, 1) if swap_total else 0.0
+        }
+    
+    def net_io(self):
+        """Per-interface counters from /proc/net/dev"""
+        interfaces = {}
+        for line in self.read('net/dev').split(b'\n')[2:]:
+            name, sep, data = line.partition(b':')
+            if not sep:
+                continue
+            fields = data.split()
+            interfaces[name.strip().decode()] = {
+                'bytes_sent': int(fields[8]),
+                'bytes_recv': int(fields[0]),
+                'packets_sent': int(fields[9]),
+                'packets_recv': int(fields[1]),
+                'errin': int(fields[2]),
+                'errout': int(fields[10]),
+                'dropin': int(fields[3]),
+                'dropout': int(fields[11])
+            }
+        return interfaces
+    
+    def disk_io(self):
+        """Totals over whole disks (partitions excluded) from /proc/diskstats"""
+        if self.disks is None:
+            try:
+                self.disks = set(os.listdir('/sys/block'))
+            except OSError:
+                self.disks = set()
+        
+        read_count = write_count = read_sectors = write_sectors = 0
+        for line in self.read('diskstats').split(b'\n'):
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            if self.disks and fields[2].decode() not in self.disks:
+                continue
+            read_count += int(fields[3])
+            read_sectors += int(fields[5])
+            write_count += int(fields[7])
+            write_sectors += int(fields[9])
+        
+        return {
+            'read_count': read_count,
+            'write_count': write_count,
+            'read_bytes': read_sectors * self.SECTOR_SIZE,
+            'write_bytes': write_sectors * self.SECTOR_SIZE
+        }
+    
+    def loadavg(self):
+        fields = self.read('loadavg').split()
+        return [float(fields[0]), float(fields[1]), float(fields[2])]
+    
+    def collect(self):
+        """Fast-tier metrics in the same shape as collect_psutil_metrics()"""
+        with self.lock:
+            cpu_usage, cpu_per_core = self.cpu_percent()
+            memory, swap = self.memory()
+            return {
+                'cpu_usage': cpu_usage,
+                'cpu_per_core': cpu_per_core,
+                'memory': memory,
+                'swap': swap,
+                'network_interfaces': self.net_io(),
+                'disk_io': self.disk_io(),
+                'load_avg': self.loadavg()
+            }
+
+def collect_psutil_metrics():
+    """Fast-tier metrics via psutil (non-Linux fallback)"""
+    cpu_per_core = [round(x, 1) for x in psutil.cpu_percent(interval=None, percpu=True)]
+    memory = psutil.virtual_memory()
+    swap = psutil.swap_memory()
+    
+    network_interfaces = {}
+    for interface, stats in psutil.net_io_counters(pernic=True).items():
+        network_interfaces[interface] = {
+            'bytes_sent': stats.bytes_sent,
+            'bytes_recv': stats.bytes_recv,
+            'packets_sent': stats.packets_sent,
+            'packets_recv': stats.packets_recv,
+            'errin': stats.errin,
+            'errout': stats.errout,
+            'dropin': stats.dropin,
+            'dropout': stats.dropout
+        }
+    
+    disk_io = psutil.disk_io_counters()
+    
+    try:
+        load_avg = list(os.getloadavg())
+    except (OSError, AttributeError):
+        load_avg = [0, 0, 0]
+    
+    return {
+        'cpu_usage': round(sum(cpu_per_core) / len(cpu_per_core), 1) if cpu_per_core else 0.0,
+        'cpu_per_core': cpu_per_core,
+        'memory': {
+            'total': memory.total,
+            'available': memory.available,
+            'used': memory.used,
+            'percent': round(memory.percent, 1),
+            'cached': getattr(memory, 'cached', 0),
+            'buffers': getattr(memory, 'buffers', 0)
+        },
+        'swap': {
+            'total': swap.total,
+            'used': swap.used,
+            'free': swap.free,
+            'percent': round(swap.percent, 1)
+        },
+        'network_interfaces': network_interfaces,
+        'disk_io': {
+            'read_count': disk_io.read_count if disk_io else 0,
+            'write_count': disk_io.write_count if disk_io else 0,
+            'read_bytes': disk_io.read_bytes if disk_io else 0,
+            'write_bytes': disk_io.write_bytes if disk_io else 0
+        },
+        'load_avg': load_avg
+    }
+
+def run_collector_benchmark(iterations=1000):
+    """Print per-tick collection cost of the /proc reader vs psutil"""
+    results = {}
+    collectors = [('psutil', collect_psutil_metrics)]
+    if ProcReader.available():
+        collectors.append(('proc', ProcReader().collect))
+    
+    for name, collect in collectors:
+        collect()
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            collect()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        results[name] = elapsed / iterations
+        print(f"{name:>6}: {elapsed / iterations * 1e6:9.1f} us/tick wall, {cpu / iterations * 1e6:9.1f} us/tick cpu")
+    
+    if 'proc' in results and results['proc'] > 0:
+        print(f"speedup: {results['psutil'] / results['proc']:.1f}x")
+    
+    try:
+        import resource
+        print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    except ImportError:
+        pass
+    return results
+
+class MetricSampler:
+    """Samples fast metrics every second into a ring buffer and summarizes them per heartbeat"""
+    
+    FIELDS = ('cpu', 'memory', 'load1', 'net_rx_bps', 'net_tx_bps', 'disk_read_bps', 'disk_write_bps')
+    
+    def __init__(self, collect, logger, interval=1.0, capacity=600):
+        self.collect = collect
+        self.logger = logger
+        self.interval = interval
+        self.samples = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.latest_metrics = None
+        self.last_totals = None
+        self.last_summary = time.time()
+        self.last_duration = 0.0
+        self.running = False
+        self.thread = None
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.running = False
+    
+    def latest(self):
+        """Most recent full fast-tier metrics (None before the first sample)"""
+        with self.lock:
+            return self.latest_metrics
+    
+    def sample(self):
+        started = time.perf_counter()
+        metrics = self.collect()
+        self.last_duration = time.perf_counter() - started
+        now = time.time()
+        
+        totals = (
+            now,
+            sum(iface['bytes_recv'] for name, iface in metrics['network_interfaces'].items() if name != 'lo'),
+            sum(iface['bytes_sent'] for name, iface in metrics['network_interfaces'].items() if name != 'lo'),
+            metrics['disk_io']['read_bytes'],
+            metrics['disk_io']['write_bytes']
+        )
+        previous, self.last_totals = self.last_totals, totals
+        
+        with self.lock:
+            self.latest_metrics = metrics
+            # Первая выборка нужна только как база для скоростей
+            if not previous or now <= previous[0]:
+                return
+            elapsed = now - previous[0]
+            # Счётчики могли сброситься (переподключение интерфейса) - отрицательные дельты отбрасываем
+            rates = tuple(max(cur - prev, 0) / elapsed for cur, prev in zip(totals[1:], previous[1:]))
+            self.samples.append((now, metrics['cpu_usage'], metrics['memory']['percent'],
+                                 metrics['load_avg'][0]) + rates)
+    
+    def summarize(self):
+        """min/max/avg/p95 of each metric over the samples taken since the previous call"""
+        with self.lock:
+            since = self.last_summary
+            self.last_summary = time.time()
+            window = [sample for sample in self.samples if sample[0] > since]
+        
+        if not window:
+            return None
+        
+        summary = {
+            'samples': len(window),
+            'interval': self.interval,
+            'start': datetime.fromtimestamp(window[0][0]).isoformat(),
+            'end': datetime.fromtimestamp(window[-1][0]).isoformat()
+        }
+        for index, field in enumerate(self.FIELDS, start=1):
+            values = sorted(sample[index] for sample in window)
+            summary[field] = {
+                'min': round(values[0], 2),
+                'max': round(values[-1], 2),
+                'avg': round(sum(values) / len(values), 2),
+                'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 2)
+            }
+        return summary
+    
+    def _loop(self):
+        next_tick = time.monotonic()
+        while self.running:
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.debug(f"Metric sampling error: {e}")
+            
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+class HostIdentity:
+    """Cached hostname/IP/OS info, refreshed on netlink link/address events or a slow timer"""
+    
+    RTMGRP_LINK = 0x1
+    RTMGRP_IPV4_IFADDR = 0x10
+    RTMGRP_IPV6_IFADDR = 0x100
+    
+    def __init__(self, refresh_interval=600, probe_address=('8.8.8.8', 80)):
+        self.refresh_interval = refresh_interval
+        self.probe_address = probe_address
+        self.identity = None
+        self.refreshed_at = 0
+        self.acked = None
+        self.netlink = self._open_netlink()
+    
+    def _open_netlink(self):
+        """Subscribe to kernel link/address notifications (Linux only)"""
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, self.RTMGRP_LINK | self.RTMGRP_IPV4_IFADDR | self.RTMGRP_IPV6_IFADDR))
+            sock.setblocking(False)
+            return sock
+        except (AttributeError, OSError):
+            return None
+    
+    def _netlink_changed(self):
+        """Drain pending netlink messages; True if any arrived since last check"""
+        changed = False
+        while True:
+            try:
+                if not self.netlink.recv(65536):
+                    break
+                changed = True
+            except BlockingIOError:
+                break
+            except OSError:
+                # Переполнение буфера (ENOBUFS) - события были, просто часть потеряна
+                changed = True
+                break
+        return changed
+    
+    def get(self):
+        """Current identity, re-detected only when interfaces changed or the timer expired"""
+        changed = self.netlink is not None and self._netlink_changed()
+        if self.identity is None or changed or time.monotonic() - self.refreshed_at > self.refresh_interval:
+            self.refresh()
+        return self.identity
+    
+    def refresh(self):
+        uname = platform.uname()
+        self.identity = {
+            'hostname': socket.gethostname(),
+            'ip_address': self.detect_ip(),
+            'os_info': f"{uname.system} {uname.release}",
+            'cpu_cores': psutil.cpu_count(),
+            'cpu_cores_physical': psutil.cpu_count(logical=False),
+            'total_memory': psutil.virtual_memory().total,
+            'system_info': {
+                'platform': uname.system,
+                'platform_release': uname.release,
+                'platform_version': uname.version,
+                'architecture': uname.machine,
+                'processor': platform.processor()
+            }
+        }
+        self.refreshed_at = time.monotonic()
+    
+    def detect_ip(self):
+        """Source address of the default route (no packets are sent for UDP connect)"""
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                s.connect(self.probe_address)
+                return s.getsockname()[0]
+            finally:
+                s.close()
+        except OSError:
+            return "127.0.0.1"
+    
+    def pending(self):
+        """Identity if it differs from what the panel has acknowledged, else None"""
+        identity = self.get()
+        return identity if identity != self.acked else None
+    
+    def acknowledge(self, identity):
+        self.acked = identity
+    
+    def reset(self):
+        """Panel lost our identity - send it again with the next heartbeat"""
+        self.acked = None
+
+class HttpTransport:
+    """Push transport: keep-alive HTTP session to the panel with optional gzip bodies"""
+    
+    def __init__(self, base_url, compression=True, gzip_min_size=1024, pool_maxsize=4):
+        self.base_url = base_url.rstrip('/')
+        self.compression = compression
+        self.gzip_min_size = gzip_min_size
+        self.pool_maxsize = pool_maxsize
+        self.last_send_ms = None
+        self.bytes_sent = 0
+        self.session = None
+    
+    def get_session(self):
+        """Create the keep-alive session on first send"""
+        if self.session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({
+                'Content-Type': 'application/json',
+                'Connection': 'keep-alive',
+                'User-Agent': 'Xpanel-Agent/4.0.0'
+            })
+            self.session = session
+        return self.session
+    
+    def post(self, path, payload, timeout=10):
+        """POST JSON payload, gzip-compressing large bodies"""
+        body = json.dumps(payload, default=str).encode('utf-8')
+        headers = {}
+        
+        if self.compression and len(body) >= self.gzip_min_size:
+            body = gzip.compress(body, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+        
+        started = time.perf_counter()
+        response = self.get_session().post(self.base_url + path, data=body, headers=headers, timeout=timeout)
+        self.last_send_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.bytes_sent += len(body)
+        return response
 
 class ProductionAgent:
-    def __init__(self, panel_address="localhost", panel_port=5000, server_id=None, config_file=None):
+    # Коллекторы внутри get_system_stats, включаемые профилем нагрузки (panel -> update_config).
+    # Коллекторы heartbeat добавляются через register_collector со своим набором профилей
+    PAYLOAD_PROFILES = {
+        'minimal': ('disk',),
+        'standard': ('disk', 'per_core', 'processes', 'temperatures', 'connections'),
+        'full': ('disk', 'per_core', 'processes', 'temperatures', 'connections')
+    }
+    COLLECTORS = PAYLOAD_PROFILES['full']
+    REMOTE_CONFIG_KEYS = ('heartbeat_interval', 'sample_interval', 'payload_profile', 'collectors',
+                          'collector_intervals', 'compression', 'gzip_min_size', 'alert_thresholds')
+    HEARTBEAT_INTERVAL_RANGE = (5, 3600)
+    MIN_SAMPLE_INTERVAL = 0.5
+    
+    def __init__(self, panel_address=DEFAULT_PANEL_ADDRESS, panel_port=DEFAULT_PANEL_PORT, server_id=None,
+                 config_file=None, transport=None):
+        self.init_started = time.perf_counter()
         self.panel_address = panel_address
         self.panel_port = panel_port
         self.server_id = server_id or self.generate_server_id()
@@ -39,10 +1190,10 @@ class ProductionAgent:
         self.heartbeat_interval = 30  # seconds
         self.config_file = config_file or '/opt/xpanel-agent/config.json'
         self.db_file = '/opt/xpanel-agent/agent.db'
-        
-        # Создаем директории если их нет
-        os.makedirs('/opt/xpanel-agent/logs', exist_ok=True)
-        
+        # Локальная БД открывается при первой записи (буфер офлайн-выборок и т.п.), не при старте
+        self.db_ready = False
+        self.db_lock = threading.Lock()
+                
         # Load configuration
         self.config = self.load_config()
         
@@ -51,9 +1202,6 @@ class ProductionAgent:
         self.panel_port = self.config.get('panel_port', self.panel_port)
         self.heartbeat_interval = self.config.get('heartbeat_interval', self.heartbeat_interval)
         
-        # Initialize database
-        self.init_database()
-        
         # Setup logging
         self.setup_logging()
         
@@ -70,11 +1218,113 @@ class ProductionAgent:
             'load': 5.0
         })
         
+        # Offline buffer (store-and-forward)
+        self.offline_max_samples = self.config.get('offline_max_samples', 5000)
+        self.offline_batch_size = self.config.get('offline_batch_size', 50)
+        self.offline_batch_interval = self.config.get('offline_batch_interval', 2)
+        self.replay_thread = None
+        self.replay_lock = threading.Lock()
+        
+        # Incremental system log follower
+        self.system_log_file = self.config.get('system_log_file') or next(
+            (path for path in ('/var/log/syslog', '/var/log/messages') if os.path.exists(path)),
+            '/var/log/syslog'
+        )
+        self.log_followers = {}
+        
+        # SSH auth failures (auth.log или journald)
+        self.auth_log_file = self.config.get('auth_log_file') or next(
+            (path for path in ('/var/log/auth.log', '/var/log/secure') if os.path.exists(path)),
+            None
+        )
+        self.journal_cursor = None
+        self.auth_tracker = AuthFailureTracker(window=self.config.get('auth_failure_window', 86400))
+        
+        # Сводка таблицы соединений вместо полного списка в каждом heartbeat
+        self.connection_table = ConnectionTable() if ConnectionTable.available() else None
+        self.connection_summary_top = self.config.get('connection_summary_top', 20)
+        
+        # Горячие метрики читаем из /proc напрямую, psutil - только как fallback
+        self.proc_reader = None
+        if ProcReader.available():
+            try:
+                self.proc_reader = ProcReader()
+            except (OSError, ValueError, IndexError, BufferError) as e:
+                self.logger.warning(f"/proc reader unavailable, using psutil: {e}")
+        if not self.proc_reader:
+            psutil.cpu_percent(interval=None, percpu=True)
+        
+        # Посекундная выборка между heartbeat - в панель уходят min/max/avg/p95 за интервал
+        self.sampler = MetricSampler(
+            self.collect_fast_metrics,
+            self.logger,
+            interval=self.config.get('sample_interval', 1.0),
+            capacity=self.config.get('sample_buffer_size', 600)
+        )
+        
+        # Кэш hostname/IP/ОС - обновляется по событиям netlink или раз в identity_refresh_interval
+        self.host_identity = HostIdentity(refresh_interval=self.config.get('identity_refresh_interval', 600))
+        
+        # HTTP transport (keep-alive session, backoff)
+        self.transport = transport or HttpTransport(
+            f"http://{self.panel_address}:{self.panel_port}",
+            gzip_min_size=self.config.get('gzip_min_size', 1024)
+        )
+        self.max_backoff = self.config.get('max_backoff', 300)
+        self.send_failures = 0
+        self.next_send_attempt = 0
+        
         # WebSocket connection
-        self.ws = None
-        self.ws_connected = False
+        self.sio = None
         self.ws_thread = None
         
+        # Request executor (light queries never wait behind long commands)
+        self.request_timeout = self.config.get('request_timeout', 30)
+        self.executor = AgentExecutor(
+            self.logger,
+            workers=self.config.get('worker_threads', 4),
+            max_queue=self.config.get('max_queued_requests', 100)
+        )
+        
+        # Streaming commands (request_id -> Popen)
+        self.active_commands = {}
+        self.active_commands_lock = threading.Lock()
+        self.stream_chunk_size = self.config.get('stream_chunk_size', 65536)
+        self.stream_max_output = self.config.get('stream_max_output', 10 * 1024 * 1024)
+        
+        # Самодиагностика агента (блок agent_health в heartbeat)
+        self.started_at = time.time()
+        self.agent_process = psutil.Process()
+        self.agent_process.cpu_percent(interval=None)
+        self.collector_timings = {}
+        self.startup_ms = None
+        self.rss_budget = self.config.get('rss_budget_mb', 64) * 1024 * 1024
+        self.rss_budget_warned = False
+        self.registered = False
+        self.last_heartbeat = None
+        self.health_counters = {
+            'heartbeats_sent': 0,
+            'heartbeats_failed': 0,
+            'samples_buffered': 0,
+            'samples_replayed': 0,
+            'replay_failures': 0
+        }
+        
+        # Профиль сбора, который панель может менять на лету (версионируется)
+        self.config_version = self.config.get('config_version', 0)
+        self.enabled_collectors = set()
+        self.collector_intervals = {}
+        self.collector_cache = {}
+        
+        # Коллекторы heartbeat (name -> key, функция, профили)
+        self.heartbeat_collectors = {}
+        self.register_collector('auth_failures', self.get_auth_failures, default=[])
+        self.register_collector('system_logs', self.get_new_log_lines, default=[], reuse=False)
+        self.register_collector('aggregates', self.sampler.summarize, reuse=False,
+                                profiles=('minimal', 'standard', 'full'))
+        self.register_collector('services', self.get_system_services, default=[], profiles=('full',))
+        self.apply_collection_settings(self.config)
+        
         self.logger.info(f"Production Agent v4.0.0 initialized (ID: {self.server_id})")
         
     def generate_server_id(self):
@@ -99,8 +1349,8 @@ class ProductionAgent:
         
         # Default configuration
         return {
-            'panel_address': 'localhost',
-            'panel_port': 5000,
+            'panel_address': DEFAULT_PANEL_ADDRESS,
+            'panel_port': DEFAULT_PANEL_PORT,
             'heartbeat_interval': 30,
             'alert_thresholds': {
                 'cpu': 80,
@@ -120,6 +1370,146 @@ class ProductionAgent:
         except Exception as e:
             self.logger.error(f"Failed to save config: {e}")
     
+    def register_collector(self, name, collect, key=None, default=None, reuse=True, profiles=('standard', 'full')):
+        """Add heartbeat collector; its result is sent under key when enabled by payload profile"""
+        self.heartbeat_collectors[name] = {
+            'key': key or name,
+            'collect': collect,
+            'default': default,
+            'reuse': reuse,
+            'profiles': tuple(profiles)
+        }
+    
+    def apply_collection_settings(self, config):
+        """Apply sampling/payload settings from config without restarting"""
+        profile = config.get('payload_profile', 'standard')
+        if profile not in self.PAYLOAD_PROFILES:
+            profile = 'standard'
+        
+        enabled = set(self.PAYLOAD_PROFILES[profile])
+        enabled.update(name for name, collector in self.heartbeat_collectors.items() if profile in collector['profiles'])
+        known = set(self.COLLECTORS) | set(self.heartbeat_collectors)
+        for name, on in (config.get('collectors') or {}).items():
+            if name not in known:
+                continue
+            if on:
+                enabled.add(name)
+            else:
+                enabled.discard(name)
+        
+        # Сначала приводим и ограничиваем все значения: ошибка типа (ValueError/TypeError)
+        # вылетает до присваивания, и агент остаётся на прежних настройках
+        collector_intervals = {
+            name: float(interval)
+            for name, interval in (config.get('collector_intervals') or {}).items()
+            if name in known
+        }
+        collector_intervals = {name: interval for name, interval in collector_intervals.items() if interval > 0}
+        gzip_min_size = max(int(config.get('gzip_min_size', self.transport.gzip_min_size)), 0)
+        low, high = self.HEARTBEAT_INTERVAL_RANGE
+        heartbeat_interval = min(max(float(config.get('heartbeat_interval', self.heartbeat_interval)), low), high)
+        sample_interval = max(float(config.get('sample_interval', self.sampler.interval)), self.MIN_SAMPLE_INTERVAL)
+        alert_thresholds = {name: float(value) for name, value in (config.get('alert_thresholds') or {}).items()}
+        numbers = [heartbeat_interval, sample_interval, *collector_intervals.values(), *alert_thresholds.values()]
+        if not all(math.isfinite(number) for number in numbers):
+            raise ValueError('Collection settings must be finite numbers')
+        
+        self.payload_profile = profile
+        self.enabled_collectors = enabled
+        self.collector_intervals = collector_intervals
+        self.collector_cache = {name: value for name, value in self.collector_cache.items() if name in enabled}
+        self.transport.compression = bool(config.get('compression', True))
+        self.transport.gzip_min_size = gzip_min_size
+        self.heartbeat_interval = heartbeat_interval
+        self.sampler.interval = sample_interval
+        self.alert_thresholds.update(alert_thresholds)
+    
+    def update_remote_config(self, settings, version):
+        """Apply versioned configuration pushed by the panel"""
+        try:
+            version = int(version)
+        except (TypeError, ValueError):
+            return {'success': False, 'error': 'Config version is required'}
+        
+        if version <= self.config_version:
+            return {'success': True, 'applied': False, 'version': self.config_version}
+        
+        settings = {key: value for key, value in (settings or {}).items() if key in self.REMOTE_CONFIG_KEYS}
+        if settings.get('payload_profile', 'standard') not in self.PAYLOAD_PROFILES:
+            return {'success': False, 'error': f"Unknown payload profile: {settings['payload_profile']}"}
+        
+        config = dict(self.config)
+        config.update(settings)
+        try:
+            self.apply_collection_settings(config)
+        except (TypeError, ValueError, AttributeError) as e:
+            # Настройки не тронуты, конфиг не сохраняем; версия не засчитана
+            self.logger.error(f"Failed to apply panel config v{version}: {e}")
+            return {'success': False, 'error': str(e), 'version': self.config_version}
+        
+        # Версию фиксируем только после успешного применения
+        config['config_version'] = version
+        self.config = config
+        self.config_version = version
+        self.save_config()
+                
+        self.logger.info(f"Applied panel config v{version}: profile={self.payload_profile}, "
+                         f"collectors={sorted(self.enabled_collectors)}")
+        return {'success': True, 'applied': True, 'version': version}
+    
+    def run_collector(self, name, collect, default=None, reuse=True):
+        """Run collector if enabled and due; between runs reuse its last value (or default)"""
+        if name not in self.enabled_collectors:
+            return default
+        
+        now = time.monotonic()
+        interval = self.collector_intervals.get(name)
+        cached = self.collector_cache.get(name)
+        if interval and cached and now - cached[0] < interval:
+            # Инкрементальные коллекторы (логи, выборки) повторно не отправляем
+            return cached[1] if reuse else default
+        
+        started = time.perf_counter()
+        value = collect()
+        self.collector_timings[name] = (time.perf_counter() - started) * 1000
+        self.collector_cache[name] = (now, value)
+        return value
+    
+    def get_agent_health(self):
+        """Agent's own resource usage, collector cost and transport counters"""
+        try:
+            with self.agent_process.oneshot():
+                cpu_percent = self.agent_process.cpu_percent(interval=None)
+                rss = self.agent_process.memory_info().rss
+                threads = self.agent_process.num_threads()
+        except psutil.Error:
+            cpu_percent, rss, threads = None, None, None
+        
+        over_budget = bool(rss and rss > self.rss_budget)
+        if over_budget and not self.rss_budget_warned:
+            self.logger.warning(f"Agent RSS {rss // (1024 * 1024)}MB exceeds budget "
+                                f"{self.rss_budget // (1024 * 1024)}MB")
+            self.rss_budget_warned = True
+        
+        return {
+            'cpu_percent': round(cpu_percent, 1) if cpu_percent is not None else None,
+            'rss': rss,
+            'rss_budget': self.rss_budget,
+            'over_rss_budget': over_budget,
+            'threads': threads,
+            'uptime': int(time.time() - self.started_at),
+            'startup_ms': self.startup_ms,
+            'registered': self.registered,
+            'collector_ms': {name: round(ms, 2) for name, ms in self.collector_timings.items()},
+            'sample_ms': round(self.sampler.last_duration * 1000, 2),
+            'last_send_ms': self.transport.last_send_ms,
+            'consecutive_send_failures': self.send_failures,
+            'counters': dict(self.health_counters, bytes_sent=self.transport.bytes_sent),
+            'offline_queue_depth': self.get_offline_queue_depth(),
+            'executor': self.executor.get_stats(),
+            'active_commands': len(self.active_commands)
+        }
+    
     def setup_logging(self):
         """Setup logging with rotation"""
         log_dir = '/opt/xpanel-agent/logs'
@@ -148,8 +1538,25 @@ class ProductionAgent:
         self.logger.addHandler(file_handler)
         self.logger.addHandler(console_handler)
     
+    def db_connect(self, create=False):
+        """Open local SQLite database; None if it does not exist yet and create is False"""
+        if not self.db_ready:
+            # До первой записи БД нет: чтения получают None, sqlite3 не импортируется
+            if not create and not os.path.exists(self.db_file):
+                return None
+            with self.db_lock:
+                if not self.db_ready:
+                    self.init_database()
+                if not self.db_ready:
+                    return None
+        
+        import sqlite3
+        return sqlite3.connect(self.db_file)
+    
     def init_database(self):
         """Initialize SQLite database for local data storage"""
+        import sqlite3
+        
         try:
             os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
             conn = sqlite3.connect(self.db_file)
@@ -191,63 +1598,50 @@ class ProductionAgent:
                 )
             ''')
             
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS log_offsets (
+                    path TEXT PRIMARY KEY,
+                    inode INTEGER,
+                    offset INTEGER
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS offline_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            ''')
+            
             conn.commit()
             conn.close()
+            self.db_ready = True
             
         except Exception as e:
-            print(f"Database initialization error: {e}")
+            self.logger.error(f"Database initialization error: {e}")
     
     def get_system_stats(self):
         """Collect comprehensive system statistics"""
         try:
-            # CPU usage and info
-            cpu_percent = psutil.cpu_percent(interval=1, percpu=True)
+            # Быстрый тир: CPU, память, сеть, диск I/O, load average (последняя посекундная выборка)
+            metrics = self.sampler.latest() if self.sampler.running else None
+            if metrics is None:
+                started = time.perf_counter()
+                metrics = self.collect_fast_metrics()
+                self.collector_timings['fast_metrics'] = (time.perf_counter() - started) * 1000
+            
+            # CPU info (число ядер берём из кэша идентичности хоста)
             cpu_freq = psutil.cpu_freq()
-            cpu_count_logical = psutil.cpu_count(logical=True)
-            cpu_count_physical = psutil.cpu_count(logical=False)
-            
-            # Memory usage
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
-            
-            # Disk usage for all mounted filesystems
-            disk_usage = {}
-            for partition in psutil.disk_partitions():
-                try:
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    disk_usage[partition.mountpoint] = {
-                        'device': partition.device,
-                        'fstype': partition.fstype,
-                        'total': usage.total,
-                        'used': usage.used,
-                        'free': usage.free,
-                        'percent': round((usage.used / usage.total) * 100, 1)
-                    }
-                except (PermissionError, OSError):
-                    continue
+            identity = self.host_identity.get()
             
-            # Network stats with interface details
-            network_interfaces = {}
-            for interface, stats in psutil.net_io_counters(pernic=True).items():
-                network_interfaces[interface] = {
-                    'bytes_sent': stats.bytes_sent,
-                    'bytes_recv': stats.bytes_recv,
-                    'packets_sent': stats.packets_sent,
-                    'packets_recv': stats.packets_recv,
-                    'errin': stats.errin,
-                    'errout': stats.errout,
-                    'dropin': stats.dropin,
-                    'dropout': stats.dropout
-                }
+            # Disk usage for all mounted filesystems
+            disk_usage = self.run_collector('disk', self.get_disk_usage, {})
             
-            # Network connections
-            connections = len(psutil.net_connections())
+            network_interfaces = metrics['network_interfaces']
             
-            # Load average
-            try:
-                load_avg = os.getloadavg()
-            except (OSError, AttributeError):
-                load_avg = [0, 0, 0]
+            # Network connections - агрегаты, полный список только по запросу
+            connection_summary = self.run_collector('connections', self.get_connection_summary)
             
             # Uptime
             boot_time = psutil.boot_time()
@@ -257,13 +1651,10 @@ class ProductionAgent:
             process_count = len(psutil.pids())
             
             # Top processes by CPU and memory
-            top_processes = self.get_top_processes()
+            top_processes = self.run_collector('processes', self.get_top_processes, {'cpu': [], 'memory': []})
             
             # System temperatures (if available)
-            temperatures = self.get_system_temperatures()
-            
-            # Disk I/O stats
-            disk_io = psutil.disk_io_counters()
+            temperatures = self.run_collector('temperatures', self.get_system_temperatures, {})
             
             # Calculate network speed if we have previous stats
             network_speed = self.calculate_network_speed(network_interfaces)
@@ -271,47 +1662,29 @@ class ProductionAgent:
             stats = {
                 'server_id': self.server_id,
                 'timestamp': datetime.now().isoformat(),
-                'hostname': socket.gethostname(),
-                'ip_address': self.get_local_ip(),
                 'agent_version': '4.0.0',
                 'cpu': {
-                    'usage': round(sum(cpu_percent) / len(cpu_percent), 1),
-                    'usage_per_core': [round(x, 1) for x in cpu_percent],
-                    'cores_logical': cpu_count_logical,
-                    'cores_physical': cpu_count_physical,
+                    'usage': metrics['cpu_usage'],
+                    'usage_per_core': metrics['cpu_per_core'] if 'per_core' in self.enabled_collectors else [],
+                    'cores_logical': identity['cpu_cores'],
+                    'cores_physical': identity['cpu_cores_physical'],
                     'frequency': {
                         'current': cpu_freq.current if cpu_freq else 0,
                         'min': cpu_freq.min if cpu_freq else 0,
                         'max': cpu_freq.max if cpu_freq else 0
                     } if cpu_freq else None
                 },
-                'memory': {
-                    'total': memory.total,
-                    'available': memory.available,
-                    'used': memory.used,
-                    'percent': round(memory.percent, 1),
-                    'cached': getattr(memory, 'cached', 0),
-                    'buffers': getattr(memory, 'buffers', 0)
-                },
-                'swap': {
-                    'total': swap.total,
-                    'used': swap.used,
-                    'free': swap.free,
-                    'percent': round(swap.percent, 1)
-                },
+                'memory': metrics['memory'],
+                'swap': metrics['swap'],
                 'disk': disk_usage,
-                'disk_io': {
-                    'read_count': disk_io.read_count if disk_io else 0,
-                    'write_count': disk_io.write_count if disk_io else 0,
-                    'read_bytes': disk_io.read_bytes if disk_io else 0,
-                    'write_bytes': disk_io.write_bytes if disk_io else 0
-                },
+                'disk_io': metrics['disk_io'],
                 'network': {
                     'interfaces': network_interfaces,
-                    'connections': connections,
+                    'connections': connection_summary['total'] if connection_summary else None,
+                    'connection_summary': connection_summary,
                     'speed': network_speed
                 },
-                'load_average': load_avg,
+                'load_average': metrics['load_avg'],
                 'uptime': int(uptime),
                 'processes': {
                     'total': process_count,
@@ -319,13 +1692,8 @@ class ProductionAgent:
                     'top_memory': top_processes['memory']
                 },
                 'temperatures': temperatures,
-                'system_info': {
-                    'platform': platform.system(),
-                    'platform_release': platform.release(),
-                    'platform_version': platform.version(),
-                    'architecture': platform.machine(),
-                    'processor': platform.processor()
-                }
+                'payload_profile': self.payload_profile,
+                'config_version': self.config_version
             }
             
             # Store performance data
@@ -340,6 +1708,35 @@ class ProductionAgent:
             self.logger.error(f"Error collecting system stats: {e}")
             return None
     
+    def get_disk_usage(self):
+        """Usage of all mounted filesystems"""
+        disk_usage = {}
+        for partition in psutil.disk_partitions():
+            try:
+                usage = psutil.disk_usage(partition.mountpoint)
+                disk_usage[partition.mountpoint] = {
+                    'device': partition.device,
+                    'fstype': partition.fstype,
+                    'total': usage.total,
+                    'used': usage.used,
+                    'free': usage.free,
+                    'percent': round((usage.used / usage.total) * 100, 1)
+                }
+            except (PermissionError, OSError):
+                continue
+        return disk_usage
+    
+    def collect_fast_metrics(self):
+        """CPU, memory, network, disk I/O and load average for one tick"""
+        if self.proc_reader:
+            try:
+                return self.proc_reader.collect()
+            except (OSError, ValueError, IndexError, BufferError) as e:
+                self.logger.warning(f"/proc reader failed, falling back to psutil: {e}")
+                self.proc_reader.close()
+                self.proc_reader = None
+        return collect_psutil_metrics()
+    
     def get_top_processes(self, limit=5):
         """Get top processes by CPU and memory usage"""
         try:
@@ -423,7 +1820,9 @@ class ProductionAgent:
     def store_performance_data(self, stats):
         """Store performance data in local database"""
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self.db_connect(create=True)
+            if conn is None:
+                return
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -501,7 +1900,7 @@ class ProductionAgent:
     def store_alerts(self, alerts):
         """Store alerts in database"""
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self.db_connect(create=True)
             cursor = conn.cursor()
             
             for alert in alerts:
@@ -521,11 +1920,8 @@ class ProductionAgent:
         except Exception as e:
             self.logger.error(f"Error storing alerts: {e}")
     
-    def execute_command(self, command, timeout=30):
-        """Execute shell command with security checks"""
-        start_time = time.time()
-        
-        # Security check - block dangerous commands
+    def is_command_blocked(self, command):
+        """Security check - block dangerous commands"""
         dangerous_patterns = [
             r'rm\s+-rf\s+/',
             r'dd\s+if=.*of=/dev/',
@@ -536,15 +1932,23 @@ class ProductionAgent:
         
         for pattern in dangerous_patterns:
             if re.search(pattern, command, re.IGNORECASE):
-                result = {
-                    'success': False,
-                    'error': 'Command blocked for security reasons',
-                    'exit_code': -1,
-                    'timestamp': datetime.now().isoformat(),
-                    'execution_time': 0
-                }
-                self.store_command_history(command, result)
-                return result
+                return True
+        return False
+    
+    def execute_command(self, command, timeout=30):
+        """Execute shell command with security checks"""
+        start_time = time.time()
+        
+        if self.is_command_blocked(command):
+            result = {
+                'success': False,
+                'error': 'Command blocked for security reasons',
+                'exit_code': -1,
+                'timestamp': datetime.now().isoformat(),
+                'execution_time': 0
+            }
+            self.store_command_history(command, result)
+            return result
         
         try:
             self.logger.info(f"Executing command: {command}")
@@ -595,10 +1999,191 @@ class ProductionAgent:
             self.store_command_history(command, result)
             return result
     
+    def execute_command_stream(self, command, request_id, timeout=600):
+        """Execute shell command streaming stdout/stderr chunks over WebSocket"""
+        start_time = time.time()
+        seq = 0
+        sent_bytes = 0
+        truncated = False
+        history_output = []
+        history_size = 0
+        
+        if self.is_command_blocked(command):
+            result = {
+                'success': False,
+                'error': 'Command blocked for security reasons',
+                'exit_code': -1,
+                'timestamp': datetime.now().isoformat(),
+                'execution_time': 0
+            }
+            self.store_command_history(command, result)
+            self.send_websocket_response('command_complete', dict(result, request_id=request_id, seq=seq))
+            return result
+        
+        try:
+            self.logger.info(f"Streaming command {request_id}: {command}")
+            
+            process = subprocess.Popen(
+                command,
+                shell=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True
+            )
+        except Exception as e:
+            result = {
+                'success': False,
+                'error': str(e),
+                'exit_code': -1,
+                'timestamp': datetime.now().isoformat(),
+                'execution_time': time.time() - start_time
+            }
+            self.store_command_history(command, result)
+            self.send_websocket_response('command_complete', dict(result, request_id=request_id, seq=seq))
+            return result
+        
+        with self.active_commands_lock:
+            self.active_commands[request_id] = process
+        
+        selector = selectors.DefaultSelector()
+        decoders = {}
+        for name, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+            selector.register(pipe, selectors.EVENT_READ, name)
+            decoders[name] = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        
+        timed_out = False
+        try:
+            while selector.get_map():
+                if time.time() - start_time > timeout:
+                    timed_out = True
+                    self.terminate_process(process)
+                    break
+                
+                for key, _ in selector.select(timeout=1):
+                    data = os.read(key.fileobj.fileno(), self.stream_chunk_size)
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        continue
+                    
+                    if sent_bytes + len(data) > self.stream_max_output:
+                        # Превышен лимит вывода - останавливаем процесс, память не растет
+                        data = data[:self.stream_max_output - sent_bytes]
+                        truncated = True
+                    
+                    sent_bytes += len(data)
+                    text = decoders[key.data].decode(data)
+                    if text:
+                        seq += 1
+                        self.send_websocket_response('command_output', {
+                            'request_id': request_id,
+                            'seq': seq,
+                            'stream': key.data,
+                            'data': text
+                        })
+                        
+                        # Для истории сохраняем только начало вывода
+                        if history_size < 65536:
+                            history_output.append(text)
+                            history_size += len(text)
+                    
+                    if truncated:
+                        self.terminate_process(process)
+                        break
+                
+                if truncated:
+                    break
+        finally:
+            selector.close()
+            process.stdout.close()
+            process.stderr.close()
+            with self.active_commands_lock:
+                self.active_commands.pop(request_id, None)
+        
+        # Хвост неполной UTF-8 последовательности на EOF отдаём как есть (с заменой)
+        for name, decoder in decoders.items():
+            text = decoder.decode(b'', final=True)
+            if text:
+                seq += 1
+                self.send_websocket_response('command_output', {
+                    'request_id': request_id,
+                    'seq': seq,
+                    'stream': name,
+                    'data': text
+                })
+                if history_size < 65536:
+                    history_output.append(text)
+                    history_size += len(text)
+                
+        # Пайпы закрыты, но процесс мог их отпустить (демонизировался) и продолжать работу
+        try:
+            exit_code = process.wait(timeout=max(timeout - (time.time() - start_time), 0))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            self.terminate_process(process)
+            exit_code = process.wait()
+        cancelled = getattr(process, 'cancelled', False)
+        
+        if timed_out:
+            error = f'Command timed out after {timeout} seconds'
+        elif cancelled:
+            error = 'Command cancelled'
+        elif truncated:
+            error = f'Output limit of {self.stream_max_output} bytes exceeded'
+        else:
+            error = ''
+        
+        result = {
+            'success': not (timed_out or cancelled or truncated),
+            'output': ''.join(history_output)[:65536],
+            'error': error,
+            'exit_code': exit_code,
+            'timestamp': datetime.now().isoformat(),
+            'execution_time': time.time() - start_time
+        }
+        self.store_command_history(command, result)
+        
+        seq += 1
+        self.send_websocket_response('command_complete', {
+            'request_id': request_id,
+            'seq': seq,
+            'exit_code': exit_code,
+            'error': error,
+            'cancelled': cancelled,
+            'truncated': truncated,
+            'timed_out': timed_out,
+            'output_bytes': sent_bytes,
+            'execution_time': result['execution_time']
+        })
+        return result
+    
+    def terminate_process(self, process):
+        """Terminate process group, escalating to SIGKILL"""
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    def cancel_command(self, request_id):
+        """Cancel running streaming command"""
+        with self.active_commands_lock:
+            process = self.active_commands.get(request_id)
+        
+        if not process:
+            return False
+        
+        process.cancelled = True
+        self.terminate_process(process)
+        return True
+    
     def store_command_history(self, command, result):
         """Store command execution history"""
         try:
-            conn = sqlite3.connect(self.db_file)
+            conn = self.db_connect(create=True)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -728,11 +2313,156 @@ class ProductionAgent:
         except Exception as e:
             return {'error': str(e)}
     
-    def get_network_connections(self):
-        """Get detailed network connections"""
+    def get_log_follower(self, path):
+        """Get follower for log file, resuming from the last committed offset"""
+        if path not in self.log_followers:
+            inode, offset = None, None
+            conn = self.db_connect()
+            if conn is not None:
+                cursor = conn.cursor()
+                cursor.execute('SELECT inode, offset FROM log_offsets WHERE path = ?', (path,))
+                row = cursor.fetchone()
+                conn.close()
+                if row:
+                    inode, offset = row
+            
+            self.log_followers[path] = LogFollower(path, inode, offset)
+        
+        return self.log_followers[path]
+    
+    def get_new_log_lines(self):
+        """Get system log lines appended since the last delivered heartbeat"""
+        try:
+            return {
+                'log_file': self.system_log_file,
+                'logs': self.get_log_follower(self.system_log_file).read_lines()
+            }
+        except Exception as e:
+            return {'error': str(e)}
+    
+    def commit_log_offsets(self):
+        """Persist log offsets once lines were sent or buffered"""
+        try:
+            conn = self.db_connect(create=True)
+            if conn is None:
+                return
+            cursor = conn.cursor()
+            
+            for path, follower in self.log_followers.items():
+                inode, offset = follower.commit()
+                if inode is None:
+                    continue
+                cursor.execute('''
+                    INSERT OR REPLACE INTO log_offsets (path, inode, offset)
+                    VALUES (?, ?, ?)
+                ''', (path, inode, offset))
+            
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            self.logger.error(f"Error saving log offsets: {e}")
+    
+    def get_auth_failures(self):
+        """Get compact per-IP summary of SSH authentication failures"""
+        try:
+            if self.auth_log_file:
+                lines = self.get_log_follower(self.auth_log_file).read_lines()
+            else:
+                lines = self.read_journal_auth_lines()
+            
+            self.auth_tracker.feed(lines)
+            return self.auth_tracker.summary()
+        except Exception as e:
+            self.logger.error(f"Error reading auth failures: {e}")
+            return []
+    
+    def read_journal_auth_lines(self):
+        """Read new sshd journal entries after the saved cursor"""
+        if not shutil.which('journalctl'):
+            return []
+        
+        cmd = ['journalctl', '--no-pager', '-q', '-o', 'short-iso', '--show-cursor', '_COMM=sshd']
+        if self.journal_cursor:
+            cmd += ['--after-cursor', self.journal_cursor]
+        else:
+            # Первый запуск - берем только позицию курсора
+            cmd += ['-n', '1']
+        
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+        lines = result.stdout.splitlines()
+        
+        if lines and lines[-1].startswith('-- cursor: '):
+            first_run = self.journal_cursor is None
+            self.journal_cursor = lines.pop()[len('-- cursor: '):]
+            if first_run:
+                return []
+        
+        return lines
+    
+    def get_connection_summary(self):
+        """Aggregated connection table: counts by state, listening ports, top remote IPs"""
+        if self.connection_table:
+            try:
+                return self.connection_table.summarize(top=self.connection_summary_top)
+            except Exception as e:
+                self.logger.debug(f"Error reading /proc/net/tcp: {e}")
+        
+        # Нет /proc (не Linux) - считаем те же агрегаты через psutil
+        states = {}
+        listening = set()
+        per_port = {}
+        remote_ips = {}
+        total = 0
+        udp_sockets = 0
+        try:
+            connections = psutil.net_connections(kind='inet')
+        except (psutil.AccessDenied, OSError) as e:
+            self.logger.debug(f"Error getting network connections: {e}")
+            connections = []
+        
+        for conn in connections:
+            if conn.type != socket.SOCK_STREAM:
+                udp_sockets += 1
+                continue
+            total += 1
+            states[conn.status] = states.get(conn.status, 0) + 1
+            if conn.status == psutil.CONN_LISTEN and conn.laddr:
+                listening.add(conn.laddr.port)
+        
+        for conn in connections:
+            if conn.type != socket.SOCK_STREAM or not conn.raddr or conn.status == psutil.CONN_TIME_WAIT:
+                continue
+            if conn.laddr and conn.laddr.port in listening:
+                per_port[conn.laddr.port] = per_port.get(conn.laddr.port, 0) + 1
+            remote_ips[conn.raddr.ip] = remote_ips.get(conn.raddr.ip, 0) + 1
+        
+        top = self.connection_summary_top
+        return {
+            'total': total,
+            'by_state': states,
+            'listening_ports': sorted(listening),
+            'per_port': [
+                {'port': port, 'connections': count}
+                for port, count in heapq.nlargest(top, per_port.items(), key=lambda item: item[1])
+            ],
+            'top_remote_ips': [
+                {'ip': ip, 'connections': count}
+                for ip, count in heapq.nlargest(top, remote_ips.items(), key=lambda item: item[1])
+            ],
+            'udp_sockets': udp_sockets
+        }
+    
+    def get_network_connections(self, status=None, port=None, limit=None):
+        """Get detailed network connections (on-demand, optionally filtered)"""
         try:
             connections = []
             for conn in psutil.net_connections(kind='inet'):
+                if limit and len(connections) >= limit:
+                    break
+                if status and conn.status != status:
+                    continue
+                if port and not ((conn.laddr and conn.laddr.port == port) or (conn.raddr and conn.raddr.port == port)):
+                    continue
                 try:
                     connections.append({
                         'fd': conn.fd,
@@ -777,89 +2507,250 @@ class ProductionAgent:
             return {'disks': []}
     
     def get_local_ip(self):
-        """Get local IP address"""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "127.0.0.1"
+        """Get local IP address (cached, re-detected on interface changes)"""
+        return self.host_identity.get()['ip_address']
     
     def send_heartbeat(self):
         """Send heartbeat with system stats to panel"""
         try:
+            started = time.perf_counter()
             stats = self.get_system_stats()
+            self.collector_timings['system_stats'] = (time.perf_counter() - started) * 1000
             if not stats:
                 return False
             
-            # Send via HTTP
+            # Добавляем дополнительные реальные данные
+            data = stats
+            data.update({
+                'timestamp': datetime.now().isoformat(),
+                'agent_version': '4.0.0',
+                'total_disk': sum(disk['total'] for disk in data['disk'].values()),
+                'network_connections': data['network'].pop('connection_summary', None) or {}
+            })
+            
+            # Идентичность хоста (hostname, IP, ОС) отправляем только при изменении
+            identity = self.host_identity.pending()
+            if identity:
+                data.update(identity)
+            
+            for name, collector in self.heartbeat_collectors.items():
+                if name in self.enabled_collectors:
+                    data[collector['key']] = self.run_collector(
+                        name, collector['collect'], collector['default'], reuse=collector['reuse']
+                    )
+            data['agent_health'] = self.get_agent_health()
+            self.last_heartbeat = data
+        
+        except Exception as e:
+            self.logger.error(f"Error sending heartbeat: {e}")
+            return False
+        
+        # Панель недавно была недоступна - не стучимся до окончания backoff
+        if time.time() < self.next_send_attempt:
+            self.buffer_offline_sample(data)
+            self.commit_log_offsets()
+            return False
+        
+        # Send via HTTP
+        try:
+            response = self.post_to_panel('/api/agent/heartbeat', data, timeout=10)
+            
+            if response.status_code == 200:
+                self.logger.info("Real heartbeat data sent successfully")
+                self.health_counters['heartbeats_sent'] += 1
+                if identity:
+                    self.host_identity.acknowledge(identity)
+                self.send_failures = 0
+                self.next_send_attempt = 0
+                self.commit_log_offsets()
+                self.schedule_offline_replay()
+                self.handle_heartbeat_reply(response)
+                return True
+            else:
+                self.logger.error(f"Failed to send heartbeat: {response.status_code}")
+                
+        except Exception as e:
+            self.logger.error(f"Error sending heartbeat: {e}")
+        
+        # Панель недоступна - сохраняем данные для повторной отправки
+        self.health_counters['heartbeats_failed'] += 1
+        self.register_send_failure()
+        self.buffer_offline_sample(data)
+        self.commit_log_offsets()
+        return False
+    
+    def handle_heartbeat_reply(self, response):
+        """Pick up newer panel config and identity requests from heartbeat response"""
+        try:
+            reply = response.json()
+        except ValueError:
+            return
+        if not isinstance(reply, dict):
+            return
+        
+        if reply.get('send_identity'):
+            self.host_identity.reset()
+        
+        pushed = reply.get('agent_config')
+        if pushed:
+            result = self.update_remote_config(pushed.get('settings'), pushed.get('version'))
+            if not result['success']:
+                self.logger.warning(f"Rejected panel config: {result['error']}")
+    
+    def post_to_panel(self, path, payload, timeout=10):
+        """POST JSON payload to panel through the push transport"""
+        return self.transport.post(path, payload, timeout=timeout)
+    
+    def register_send_failure(self):
+        """Schedule next send attempt using exponential backoff with full jitter"""
+        self.send_failures += 1
+        backoff = min(self.max_backoff, self.heartbeat_interval * (2 ** (self.send_failures - 1)))
+        self.next_send_attempt = time.time() + random.uniform(0, backoff)
+    
+    def get_phase_offset(self):
+        """Stable per-agent heartbeat phase offset derived from server_id"""
+        digest = hashlib.sha1(str(self.server_id).encode('utf-8')).hexdigest()
+        return (int(digest[:8], 16) % max(1, int(self.heartbeat_interval * 1000))) / 1000.0
+    
+    def buffer_offline_sample(self, data):
+        """Store unsent heartbeat sample in the bounded offline queue"""
+        try:
+            conn = self.db_connect(create=True)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO offline_queue (timestamp, payload)
+                VALUES (?, ?)
+            ''', (
+                data.get('timestamp', datetime.now().isoformat()),
+                json.dumps(data, default=str)
+            ))
+            
+            conn.commit()
+            
+            # Keep only the newest samples
+            cursor.execute('''
+                DELETE FROM offline_queue
+                WHERE id NOT IN (
+                    SELECT id FROM offline_queue
+                    ORDER BY id DESC LIMIT ?
+                )
+            ''', (self.offline_max_samples,))
+            
+            conn.commit()
+            conn.close()
+            
+            self.health_counters['samples_buffered'] += 1
+        
+        except Exception as e:
+            self.logger.error(f"Error buffering offline sample: {e}")
+    
+    def get_offline_queue_depth(self):
+        """Get number of samples waiting in the offline queue"""
+        try:
+            conn = self.db_connect()
+            if conn is None:
+                return 0
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM offline_queue')
+            depth = cursor.fetchone()[0]
+            conn.close()
+            return depth
+        except Exception as e:
+            self.logger.error(f"Error reading offline queue: {e}")
+            return 0
+    
+    def schedule_offline_replay(self):
+        """Start background replay of buffered samples if any are pending"""
+        with self.replay_lock:
+            if self.replay_thread and self.replay_thread.is_alive():
+                return
+            if not self.get_offline_queue_depth():
+                return
+            
+            self.replay_thread = threading.Thread(target=self.replay_offline_samples, daemon=True)
+            self.replay_thread.start()
+    
+    def replay_offline_samples(self):
+        """Replay buffered samples oldest-first in rate limited batches"""
+        # Случайная задержка, чтобы агенты не отправляли накопленное одновременно
+        time.sleep(random.uniform(0, self.heartbeat_interval))
+        
+        replayed = 0
+        
+        while self.running:
             try:
-                url = f"http://{self.panel_address}:{self.panel_port}/api/agent/heartbeat"
-                headers = {'Content-Type': 'application/json'}
+                conn = self.db_connect()
+                if conn is None:
+                    break
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, payload FROM offline_queue
+                    ORDER BY id ASC LIMIT ?
+                ''', (self.offline_batch_size,))
+                rows = cursor.fetchall()
+                conn.close()
                 
-                # Добавляем дополнительные реальные данные
-                data = stats
-                data.update({
-                    'timestamp': datetime.now().isoformat(),
-                    'agent_version': '4.0.0',
-                    'hostname': socket.gethostname(),
-                    'ip_address': self.get_local_ip(),
-                    'os_info': f"{platform.system()} {platform.release()}",
-                    'cpu_cores': psutil.cpu_count(),
-                    'total_memory': psutil.virtual_memory().total,
-                    'total_disk': sum([psutil.disk_usage(p.mountpoint).total for p in psutil.disk_partitions()]),
-                    'auth_failures': self.get_auth_failures(),
-                    'network_connections': self.get_network_connections(),
-                    'system_logs': self.get_system_logs()
-                })
+                if not rows:
+                    break
                 
-                response = requests.post(url, json=data, headers=headers, timeout=10)
+                response = self.post_to_panel('/api/agent/heartbeat/batch', {
+                    'server_id': self.server_id,
+                    'samples': [json.loads(payload) for _, payload in rows]
+                }, timeout=30)
                 
-                if response.status_code == 200:
-                    self.logger.info("Real heartbeat data sent successfully")
-                    return True
-                else:
-                    self.logger.error(f"Failed to send heartbeat: {response.status_code}")
-                    return False
-                    
-            except Exception as e:
-                self.logger.error(f"Error sending heartbeat: {e}")
-                return False
+                if response.status_code != 200:
+                    self.logger.warning(f"Offline replay rejected: {response.status_code}")
+                    self.health_counters['replay_failures'] += 1
+                    break
                 
-        except Exception as e:
-            self.logger.error(f"Error sending heartbeat: {e}")
-            return False
+                conn = self.db_connect()
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM offline_queue WHERE id <= ?', (rows[-1][0],))
+                conn.commit()
+                conn.close()
+                
+                replayed += len(rows)
+                self.health_counters['samples_replayed'] += len(rows)
+                time.sleep(self.offline_batch_interval)
+            
+            except Exception as e:
+                self.logger.error(f"Error replaying offline samples: {e}")
+                self.health_counters['replay_failures'] += 1
+                break
+        
+        if replayed:
+            self.logger.info(f"Replayed {replayed} buffered samples")
     
     def register_with_panel(self):
         """Register this agent with the control panel using real data"""
         try:
             # Собираем реальную информацию о сервере
+            identity = self.host_identity.get()
             server_info = {
                 'server_id': self.server_id,
-                'hostname': socket.gethostname(),
-                'ip_address': self.get_local_ip(),
+                'hostname': identity['hostname'],
+                'ip_address': identity['ip_address'],
                 'os_info': {
-                    'system': platform.system(),
-                    'release': platform.release(),
-                    'version': platform.version(),
-                    'machine': platform.machine(),
-                    'processor': platform.processor()
+                    'system': identity['system_info']['platform'],
+                    'release': identity['system_info']['platform_release'],
+                    'version': identity['system_info']['platform_version'],
+                    'machine': identity['system_info']['architecture'],
+                    'processor': identity['system_info']['processor']
                 },
                 'agent_version': '4.0.0',
+                'agent_token': self.config.get('agent_token'),
                 'timestamp': datetime.now().isoformat()
             }
             
-            url = f"http://{self.panel_address}:{self.panel_port}/api/agent/register"
-            response = requests.post(
-                url,
-                json=server_info,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
+            response = self.post_to_panel('/api/agent/register', server_info, timeout=10)
             
             if response.status_code == 200:
+                # Токен канала управления панель выдаёт один раз - храним в конфиге
+                token = (response.json() or {}).get('agent_token')
+                if token and token != self.config.get('agent_token'):
+                    self.config['agent_token'] = token
+                    self.save_config()
                 self.logger.info("Successfully registered with control panel")
                 return True
             else:
@@ -870,138 +2761,216 @@ class ProductionAgent:
             self.logger.error(f"Error registering with panel: {e}")
             return False
     
+    def registration_loop(self):
+        """Register with panel in background, retrying with backoff until it succeeds"""
+        attempt = 0
+        while self.running and not self.registered:
+            if self.register_with_panel():
+                self.registered = True
+                break
+            
+            attempt += 1
+            delay = random.uniform(1, min(self.max_backoff, 5 * (2 ** attempt)))
+            self.logger.warning(f"Failed to register with panel, retrying in {delay:.0f}s")
+            time.sleep(delay)
+    
     def setup_websocket(self):
-        """Setup WebSocket connection for real-time communication"""
-        try:
-            ws_url = f"ws://{self.panel_address}:{self.panel_port}/socket.io/?EIO=4&transport=websocket"
-            
-            def on_message(ws, message):
-                try:
-                    self.logger.debug(f"WebSocket message received: {message}")
-                    # Handle incoming commands from panel
-                    if message.startswith('42'):  # Socket.IO message format
-                        data = json.loads(message[2:])
-                        if len(data) >= 2:
-                            event = data[0]
-                            payload = data[1] if len(data) > 1 else {}
-                            self.handle_websocket_command(event, payload)
-                except Exception as e:
-                    self.logger.error(f"Error processing WebSocket message: {e}")
-            
-            def on_error(ws, error):
-                self.logger.error(f"WebSocket error: {error}")
-                self.ws_connected = False
-            
-            def on_close(ws, close_status_code, close_msg):
-                self.logger.warning("WebSocket connection closed")
-                self.ws_connected = False
-            
-            def on_open(ws):
-                self.logger.info("WebSocket connection established")
-                self.ws_connected = True
-                # Join server room for targeted updates
-                join_message = f'42["join_room", {{"room": "{self.server_id}"}}]'
-                ws.send(join_message)
-            
-            self.ws = websocket.WebSocketApp(
-                ws_url,
-                on_open=on_open,
-                on_message=on_message,
-                on_error=on_error,
-                on_close=on_close
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Error setting up WebSocket: {e}")
+        """Setup Socket.IO control channel for real-time communication"""
+        ws_url = f"ws://{self.panel_address}:{self.panel_port}/socket.io/?EIO=4&transport=websocket"
+        
+        # Отдельный namespace агентов: широковещательные события дашборда сюда не приходят,
+        # комната сервера назначается панелью после проверки токена
+        self.sio = SocketIOClient(
+            ws_url,
+            self.logger,
+            reconnect_max=self.config.get('ws_reconnect_max', 60),
+            namespace='/agent',
+            auth=lambda: {'server_id': self.server_id, 'token': self.config.get('agent_token')}
+        )
+        for event in self.AGENT_EVENTS:
+            self.sio.on(event, self.on_websocket_event)
+    
+    # Быстрые запросы обслуживаются отдельной полосой исполнителя
+    LIGHT_EVENTS = ('get_processes', 'get_network_connections', 'get_connection_summary', 'get_disk_info', 'get_logs',
+                    'update_config', 'get_agent_health')
+    # Управляющие запросы выполняются сразу в потоке WebSocket
+    INLINE_EVENTS = ('cancel_command', 'execute_command_stream')
+    # Запросы панели, которые агент обслуживает; остальные события отбрасываются без постановки в очередь
+    AGENT_EVENTS = LIGHT_EVENTS + INLINE_EVENTS + ('execute_command', 'manage_service', 'get_services')
+        
+    def on_websocket_event(self, event, payload, ack=None):
+        """Dispatch panel request to executor and answer via ack or legacy response event"""
+        if event not in self.AGENT_EVENTS:
+            return
+        if not isinstance(payload, dict):
+            payload = {}
+        
+        def respond(response, error=None):
+            if error:
+                response = "command_error", {'event': event, 'error': error}
+            if response is None:
+                return
+            
+            response_event, data = response
+            if payload.get('request_id'):
+                data['request_id'] = payload['request_id']
+            
+            if ack:
+                ack(data)
+            else:
+                self.send_websocket_response(response_event, data)
+        
+        if event in self.INLINE_EVENTS:
+            respond(self.handle_websocket_command(event, payload))
+            return
+        
+        accepted = self.executor.submit(
+            lambda: self.handle_websocket_command(event, payload),
+            respond,
+            light=event in self.LIGHT_EVENTS,
+            timeout=payload.get('timeout', self.request_timeout)
+        )
+        if not accepted:
+            self.logger.warning(f"Request queue full, rejecting {event}")
+            respond(None, 'Agent is busy, request queue is full')
     
     def handle_websocket_command(self, event, payload):
-        """Handle commands received via WebSocket"""
+        """Handle commands received via WebSocket, returning (response_event, data)"""
         try:
             if event == "execute_command":
                 command = payload.get('command')
                 if command:
-                    result = self.execute_command(command)
-                    self.send_websocket_response("command_result", {
+                    result = self.execute_command(command, timeout=payload.get('timeout', 30))
+                    return "command_result", {
                         'command': command,
                         'result': result
-                    })
+                    }
+            
+            elif event == "execute_command_stream":
+                command = payload.get('command')
+                request_id = payload.get('request_id')
+                if command and request_id:
+                    timeout = payload.get('timeout', 600)
+                    started = threading.Event()
+                    
+                    def run_stream():
+                        started.set()
+                        return self.execute_command_stream(command, request_id, timeout)
+                    
+                    def stream_done(result, error):
+                        # Итог уходит событием command_complete; сами сообщаем только если команда не стартовала
+                        if error and not started.is_set():
+                            self.send_websocket_response('command_complete', {
+                                'request_id': request_id,
+                                'exit_code': -1,
+                                'error': error
+                            })
+                    
+                    # Потоки вывода идут через тяжелую полосу исполнителя, а не отдельные потоки без лимита
+                    if not self.executor.submit(run_stream, stream_done, timeout=timeout + 30):
+                        return "command_error", {'event': event, 'error': 'Agent is busy, request queue is full'}
+                    return "command_started", {
+                        'command': command,
+                        'request_id': request_id
+                    }
+            
+            elif event == "cancel_command":
+                request_id = payload.get('request_id')
+                return "command_cancelled", {
+                    'request_id': request_id,
+                    'cancelled': self.cancel_command(request_id)
+                }
             
             elif event == "get_processes":
-                processes = self.get_detailed_processes()
-                self.send_websocket_response("processes_data", processes)
+                return "processes_data", self.get_detailed_processes()
             
             elif event == "manage_service":
                 service = payload.get('service')
                 action = payload.get('action')  # start, stop, restart, enable, disable
                 if service and action:
                     result = self.manage_service(service, action)
-                    self.send_websocket_response("service_result", {
+                    return "service_result", {
                         'service': service,
                         'action': action,
                         'result': result
-                    })
+                    }
             
             elif event == "get_logs":
                 log_file = payload.get('log_file', '/var/log/syslog')
                 lines = payload.get('lines', 100)
                 logs = self.get_system_logs(log_file, lines)
-                self.send_websocket_response("logs_data", {
+                return "logs_data", {
                     'log_file': log_file,
                     'logs': logs
-                })
+                }
             
             elif event == "get_services":
-                services = self.get_system_services()
-                self.send_websocket_response("services_data", services)
+                return "services_data", self.get_system_services()
             
             elif event == "get_network_connections":
-                connections = self.get_network_connections()
-                self.send_websocket_response("network_connections", connections)
+                return "network_connections", self.get_network_connections(
+                    status=payload.get('status'),
+                    port=int(payload['port']) if payload.get('port') else None,
+                    limit=payload.get('limit')
+                )
+            
+            elif event == "get_connection_summary":
+                return "connection_summary", self.get_connection_summary()
+            
+            elif event == "get_agent_health":
+                return "agent_health", self.get_agent_health()
+            
+            elif event == "update_config":
+                return "config_updated", self.update_remote_config(payload.get('config'), payload.get('version'))
             
             elif event == "get_disk_info":
-                disk_info = self.get_disk_info()
-                self.send_websocket_response("disk_info", disk_info)
+                return "disk_info", self.get_disk_info()
                 
         except Exception as e:
             self.logger.error(f"Error handling WebSocket command: {e}")
+            return "command_error", {'event': event, 'error': str(e)}
+        
+        return None
     
     def send_websocket_response(self, event, data):
         """Send response via WebSocket"""
         try:
-            if self.ws and self.ws_connected:
-                message = f'42["{event}", {json.dumps(data)}]'
-                self.ws.send(message)
+            if self.sio and self.sio.connected:
+                self.sio.emit(event, data)
         except Exception as e:
             self.logger.error(f"Error sending WebSocket response: {e}")
     
     def websocket_loop(self):
-        """WebSocket connection loop"""
-        while self.running:
-            try:
-                if not self.ws_connected:
-                    self.setup_websocket()
-                    if self.ws:
-                        self.ws.run_forever()
-                time.sleep(5)  # Wait before reconnection attempt
-            except Exception as e:
-                self.logger.error(f"WebSocket loop error: {e}")
-                time.sleep(10)
+        """WebSocket connection loop (reconnects with backoff inside the client)"""
+        try:
+            self.setup_websocket()
+            self.sio.run_forever()
+        except Exception as e:
+            self.logger.error(f"WebSocket loop error: {e}")
     
     def heartbeat_loop(self):
         """Main heartbeat loop"""
+        # Сдвигаем фазу, чтобы агенты, запущенные одновременно, не отправляли данные синхронно
+        next_tick = time.monotonic() + self.get_phase_offset()
+        
         while self.running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            
             success = self.send_heartbeat()
             
-            # Also send via WebSocket if connected
-            if self.ws_connected and success:
+            # Also send via WebSocket if connected (те же данные, без повторного сбора)
+            if self.sio and self.sio.connected and success and self.last_heartbeat:
                 try:
-                    stats = self.get_system_stats()
-                    if stats:
-                        self.send_websocket_response("server_stats", stats)
+                    self.send_websocket_response("server_stats", self.last_heartbeat)
                 except Exception as e:
                     self.logger.error(f"Error sending WebSocket stats: {e}")
             
-            time.sleep(self.heartbeat_interval)
+            # Держим фиксированный шаг без накопления дрейфа
+            next_tick += self.heartbeat_interval
+            if next_tick < time.monotonic():
+                next_tick = time.monotonic() + self.heartbeat_interval
     
     def signal_handler(self, signum, frame):
         """Handle system signals for graceful shutdown"""
@@ -1017,21 +2986,21 @@ class ProductionAgent:
         signal.signal(signal.SIGTERM, self.signal_handler)
         signal.signal(signal.SIGINT, self.signal_handler)
         
-        # Register with panel
-        if not self.register_with_panel():
-            self.logger.warning("Failed to register with panel, continuing anyway...")
-        
         self.running = True
         
-        # Start heartbeat thread
+        # Сбор метрик начинается сразу, регистрация на панели не блокирует старт
+        self.sampler.start()
         heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
         heartbeat_thread.start()
+        threading.Thread(target=self.registration_loop, daemon=True).start()
         
-        # Start WebSocket thread
+        # Start request executor and WebSocket thread
+        self.executor.start()
         self.ws_thread = threading.Thread(target=self.websocket_loop, daemon=True)
         self.ws_thread.start()
         
-        self.logger.info("Agent started successfully")
+        self.startup_ms = round((time.perf_counter() - self.init_started) * 1000, 1)
+        self.logger.info(f"Agent started successfully in {self.startup_ms}ms")
         
         try:
             while self.running:
@@ -1043,13 +3012,17 @@ class ProductionAgent:
     def stop(self):
         """Stop the agent"""
         self.running = False
+        self.executor.stop()
+        self.sampler.stop()
+        if self.sio:
+            self.sio.stop()
         self.logger.info("Agent stopped")
 
 def main():
     parser = argparse.ArgumentParser(description='Xpanel Production Agent v4.0.0')
-    parser.add_argument('--panel-address', default='localhost',
+    parser.add_argument('--panel-address', default=DEFAULT_PANEL_ADDRESS,
                        help='Control panel IP address')
-    parser.add_argument('--panel-port', type=int, default=5000,
+    parser.add_argument('--panel-port', type=int, default=DEFAULT_PANEL_PORT,
                        help='Control panel port')
     parser.add_argument('--server-id', 
                        help='Custom server ID (auto-generated if not provided)')
@@ -1059,9 +3032,15 @@ def main():
                        help='Run as daemon')
     parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
                        default='INFO', help='Logging level')
+    parser.add_argument('--benchmark', type=int, metavar='ITERATIONS', nargs='?', const=1000,
+                       help='Measure per-tick metric collection cost and exit')
     
     args = parser.parse_args()
     
+    if args.benchmark:
+        run_collector_benchmark(args.benchmark)
+        return
+    
     # Create agent instance
     agent = ProductionAgent(
         panel_address=args.panel_address,
@@ -1,1197 +1,18 @@
 #!/usr/bin/env python3
 """
-Xpanel Agent - Advanced VPS Server Agent
-Version: 3.0.0 (Production Ready)
-This agent runs on VPS servers and provides comprehensive monitoring and management
+Xpanel Agent - совместимость со старым именем агента
+Вся логика живёт в production_agent.py (единое ядро, которое ставит панель);
+этот модуль оставлен для старых systemd-юнитов и импортов XpanelAgent
 """
 
 import os
 import sys
-import time
-import json
-import psutil
-import socket
-import requests
-import subprocess
-import threading
-import signal
-import platform
-import shutil
-import glob
-from datetime import datetime, timedelta
-import argparse
-import logging
-from logging.handlers import RotatingFileHandler
-import hashlib
-import uuid
-import re
-from typing import Dict, List, Optional, Any
-import sqlite3
-from pathlib import Path
-import websocket
-import ssl
 
-class XpanelAgent:
-    def __init__(self, panel_address="localhost", panel_port=5000, server_id=None, config_file=None):
-        self.panel_address = panel_address
-        self.panel_port = panel_port
-        self.server_id = server_id or self.generate_server_id()
-        self.running = False
-        self.heartbeat_interval = 30  # seconds
-        self.config_file = config_file or '/opt/xpanel-agent/config.json'
-        self.db_file = '/opt/xpanel-agent/agent.db'
-        
-        # Load configuration
-        self.config = self.load_config()
-        
-        # Update settings from config
-        self.panel_address = self.config.get('panel_address', self.panel_address)
-        self.panel_port = self.config.get('panel_port', self.panel_port)
-        self.heartbeat_interval = self.config.get('heartbeat_interval', self.heartbeat_interval)
-        
-        # Initialize database
-        self.init_database()
-        
-        # Setup advanced logging
-        self.setup_logging()
-        
-        # Performance monitoring
-        self.last_network_stats = None
-        self.last_disk_stats = None
-        self.performance_history = []
-        self.max_history_size = 1000
-        
-        # Process monitoring
-        self.monitored_processes = self.config.get('monitored_processes', [])
-        self.process_alerts = self.config.get('process_alerts', {})
-        
-        # System alerts
-        self.alert_thresholds = self.config.get('alert_thresholds', {
-            'cpu': 80,
-            'memory': 85,
-            'disk': 90,
-            'load': 5.0
-        })
-        
-        # Command execution history
-        self.command_history = []
-        self.max_command_history = 100
-        
-        # Security monitoring
-        self.security_events = []
-        self.failed_login_attempts = 0
-        
-        # Service management
-        self.managed_services = self.config.get('managed_services', [])
-        
-        # WebSocket connection
-        self.ws = None
-        self.ws_connected = False
-        self.ws_thread = None
-        
-        self.logger.info(f"Xpanel Agent v3.0.0 initialized (ID: {self.server_id})")
-        
-    def generate_server_id(self):
-        """Generate unique server ID based on hostname and MAC address"""
-        hostname = socket.gethostname()
-        try:
-            # Get MAC address of first network interface
-            import uuid
-            mac = ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) 
-                           for elements in range(0,2*6,2)][::-1])
-            return f"{hostname}-{mac}"
-        except:
-            return hostname
-    
-    def load_config(self) -> Dict[str, Any]:
-        """Load configuration from file"""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Warning: Could not load config: {e}")
-        
-        # Default configuration
-        return {
-            'panel_address': 'localhost',
-            'panel_port': 5000,
-            'heartbeat_interval': 30,
-            'monitored_processes': [],
-            'managed_services': [],
-            'alert_thresholds': {
-                'cpu': 80,
-                'memory': 85,
-                'disk': 90,
-                'load': 5.0
-            },
-            'security_monitoring': True,
-            'log_level': 'INFO'
-        }
-    
-    def save_config(self):
-        """Save current configuration to file"""
-        try:
-            os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
-        except Exception as e:
-            self.logger.error(f"Failed to save config: {e}")
-    
-    def setup_logging(self):
-        """Setup advanced logging with rotation"""
-        log_dir = '/opt/xpanel-agent/logs'
-        os.makedirs(log_dir, exist_ok=True)
-        
-        # Create formatter
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        
-        # Setup rotating file handler
-        file_handler = RotatingFileHandler(
-            f'{log_dir}/agent.log',
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=5
-        )
-        file_handler.setFormatter(formatter)
-        
-        # Setup console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        
-        # Configure logger
-        self.logger = logging.getLogger('XpanelAgent')
-        self.logger.setLevel(getattr(logging, self.config.get('log_level', 'INFO')))
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
-    
-    def init_database(self):
-        """Initialize SQLite database for local data storage"""
-        try:
-            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            # Create tables
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS performance_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    cpu_usage REAL,
-                    memory_usage REAL,
-                    disk_usage REAL,
-                    network_in INTEGER,
-                    network_out INTEGER,
-                    load_avg REAL
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS command_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    command TEXT NOT NULL,
-                    output TEXT,
-                    exit_code INTEGER,
-                    execution_time REAL
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS security_events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    event_type TEXT NOT NULL,
-                    description TEXT,
-                    severity TEXT,
-                    source_ip TEXT
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS alerts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    alert_type TEXT NOT NULL,
-                    message TEXT,
-                    severity TEXT,
-                    resolved BOOLEAN DEFAULT FALSE
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            print(f"Database initialization error: {e}")
-    
-    def get_system_stats(self):
-        """Collect comprehensive system statistics"""
-        try:
-            # CPU usage and info
-            cpu_percent = psutil.cpu_percent(interval=1, percpu=True)
-            cpu_freq = psutil.cpu_freq()
-            cpu_count_logical = psutil.cpu_count(logical=True)
-            cpu_count_physical = psutil.cpu_count(logical=False)
-            
-            # Memory usage
-            memory = psutil.virtual_memory()
-            swap = psutil.swap_memory()
-            
-            # Disk usage for all mounted filesystems
-            disk_usage = {}
-            for partition in psutil.disk_partitions():
-                try:
-                    usage = psutil.disk_usage(partition.mountpoint)
-                    disk_usage[partition.mountpoint] = {
-                        'device': partition.device,
-                        'fstype': partition.fstype,
-                        'total': usage.total,
-                        'used': usage.used,
-                        'free': usage.free,
-                        'percent': round((usage.used / usage.total) * 100, 1)
-                    }
-                except PermissionError:
-                    continue
-            
-            # Network stats with interface details
-            network_interfaces = {}
-            for interface, stats in psutil.net_io_counters(pernic=True).items():
-                network_interfaces[interface] = {
-                    'bytes_sent': stats.bytes_sent,
-                    'bytes_recv': stats.bytes_recv,
-                    'packets_sent': stats.packets_sent,
-                    'packets_recv': stats.packets_recv,
-                    'errin': stats.errin,
-                    'errout': stats.errout,
-                    'dropin': stats.dropin,
-                    'dropout': stats.dropout
-                }
-            
-            # Network connections
-            connections = len(psutil.net_connections())
-            
-            # Load average
-            try:
-                load_avg = os.getloadavg()
-            except (OSError, AttributeError):
-                load_avg = [0, 0, 0]
-            
-            # Uptime
-            boot_time = psutil.boot_time()
-            uptime = time.time() - boot_time
-            
-            # Process information
-            process_count = len(psutil.pids())
-            
-            # Top processes by CPU and memory
-            top_processes = self.get_top_processes()
-            
-            # System temperatures (if available)
-            temperatures = self.get_system_temperatures()
-            
-            # System services status
-            services_status = self.get_services_status()
-            
-            # Disk I/O stats
-            disk_io = psutil.disk_io_counters()
-            
-            # Calculate network speed if we have previous stats
-            network_speed = self.calculate_network_speed(network_interfaces)
-            
-            stats = {
-                'server_id': self.server_id,
-                'timestamp': datetime.now().isoformat(),
-                'hostname': socket.gethostname(),
-                'ip_address': self.get_local_ip(),
-                'agent_version': '3.0.0',
-                'cpu': {
-                    'usage': round(sum(cpu_percent) / len(cpu_percent), 1),
-                    'usage_per_core': [round(x, 1) for x in cpu_percent],
-                    'cores_logical': cpu_count_logical,
-                    'cores_physical': cpu_count_physical,
-                    'frequency': {
-                        'current': cpu_freq.current if cpu_freq else 0,
-                        'min': cpu_freq.min if cpu_freq else 0,
-                        'max': cpu_freq.max if cpu_freq else 0
-                    } if cpu_freq else None
-                },
-                'memory': {
-                    'total': memory.total,
-                    'available': memory.available,
-                    'used': memory.used,
-                    'percent': round(memory.percent, 1),
-                    'cached': getattr(memory, 'cached', 0),
-                    'buffers': getattr(memory, 'buffers', 0)
-                },
-                'swap': {
-                    'total': swap.total,
-                    'used': swap.used,
-                    'free': swap.free,
-                    'percent': round(swap.percent, 1)
-                },
-                'disk': disk_usage,
-                'disk_io': {
-                    'read_count': disk_io.read_count if disk_io else 0,
-                    'write_count': disk_io.write_count if disk_io else 0,
-                    'read_bytes': disk_io.read_bytes if disk_io else 0,
-                    'write_bytes': disk_io.write_bytes if disk_io else 0
-                },
-                'network': {
-                    'interfaces': network_interfaces,
-                    'connections': connections,
-                    'speed': network_speed
-                },
-                'load_average': load_avg,
-                'uptime': int(uptime),
-                'processes': {
-                    'total': process_count,
-                    'top_cpu': top_processes['cpu'],
-                    'top_memory': top_processes['memory']
-                },
-                'temperatures': temperatures,
-                'services': services_status,
-                'system_info': {
-                    'platform': platform.system(),
-                    'platform_release': platform.release(),
-                    'platform_version': platform.version(),
-                    'architecture': platform.machine(),
-                    'processor': platform.processor()
-                }
-            }
-            
-            # Store performance data
-            self.store_performance_data(stats)
-            
-            # Check for alerts
-            self.check_system_alerts(stats)
-            
-            return stats
-            
-        except Exception as e:
-            self.logger.error(f"Error collecting system stats: {e}")
-            return None
-    
-    def get_top_processes(self, limit=5):
-        """Get top processes by CPU and memory usage"""
-        try:
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'username']):
-                try:
-                    processes.append(proc.info)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            
-            # Sort by CPU usage
-            top_cpu = sorted(processes, key=lambda x: x['cpu_percent'] or 0, reverse=True)[:limit]
-            
-            # Sort by memory usage
-            top_memory = sorted(processes, key=lambda x: x['memory_percent'] or 0, reverse=True)[:limit]
-            
-            return {
-                'cpu': top_cpu,
-                'memory': top_memory
-            }
-        except Exception as e:
-            self.logger.error(f"Error getting top processes: {e}")
-            return {'cpu': [], 'memory': []}
-    
-    def get_system_temperatures(self):
-        """Get system temperatures if available"""
-        try:
-            temps = psutil.sensors_temperatures()
-            if temps:
-                temp_data = {}
-                for name, entries in temps.items():
-                    temp_data[name] = []
-                    for entry in entries:
-                        temp_data[name].append({
-                            'label': entry.label or 'Unknown',
-                            'current': entry.current,
-                            'high': entry.high,
-                            'critical': entry.critical
-                        })
-                return temp_data
-        except (AttributeError, OSError):
-            pass
-        return {}
-    
-    def get_services_status(self):
-        """Get status of managed services"""
-        services = {}
-        for service in self.managed_services:
-            try:
-                result = subprocess.run(
-                    ['systemctl', 'is-active', service],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                services[service] = {
-                    'status': result.stdout.strip(),
-                    'active': result.returncode == 0
-                }
-            except Exception as e:
-                services[service] = {
-                    'status': 'unknown',
-                    'active': False,
-                    'error': str(e)
-                }
-        return services
-    
-    def calculate_network_speed(self, current_stats):
-        """Calculate network speed based on previous stats"""
-        if not self.last_network_stats:
-            self.last_network_stats = {
-                'stats': current_stats,
-                'timestamp': time.time()
-            }
-            return {}
-        
-        current_time = time.time()
-        time_diff = current_time - self.last_network_stats['timestamp']
-        
-        if time_diff < 1:  # Too soon to calculate
-            return {}
-        
-        speeds = {}
-        for interface, stats in current_stats.items():
-            if interface in self.last_network_stats['stats']:
-                old_stats = self.last_network_stats['stats'][interface]
-                
-                bytes_sent_diff = stats['bytes_sent'] - old_stats['bytes_sent']
-                bytes_recv_diff = stats['bytes_recv'] - old_stats['bytes_recv']
-                
-                speeds[interface] = {
-                    'upload_speed': bytes_sent_diff / time_diff,  # bytes per second
-                    'download_speed': bytes_recv_diff / time_diff
-                }
-        
-        # Update last stats
-        self.last_network_stats = {
-            'stats': current_stats,
-            'timestamp': current_time
-        }
-        
-        return speeds
-    
-    def store_performance_data(self, stats):
-        """Store performance data in local database"""
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO performance_history 
-                (timestamp, cpu_usage, memory_usage, disk_usage, network_in, network_out, load_avg)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                stats['timestamp'],
-                stats['cpu']['usage'],
-                stats['memory']['percent'],
-                stats['disk'].get('/', {}).get('percent', 0),
-                sum(iface.get('bytes_recv', 0) for iface in stats['network']['interfaces'].values()),
-                sum(iface.get('bytes_sent', 0) for iface in stats['network']['interfaces'].values()),
-                stats['load_average'][0] if stats['load_average'] else 0
-            ))
-            
-            conn.commit()
-            
-            # Clean old data (keep last 1000 records)
-            cursor.execute('''
-                DELETE FROM performance_history 
-                WHERE id NOT IN (
-                    SELECT id FROM performance_history 
-                    ORDER BY timestamp DESC LIMIT 1000
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            self.logger.error(f"Error storing performance data: {e}")
-    
-    def check_system_alerts(self, stats):
-        """Check system stats against alert thresholds"""
-        alerts = []
-        
-        # CPU alert
-        if stats['cpu']['usage'] > self.alert_thresholds['cpu']:
-            alerts.append({
-                'type': 'cpu',
-                'severity': 'warning',
-                'message': f"High CPU usage: {stats['cpu']['usage']}%"
-            })
-        
-        # Memory alert
-        if stats['memory']['percent'] > self.alert_thresholds['memory']:
-            alerts.append({
-                'type': 'memory',
-                'severity': 'warning',
-                'message': f"High memory usage: {stats['memory']['percent']}%"
-            })
-        
-        # Disk alerts
-        for mount, disk_info in stats['disk'].items():
-            if disk_info['percent'] > self.alert_thresholds['disk']:
-                alerts.append({
-                    'type': 'disk',
-                    'severity': 'critical' if disk_info['percent'] > 95 else 'warning',
-                    'message': f"High disk usage on {mount}: {disk_info['percent']}%"
-                })
-        
-        # Load average alert
-        if stats['load_average'][0] > self.alert_thresholds['load']:
-            alerts.append({
-                'type': 'load',
-                'severity': 'warning',
-                'message': f"High system load: {stats['load_average'][0]}"
-            })
-        
-        # Store alerts in database
-        if alerts:
-            self.store_alerts(alerts)
-    
-    def store_alerts(self, alerts):
-        """Store alerts in database"""
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            for alert in alerts:
-                cursor.execute('''
-                    INSERT INTO alerts (timestamp, alert_type, message, severity)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    datetime.now().isoformat(),
-                    alert['type'],
-                    alert['message'],
-                    alert['severity']
-                ))
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            self.logger.error(f"Error storing alerts: {e}")
-    
-    def execute_command(self, command, timeout=30):
-        """Execute shell command with enhanced logging and security"""
-        start_time = time.time()
-        
-        # Security check - block dangerous commands
-        dangerous_patterns = [
-            r'rm\s+-rf\s+/',
-            r'dd\s+if=.*of=/dev/',
-            r'mkfs\.',
-            r'fdisk',
-            r'parted'
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, command, re.IGNORECASE):
-                result = {
-                    'success': False,
-                    'error': 'Command blocked for security reasons',
-                    'exit_code': -1,
-                    'timestamp': datetime.now().isoformat(),
-                    'execution_time': 0
-                }
-                self.store_command_history(command, result)
-                return result
-        
-        try:
-            self.logger.info(f"Executing command: {command}")
-            
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=timeout
-            )
-            
-            execution_time = time.time() - start_time
-            
-            result_data = {
-                'success': True,
-                'output': result.stdout,
-                'error': result.stderr,
-                'exit_code': result.returncode,
-                'timestamp': datetime.now().isoformat(),
-                'execution_time': execution_time
-            }
-            
-            self.store_command_history(command, result_data)
-            return result_data
-            
-        except subprocess.TimeoutExpired:
-            execution_time = time.time() - start_time
-            result = {
-                'success': False,
-                'error': f'Command timed out after {timeout} seconds',
-                'exit_code': -1,
-                'timestamp': datetime.now().isoformat(),
-                'execution_time': execution_time
-            }
-            self.store_command_history(command, result)
-            return result
-            
-        except Exception as e:
-            execution_time = time.time() - start_time
-            result = {
-                'success': False,
-                'error': str(e),
-                'exit_code': -1,
-                'timestamp': datetime.now().isoformat(),
-                'execution_time': execution_time
-            }
-            self.store_command_history(command, result)
-            return result
-    
-    def store_command_history(self, command, result):
-        """Store command execution history"""
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO command_history (timestamp, command, output, exit_code, execution_time)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                result['timestamp'],
-                command,
-                result.get('output', '') + result.get('error', ''),
-                result['exit_code'],
-                result['execution_time']
-            ))
-            
-            conn.commit()
-            
-            # Keep only last 100 commands
-            cursor.execute('''
-                DELETE FROM command_history 
-                WHERE id NOT IN (
-                    SELECT id FROM command_history 
-                    ORDER BY timestamp DESC LIMIT 100
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            
-        except Exception as e:
-            self.logger.error(f"Error storing command history: {e}")
-    
-    def setup_websocket(self):
-        """Setup WebSocket connection for real-time communication"""
-        try:
-            ws_url = f"ws://{self.panel_address}:{self.panel_port}/socket.io/?EIO=4&transport=websocket"
-            
-            def on_message(ws, message):
-                try:
-                    self.logger.debug(f"WebSocket message received: {message}")
-                    # Handle incoming commands from panel
-                    if message.startswith('42'):  # Socket.IO message format
-                        data = json.loads(message[2:])
-                        if len(data) >= 2:
-                            event = data[0]
-                            payload = data[1] if len(data) > 1 else {}
-                            self.handle_websocket_command(event, payload)
-                except Exception as e:
-                    self.logger.error(f"Error processing WebSocket message: {e}")
-            
-            def on_error(ws, error):
-                self.logger.error(f"WebSocket error: {error}")
-                self.ws_connected = False
-            
-            def on_close(ws, close_status_code, close_msg):
-                self.logger.warning("WebSocket connection closed")
-                self.ws_connected = False
-            
-            def on_open(ws):
-                self.logger.info("WebSocket connection established")
-                self.ws_connected = True
-                # Join server room for targeted updates
-                join_message = f'42["join_room", {{"room": "{self.server_id}"}}]'
-                ws.send(join_message)
-            
-            self.ws = websocket.WebSocketApp(
-                ws_url,
-                on_open=on_open,
-                on_message=on_message,
-                on_error=on_error,
-                on_close=on_close
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Error setting up WebSocket: {e}")
-    
-    def handle_websocket_command(self, event, payload):
-        """Handle commands received via WebSocket"""
-        try:
-            if event == "execute_command":
-                command = payload.get('command')
-                if command:
-                    result = self.execute_command(command)
-                    self.send_websocket_response("command_result", {
-                        'command': command,
-                        'result': result
-                    })
-            
-            elif event == "get_processes":
-                processes = self.get_detailed_processes()
-                self.send_websocket_response("processes_data", processes)
-            
-            elif event == "manage_service":
-                service = payload.get('service')
-                action = payload.get('action')  # start, stop, restart, enable, disable
-                if service and action:
-                    result = self.manage_service(service, action)
-                    self.send_websocket_response("service_result", {
-                        'service': service,
-                        'action': action,
-                        'result': result
-                    })
-            
-            elif event == "get_logs":
-                log_file = payload.get('log_file', '/var/log/syslog')
-                lines = payload.get('lines', 100)
-                logs = self.get_system_logs(log_file, lines)
-                self.send_websocket_response("logs_data", {
-                    'log_file': log_file,
-                    'logs': logs
-                })
-            
-            elif event == "update_config":
-                new_config = payload.get('config', {})
-                self.update_agent_config(new_config)
-                self.send_websocket_response("config_updated", {"success": True})
-                
-        except Exception as e:
-            self.logger.error(f"Error handling WebSocket command: {e}")
-    
-    def send_websocket_response(self, event, data):
-        """Send response via WebSocket"""
-        try:
-            if self.ws and self.ws_connected:
-                message = f'42["{event}", {json.dumps(data)}]'
-                self.ws.send(message)
-        except Exception as e:
-            self.logger.error(f"Error sending WebSocket response: {e}")
-    
-    def get_detailed_processes(self):
-        """Get detailed process information"""
-        try:
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 
-                                           'username', 'status', 'create_time', 'cmdline']):
-                try:
-                    pinfo = proc.info
-                    pinfo['create_time'] = datetime.fromtimestamp(pinfo['create_time']).isoformat()
-                    pinfo['cmdline'] = ' '.join(pinfo['cmdline']) if pinfo['cmdline'] else ''
-                    processes.append(pinfo)
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            
-            return {'processes': processes}
-        except Exception as e:
-            self.logger.error(f"Error getting detailed processes: {e}")
-            return {'processes': []}
-    
-    def manage_service(self, service_name, action):
-        """Manage system services"""
-        try:
-            valid_actions = ['start', 'stop', 'restart', 'enable', 'disable', 'status']
-            if action not in valid_actions:
-                return {'success': False, 'error': f'Invalid action: {action}'}
-            
-            cmd = f"systemctl {action} {service_name}"
-            result = subprocess.run(
-                cmd.split(),
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            return {
-                'success': result.returncode == 0,
-                'output': result.stdout,
-                'error': result.stderr,
-                'exit_code': result.returncode
-            }
-            
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-    
-    def get_system_logs(self, log_file, lines=100):
-        """Get system logs"""
-        try:
-            if not os.path.exists(log_file):
-                return {'error': f'Log file {log_file} not found'}
-            
-            cmd = f"tail -n {lines} {log_file}"
-            result = subprocess.run(
-                cmd.split(),
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                return {'logs': result.stdout.split('\n')}
-            else:
-                return {'error': result.stderr}
-                
-        except Exception as e:
-            return {'error': str(e)}
-    
-    def update_agent_config(self, new_config):
-        """Update agent configuration"""
-        try:
-            self.config.update(new_config)
-            self.save_config()
-            
-            # Apply configuration changes
-            if 'heartbeat_interval' in new_config:
-                self.heartbeat_interval = new_config['heartbeat_interval']
-            
-            if 'alert_thresholds' in new_config:
-                self.alert_thresholds.update(new_config['alert_thresholds'])
-            
-            if 'managed_services' in new_config:
-                self.managed_services = new_config['managed_services']
-                
-        except Exception as e:
-            self.logger.error(f"Error updating config: {e}")
-    
-    def send_heartbeat(self):
-        """Send heartbeat with system stats to panel"""
-        try:
-            stats = self.get_system_stats()
-            if not stats:
-                return False
-            
-            # Send via HTTP
-            url = f"http://{self.panel_address}:{self.panel_port}/api/agent/heartbeat"
-            response = requests.post(
-                url,
-                json=stats,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                self.logger.debug("Heartbeat sent successfully")
-                
-                # Also send via WebSocket if connected
-                if self.ws_connected:
-                    self.send_websocket_response("server_stats", stats)
-                
-                return True
-            else:
-                self.logger.warning(f"Heartbeat failed: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error sending heartbeat: {e}")
-            return False
-    
-    def register_with_panel(self):
-        """Register this agent with the control panel"""
-        try:
-            server_info = {
-                'server_id': self.server_id,
-                'hostname': socket.gethostname(),
-                'ip_address': self.get_local_ip(),
-                'os_info': self.get_os_info(),
-                'agent_version': '3.0.0',
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            url = f"http://{self.panel_address}:{self.panel_port}/api/agent/register"
-            response = requests.post(
-                url,
-                json=server_info,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                self.logger.info("Successfully registered with control panel")
-                return True
-            else:
-                self.logger.error(f"Registration failed: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error registering with panel: {e}")
-            return False
-    
-    def get_local_ip(self):
-        """Get local IP address"""
-        try:
-            # Connect to a remote address to determine local IP
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "127.0.0.1"
-    
-    def get_os_info(self):
-        """Get operating system information"""
-        try:
-            return {
-                'system': platform.system(),
-                'release': platform.release(),
-                'version': platform.version(),
-                'machine': platform.machine(),
-                'processor': platform.processor(),
-                'python_version': platform.python_version()
-            }
-        except:
-            return {'system': 'Unknown'}
-    
-    def heartbeat_loop(self):
-        """Main heartbeat loop"""
-        while self.running:
-            self.send_heartbeat()
-            time.sleep(self.heartbeat_interval)
-    
-    def websocket_loop(self):
-        """WebSocket connection loop"""
-        while self.running:
-            try:
-                if not self.ws_connected:
-                    self.setup_websocket()
-                    if self.ws:
-                        self.ws.run_forever()
-                time.sleep(5)  # Wait before reconnection attempt
-            except Exception as e:
-                self.logger.error(f"WebSocket loop error: {e}")
-                time.sleep(10)
-    
-    def signal_handler(self, signum, frame):
-        """Handle system signals for graceful shutdown"""
-        self.logger.info(f"Received signal {signum}, shutting down...")
-        self.stop()
-    
-    def start(self):
-        """Start the agent"""
-        self.logger.info(f"Starting Xpanel Agent v3.0.0 (ID: {self.server_id})")
-        self.logger.info(f"Panel address: {self.panel_address}:{self.panel_port}")
-        
-        # Setup signal handlers
-        signal.signal(signal.SIGTERM, self.signal_handler)
-        signal.signal(signal.SIGINT, self.signal_handler)
-        
-        # Register with panel
-        if not self.register_with_panel():
-            self.logger.error("Failed to register with panel, continuing anyway...")
-        
-        self.running = True
-        
-        # Start heartbeat thread
-        heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
-        heartbeat_thread.start()
-        
-        # Start WebSocket thread
-        self.ws_thread = threading.Thread(target=self.websocket_loop, daemon=True)
-        self.ws_thread.start()
-        
-        self.logger.info("Agent started successfully")
-        
-        try:
-            while self.running:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.logger.info("Received interrupt signal, stopping agent...")
-            self.stop()
-    
-    def stop(self):
-        """Stop the agent"""
-        self.running = False
-        
-        # Close WebSocket connection
-        if self.ws:
-            self.ws.close()
-        
-        self.logger.info("Agent stopped")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-def main():
-    parser = argparse.ArgumentParser(description='Xpanel VPS Agent v3.0.0')
-    parser.add_argument('--panel-address', default='localhost',
-                       help='Control panel IP address')
-    parser.add_argument('--panel-port', type=int, default=5000,
-                       help='Control panel port')
-    parser.add_argument('--server-id', 
-                       help='Custom server ID (auto-generated if not provided)')
-    parser.add_argument('--config', 
-                       help='Configuration file path')
-    parser.add_argument('--daemon', action='store_true',
-                       help='Run as daemon')
-    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
-                       default='INFO', help='Logging level')
-    
-    args = parser.parse_args()
-    
-    # Create agent instance
-    agent = XpanelAgent(
-        panel_address=args.panel_address,
-        panel_port=args.panel_port,
-        server_id=args.server_id,
-        config_file=args.config
-    )
-    
-    # Set log level
-    agent.logger.setLevel(getattr(logging, args.log_level))
-    
-    if args.daemon:
-        # Run as daemon (simplified version)
-        try:
-            import daemon
-            with daemon.DaemonContext():
-                agent.start()
-        except ImportError:
-            agent.logger.error("python-daemon not installed, running in foreground")
-            agent.start()
-    else:
-        agent.start()
+from production_agent import ProductionAgent, main
 
-if __name__ == '__main__':
-    main()
-                return True
-            else:
-                self.logger.warning(f"Heartbeat failed: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error sending heartbeat: {e}")
-            return False
-    
-    def register_with_panel(self):
-        """Register this agent with the control panel"""
-        try:
-            server_info = {
-                'server_id': self.server_id,
-                'hostname': socket.gethostname(),
-                'ip_address': self.get_local_ip(),
-                'os_info': self.get_os_info(),
-                'agent_version': '1.0.0',
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            url = f"http://{self.panel_address}:{self.panel_port}/api/agent/register"
-            response = requests.post(
-                url,
-                json=server_info,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                self.logger.info("Successfully registered with control panel")
-                return True
-            else:
-                self.logger.error(f"Registration failed: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error registering with panel: {e}")
-            return False
-    
-    def get_local_ip(self):
-        """Get local IP address"""
-        try:
-            # Connect to a remote address to determine local IP
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "127.0.0.1"
-    
-    def get_os_info(self):
-        """Get operating system information"""
-        try:
-            import platform
-            return {
-                'system': platform.system(),
-                'release': platform.release(),
-                'version': platform.version(),
-                'machine': platform.machine(),
-                'processor': platform.processor()
-            }
-        except:
-            return {'system': 'Unknown'}
-    
-    def heartbeat_loop(self):
-        """Main heartbeat loop"""
-        while self.running:
-            self.send_heartbeat()
-            time.sleep(self.heartbeat_interval)
-    
-    def start(self):
-        """Start the agent"""
-        self.logger.info(f"Starting Xpanel Agent (ID: {self.server_id})")
-        self.logger.info(f"Panel address: {self.panel_address}:{self.panel_port}")
-        
-        # Register with panel
-        if not self.register_with_panel():
-            self.logger.error("Failed to register with panel, continuing anyway...")
-        
-        self.running = True
-        
-        # Start heartbeat thread
-        heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
-        heartbeat_thread.start()
-        
-        self.logger.info("Agent started successfully")
-        
-        try:
-            while self.running:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.logger.info("Received interrupt signal, stopping agent...")
-            self.stop()
-    
-    def stop(self):
-        """Stop the agent"""
-        self.running = False
-        self.logger.info("Agent stopped")
-
-def main():
-    parser = argparse.ArgumentParser(description='Xpanel VPS Agent')
-    parser.add_argument('--panel-address', default='64.188.70.12',
-                       help='Control panel IP address')
-    parser.add_argument('--panel-port', type=int, default=5000,
-                       help='Control panel port')
-    parser.add_argument('--server-id', 
-                       help='Custom server ID (auto-generated if not provided)')
-    parser.add_argument('--daemon', action='store_true',
-                       help='Run as daemon')
-    
-    args = parser.parse_args()
-    
-    # Create agent instance
-    agent = XpanelAgent(
-        panel_address=args.panel_address,
-        panel_port=args.panel_port,
-        server_id=args.server_id
-    )
-    
-    if args.daemon:
-        # Run as daemon (simplified version)
-        import daemon
-        with daemon.DaemonContext():
-            agent.start()
-    else:
-        agent.start()
+XpanelAgent = ProductionAgent
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Agent Bundle - Единый источник агента, который панель отдаёт на серверы
+Все способы установки (SSH-установщик, install-script, скачивание) берут agent/production_agent.py
+"""
+
+import os
+from typing import Optional
+
+AGENT_SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agent', 'production_agent.py')
+AGENT_DIR = '/opt/xpanel-agent'
+AGENT_PATH = f'{AGENT_DIR}/agent.py'
+SERVICE_NAME = 'xpanel-agent'
+PYTHON_DEPENDENCIES = ('requests', 'psutil', 'websocket-client')
+
+
+def get_agent_source(panel_address: str, panel_port: int = 5000) -> str:
+    """Текст агента с подставленным адресом панели"""
+    with open(AGENT_SOURCE_PATH, 'r', encoding='utf-8') as f:
+        source = f.read()
+    
+    source = source.replace('DEFAULT_PANEL_ADDRESS = "localhost"', f'DEFAULT_PANEL_ADDRESS = "{panel_address}"', 1)
+    source = source.replace('DEFAULT_PANEL_PORT = 5000', f'DEFAULT_PANEL_PORT = {int(panel_port)}', 1)
+    return source
+
+
+def get_service_unit(agent_path: str = AGENT_PATH) -> str:
+    """systemd unit для агента"""
+    return f'''[Unit]
+Description=Xpanel Server Agent
+After=network.target
+Wants=network.target
+
+[Service]
+Type=simple
+User=root
+WorkingDirectory={AGENT_DIR}
+ExecStart=/usr/bin/python3 {agent_path}
+Restart=always
+RestartSec=10
+StandardOutput=journal
+StandardError=journal
+
+[Install]
+WantedBy=multi-user.target
+'''
+
+
+def get_install_script(panel_address: str, panel_port: int = 5000, agent_source: Optional[str] = None) -> str:
+    """Самодостаточный bash-скрипт установки (агент встроен через heredoc)"""
+    agent_source = agent_source or get_agent_source(panel_address, panel_port)
+    dependencies = ' '.join(PYTHON_DEPENDENCIES)
+    
+    # Шаблон собирается конкатенацией: в bash много фигурных скобок, format() здесь не подходит
+    return '''#!/bin/bash
+
+# Xpanel Agent Auto-Installation Script
+# Generated automatically by Xpanel Control Panel
+
+set -e
+
+GREEN='\\033[0;32m'
+RED='\\033[0;31m'
+NC='\\033[0m'
+
+AGENT_DIR="''' + AGENT_DIR + '''"
+SERVICE_NAME="''' + SERVICE_NAME + '''"
+
+print_status() {
+    echo -e "${GREEN}[INFO]${NC} $1"
+}
+
+print_error() {
+    echo -e "${RED}[ERROR]${NC} $1"
+}
+
+if [[ $EUID -ne 0 ]]; then
+   print_error "This script must be run as root (use sudo)"
+   exit 1
+fi
+
+print_status "Installing dependencies..."
+if command -v apt-get &> /dev/null; then
+    apt-get update -qq
+    apt-get install -y python3 python3-pip
+elif command -v dnf &> /dev/null; then
+    dnf install -y python3 python3-pip
+elif command -v yum &> /dev/null; then
+    yum install -y python3 python3-pip
+else
+    print_error "Unsupported package manager"
+    exit 1
+fi
+python3 -m pip install ''' + dependencies + ''' || python3 -m pip install --break-system-packages ''' + dependencies + '''
+
+print_status "Installing agent..."
+mkdir -p "$AGENT_DIR/logs"
+cat > "''' + AGENT_PATH + '''" << 'AGENT_EOF'
+''' + agent_source.rstrip('\n') + '''
+AGENT_EOF
+chmod +x "''' + AGENT_PATH + '''"
+
+print_status "Creating systemd service..."
+cat > /etc/systemd/system/$SERVICE_NAME.service << 'SERVICE_EOF'
+''' + get_service_unit().rstrip('\n') + '''
+SERVICE_EOF
+
+systemctl daemon-reload
+systemctl enable $SERVICE_NAME
+systemctl restart $SERVICE_NAME
+
+if systemctl is-active --quiet $SERVICE_NAME; then
+    print_status "Agent installed and started successfully!"
+else
+    print_error "Failed to start agent service"
+    systemctl status $SERVICE_NAME --no-pager
+    exit 1
+fi
+'''
@@ -4,13 +4,20 @@ Xpanel - VPS Management Panel
 Main Flask application
 """
 
-from flask import Flask, render_template, request, jsonify, session
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
+from flask import Flask, render_template, request, jsonify, session, Response
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, decode_token
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room
 import psutil
 import json
 import os
+import re
+import hmac
+import hashlib
+import math
+import uuid
+import io
+import gzip
 from datetime import datetime, timedelta
 import threading
 import time
@@ -21,6 +28,7 @@ from agent_client import AgentClient
 from auth import auth_bp, require_auth, get_current_user
 from ssh_manager import ssh_manager
 from real_agent_installer import real_installer
+from agent_bundle import get_agent_source
 
 # Load environment variables
 load_dotenv()
@@ -35,6 +43,11 @@ jwt = JWTManager(app)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 
+# Браузеры дашборда в namespace '/' (комната dashboard), агенты - в отдельном namespace
+# и не получают широковещательные события дашборда
+DASHBOARD_ROOM = 'dashboard'
+AGENT_NAMESPACE = '/agent'
+
 # Register authentication blueprint
 app.register_blueprint(auth_bp)
 
@@ -42,6 +55,33 @@ app.register_blueprint(auth_bp)
 server_manager = ServerManager()
 agent_client = AgentClient()
 
+def emit_agentless_stats(server_id, stats):
+    """Push SSH-polled stats of server without agent like an agent heartbeat"""
+    socketio.emit('server_stats', {'server_id': server_id, 'stats': stats}, to=DASHBOARD_ROOM)
+
+def start_background_services():
+    """Start background pollers; called by the process that serves requests (run.py, __main__, gunicorn worker)"""
+    server_manager.warm_ssh_pool()
+    server_manager.start_agentless_polling(on_stats=emit_agentless_stats)
+
+@app.before_request
+def decompress_request_body():
+    """Inflate gzip-compressed request bodies sent by agents"""
+    if request.headers.get('Content-Encoding', '').lower() != 'gzip':
+        return None
+    
+    environ = request.environ
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = gzip.decompress(environ['wsgi.input'].read(length))
+    except (OSError, ValueError, EOFError):
+        return jsonify({'success': False, 'error': 'Invalid gzip body'}), 400
+    
+    environ['wsgi.input'] = io.BytesIO(body)
+    environ['CONTENT_LENGTH'] = str(len(body))
+    environ.pop('HTTP_CONTENT_ENCODING', None)
+    return None
+
 @app.route('/')
 def index():
     return render_template('landing_ru.html')
@@ -116,6 +156,13 @@ def get_server_stats(server_id):
     stats = server_manager.get_server_stats(server_id)
     return jsonify(stats)
 
+@app.route('/api/servers/<server_id>/stats/history', methods=['GET'])
+@jwt_required()
+def get_server_stats_history(server_id):
+    """Get stored metric samples (live heartbeats and replayed offline buffer)"""
+    history = server_manager.get_stats_history(server_id, since=request.args.get('since'))
+    return jsonify({'success': True, 'server_id': server_id, 'samples': history})
+
 @app.route('/api/servers/<server_id>/install-agent', methods=['POST'])
 @jwt_required()
 def install_agent_legacy(server_id):
@@ -150,7 +197,7 @@ def install_agent_legacy(server_id):
             try:
                 progress_payload = dict(progress_data)
                 progress_payload['server_id'] = str(server_id)
-                socketio.emit('installation_progress', progress_payload)
+                socketio.emit('installation_progress', progress_payload, to=DASHBOARD_ROOM)
             except Exception as e:
                 print(f"Emit progress error: {e}")
 
@@ -167,7 +214,7 @@ def install_agent_legacy(server_id):
                         'success': result.get('success', False),
                         'message': result.get('message'),
                         'error': result.get('error')
-                    })
+                    }, to=DASHBOARD_ROOM)
                 except Exception as e:
                     print(f"Emit completion error: {e}")
             except Exception as e:
@@ -176,7 +223,7 @@ def install_agent_legacy(server_id):
                     'server_id': str(server_id),
                     'success': False,
                     'error': f'Ошибка установки агента: {str(e)}'
-                })
+                }, to=DASHBOARD_ROOM)
 
         # Используем нативный фоновой таск Socket.IO для корректной доставки событий
         socketio.start_background_task(install_in_background)
@@ -290,7 +337,7 @@ def install_agent_realtime():
         
         # Функция обратного вызова для отправки прогресса через WebSocket
         def progress_callback(progress_data):
-            socketio.emit('installation_progress', progress_data)
+            socketio.emit('installation_progress', progress_data, to=DASHBOARD_ROOM)
         
         # Запускаем установку в отдельном потоке
         def install_in_background():
@@ -303,17 +350,17 @@ def install_agent_realtime():
                         'success': True,
                         'message': result['message'],
                         'server_info': result.get('server_info', {})
-                    })
+                    }, to=DASHBOARD_ROOM)
                 else:
                     socketio.emit('installation_error', {
                         'success': False,
                         'error': result['error']
-                    })
+                    }, to=DASHBOARD_ROOM)
             except Exception as e:
                 socketio.emit('installation_error', {
                     'success': False,
                     'error': f'Ошибка установки агента: {str(e)}'
-                })
+                }, to=DASHBOARD_ROOM)
         
         # Запускаем установку в фоновом режиме
         import threading
@@ -374,7 +421,7 @@ def install_agent_remote():
                 socketio.emit('installation_progress', {
                     'server': host,
                     'progress': progress_data
-                })
+                }, to=DASHBOARD_ROOM)
             
             result = real_installer.install_agent(server_config, progress_callback)
             
@@ -382,7 +429,7 @@ def install_agent_remote():
             socketio.emit('installation_complete', {
                 'server': host,
                 'result': result
-            })
+            }, to=DASHBOARD_ROOM)
             
             # Если установка успешна, добавляем сервер в базу
             if result['success']:
@@ -438,17 +485,35 @@ def install_agent_remote():
     except Exception as e:
         return jsonify({'success': False, 'error': f'Ошибка запуска установки: {str(e)}'}), 500
 
+def get_panel_endpoint():
+    """Panel address and port as the client reached it (agents connect back the same way)"""
+    address, _, port = (request.host or 'localhost').partition(':')
+    return address, int(port) if port.isdigit() else 80
+
 @app.route('/api/agent/install-script')
 def get_install_script():
     """Get agent installation script"""
-    panel_address = request.host.split(':')[0]
-    script_content = server_manager.generate_install_script(panel_address)
+    panel_address, panel_port = get_panel_endpoint()
+    script_content = server_manager.generate_install_script(panel_address, panel_port)
     
     return script_content, 200, {
         'Content-Type': 'text/plain',
         'Content-Disposition': 'attachment; filename=install_agent.sh'
     }
 
+@app.route('/api/agent/script')
+def get_agent_script():
+    """Get agent source (same core that the installers ship)"""
+    panel_address, panel_port = get_panel_endpoint()
+    
+    return get_agent_source(panel_address, panel_port), 200, {
+        'Content-Type': 'text/x-python',
+        'Content-Disposition': 'attachment; filename=agent.py'
+    }
+
+AGENT_IDENTITY_KEYS = ('hostname', 'ip_address', 'os_info', 'cpu_cores', 'cpu_cores_physical',
+                       'total_memory', 'system_info')
+
 @app.route('/api/agent/heartbeat', methods=['POST'])
 def agent_heartbeat():
     """Receive real heartbeat data from agent"""
@@ -458,53 +523,67 @@ def agent_heartbeat():
         return jsonify({'success': False, 'error': 'Invalid heartbeat data'}), 400
     
     server_id = data['server_id']
+    metrics = server_manager.summarize_agent_stats(data)
     
     # Обновляем кэш данных агента
     server_manager.update_agent_data(server_id, {
-        'cpu_percent': data.get('cpu_percent', 0),
-        'memory_percent': data.get('memory_percent', 0),
-        'disk_percent': data.get('disk_percent', 0),
+        'cpu_percent': metrics.get('cpu_percent', 0),
+        'memory_percent': metrics.get('memory_percent', 0),
+        'disk_percent': metrics.get('disk_percent', 0),
+        'load_average': metrics.get('load_average'),
+        'timestamp': metrics.get('timestamp'),
         'network': data.get('network', {}),
         'processes': data.get('processes', []),
         'services': data.get('services', []),
         'auth_failures': data.get('auth_failures', []),
-        'network_connections': data.get('network_connections', []),
+        'network_connections': data.get('network_connections', {}),
         'system_logs': data.get('system_logs', []),
+        'aggregates': data.get('aggregates'),
+        'agent_health': data.get('agent_health'),
+        'host_identity': {key: data[key] for key in AGENT_IDENTITY_KEYS if key in data} if 'hostname' in data else None,
         'uptime': data.get('uptime', 0)
     })
     
     # Обновляем статус сервера
     server_manager.update_server_status(server_id, 'online')
     
+    # Агент шлёт hostname/IP/ОС только при изменении - дополняем из кэша
+    host_identity = server_manager.agent_cache[server_id].get('host_identity')
+    if host_identity:
+        data = dict(host_identity, **data)
+    
     # Отправляем real-time обновления через WebSocket
     socketio.emit('server_stats', {
         'server_id': server_id,
         'stats': data
-    })
+    }, to=DASHBOARD_ROOM)
     
     # Проверяем на угрозы безопасности
     threats = []
     
     # Высокое использование CPU
-    if data.get('cpu_percent', 0) > 90:
+    if (metrics.get('cpu_percent') or 0) > 90:
         threats.append({
             'type': 'high_cpu',
             'severity': 'warning',
-            'message': f"High CPU usage: {data.get('cpu_percent')}%"
+            'message': f"High CPU usage: {metrics['cpu_percent']}%"
         })
     
     # Высокое использование памяти
-    if data.get('memory_percent', 0) > 90:
+    if (metrics.get('memory_percent') or 0) > 90:
         threats.append({
             'type': 'high_memory',
             'severity': 'critical',
-            'message': f"High memory usage: {data.get('memory_percent')}%"
+            'message': f"High memory usage: {metrics['memory_percent']}%"
         })
     
     # Подозрительные процессы
     processes = data.get('processes', [])
+    if isinstance(processes, dict):
+        # Агент шлёт {'total', 'top_cpu', 'top_memory'}
+        processes = processes.get('top_cpu', [])
     for proc in processes:
-        if proc.get('cpu_percent', 0) > 95:
+        if (proc.get('cpu_percent') or 0) > 95:
             threats.append({
                 'type': 'suspicious_process',
                 'severity': 'high',
@@ -516,9 +595,36 @@ def agent_heartbeat():
         socketio.emit('security_alert', {
             'server_id': server_id,
             'threats': threats
-        })
+        }, to=DASHBOARD_ROOM)
+    
+    response = {'success': True, 'message': 'Heartbeat received', 'threats_detected': len(threats)}
+    
+    # Кэш панели пуст (например, после перезапуска) - просим агента прислать идентичность
+    if not host_identity:
+        response['send_identity'] = True
+    
+    # Агент отстал от конфигурации панели - отдаём актуальную версию в ответе
+    agent_config = server_manager.get_agent_config(server_id)
+    if agent_config and agent_config['version'] > (data.get('config_version') or 0):
+        response['agent_config'] = {'version': agent_config['version'], 'settings': agent_config['settings']}
+    
+    return jsonify(response)
+
+@app.route('/api/agent/heartbeat/batch', methods=['POST'])
+def agent_heartbeat_batch():
+    """Receive buffered heartbeat samples replayed by agent after reconnect"""
+    data = request.get_json()
+    
+    if not data or 'server_id' not in data or not isinstance(data.get('samples'), list):
+        return jsonify({'success': False, 'error': 'Invalid heartbeat batch'}), 400
+    
+    server_id = data['server_id']
+    
+    # Повтор запускается после успешного heartbeat, поэтому кэш уже свежее -
+    # выборки ложатся в историю сервера (GET /api/servers/<id>/stats/history)
+    samples = server_manager.record_stats_history(server_id, data['samples'])
     
-    return jsonify({'success': True, 'message': 'Heartbeat received', 'threats_detected': len(threats)})
+    return jsonify({'success': True, 'message': 'Heartbeat batch received', 'accepted': len(samples)})
 
 @app.route('/api/agent/register', methods=['POST'])
 def agent_register():
@@ -561,15 +667,33 @@ def agent_register():
                 existing_server = i
                 break
         
+        # Токен канала управления выдаётся при первой регистрации (trust on first use);
+        # повторно - только агенту, который предъявил уже выданный токен
+        token = agent_token_for(server_id)
+        issue_token = (existing_server is None or not servers[existing_server].get('agent_token_issued')
+                       or hmac.compare_digest(str(data.get('agent_token') or ''), token))
+        server_info['agent_token_issued'] = issue_token or servers[existing_server].get('agent_token_issued', False)
+        
         if existing_server is not None:
             servers[existing_server] = server_info
         else:
             servers.append(server_info)
         
+        # SSH-сервер панели, на котором стоит агент: запоминаем id агента,
+        # дальше агентless-опрос сопоставляет их по нему, а не по IP
+        addresses = {data.get('ip_address'), request.remote_addr} - {None, ''}
+        for server in servers:
+            if server.get('host') and not server.get('agent_server_id') and server['host'] in addresses:
+                server['agent_server_id'] = server_id
+                break
+        
         with open(servers_file, 'w', encoding='utf-8') as f:
             json.dump(servers, f, ensure_ascii=False, indent=2)
         
-        return jsonify({'success': True, 'message': 'Agent registered successfully', 'server_info': server_info})
+        response = {'success': True, 'message': 'Agent registered successfully', 'server_info': server_info}
+        if issue_token:
+            response['agent_token'] = token
+        return jsonify(response)
     
     except Exception as e:
         return jsonify({'success': False, 'error': f'Registration failed: {str(e)}'}), 500
@@ -589,7 +713,7 @@ def create_terminal_session(server_id):
         socketio.emit('terminal_ready', {
             'session_id': session_id,
             'server_id': server_id
-        })
+        }, to=DASHBOARD_ROOM)
         
         return jsonify({
             'success': True,
@@ -600,6 +724,93 @@ def create_terminal_session(server_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/servers/<server_id>/files', methods=['GET'])
+@jwt_required()
+def get_server_files(server_id):
+    """List remote directory via SFTP (paginated: offset/limit, refresh=1 bypasses cache)"""
+    result = server_manager.get_server_files(
+        server_id,
+        request.args.get('path', '/'),
+        offset=request.args.get('offset', 0, type=int),
+        limit=request.args.get('limit', 500, type=int),
+        refresh=request.args.get('refresh') == '1'
+    )
+    return jsonify(result), (200 if result['success'] else 400)
+
+@app.route('/api/servers/<server_id>/files/stat', methods=['GET'])
+@jwt_required()
+def get_server_file_stat(server_id):
+    """Remote file info including size of unfinished upload for resume"""
+    path = request.args.get('path')
+    if not path:
+        return jsonify({'success': False, 'error': 'Path is required'}), 400
+    try:
+        return jsonify({'success': True, 'file': server_manager.get_server_file_stat(server_id, path)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/servers/<server_id>/files/download', methods=['GET'])
+@jwt_required()
+def download_server_file(server_id):
+    """Stream remote file; Range: bytes=N- resumes interrupted download"""
+    path = request.args.get('path')
+    if not path:
+        return jsonify({'success': False, 'error': 'Path is required'}), 400
+    
+    try:
+        info = server_manager.get_server_file_stat(server_id, path)
+        if not info['exists'] or info['is_directory']:
+            return jsonify({'success': False, 'error': 'File not found'}), 404
+        
+        size = info['size']
+        offset = 0
+        if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1:
+            start, end = request.range.ranges[0]
+            offset = min(start or 0, size)
+        
+        chunks = server_manager.stream_server_file(server_id, path, offset, chunk_size=request.args.get('chunk_size', type=int))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    response = Response(chunks, status=206 if offset else 200, mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(size - offset)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="{info["name"]}"'
+    if offset:
+        response.headers['Content-Range'] = f'bytes {offset}-{size - 1}/{size}'
+    return response
+
+@app.route('/api/servers/<server_id>/files/upload', methods=['POST'])
+@jwt_required()
+def upload_server_file(server_id):
+    """Upload file (or its tail from offset) into directory; progress goes to room transfer_<transfer_id>"""
+    upload = request.files.get('file')
+    directory = request.form.get('path')
+    if not upload or not directory:
+        return jsonify({'success': False, 'error': 'File and path are required'}), 400
+    
+    remote_path = f"{directory.rstrip('/')}/{os.path.basename(upload.filename)}"
+    transfer_id = request.form.get('transfer_id')
+    on_progress = None
+    if transfer_id:
+        def on_progress(progress):
+            socketio.emit('file_transfer_progress', dict(progress, transfer_id=transfer_id), to=f'transfer_{transfer_id}')
+    
+    try:
+        result = server_manager.upload_server_file(
+            server_id, upload.stream, remote_path,
+            offset=request.form.get('offset', 0, type=int),
+            total=request.form.get('total', type=int),
+            complete=request.form.get('complete', '1') != '0',
+            sha256=request.form.get('sha256'),
+            on_progress=on_progress,
+            chunk_size=request.form.get('chunk_size', type=int)
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify(result), (200 if result['success'] else 400)
+
 @app.route('/api/servers/<server_id>/services', methods=['GET'])
 def get_server_services(server_id):
     """Get real services from server"""
@@ -638,7 +849,7 @@ def control_service(server_id, service_name, action):
             'server_id': server_id,
             'service_name': service_name,
             'action': action
-        })
+        }, to=DASHBOARD_ROOM)
         
         return jsonify({
             'success': True,
@@ -769,16 +980,20 @@ def get_security_threats():
                                 'timestamp': datetime.now().isoformat()
                             })
                     
-                    # Проверяем неудачные попытки входа
-                    auth_logs = security_data.get('auth_failures', [])
-                    for log in auth_logs[-5:]:  # Последние 5 попыток
+                    # Проверяем неудачные попытки входа (агрегированы агентом по IP)
+                    auth_failures = security_data.get('auth_failures', [])
+                    for failure in auth_failures[:5]:  # 5 самых активных IP
+                        count = failure.get('count', 1)
                         threats.append({
                             'type': 'Failed Login Attempt',
-                            'severity': 'high',
+                            'severity': 'critical' if count >= 100 else 'high',
                             'server': server['name'],
-                            'description': f"Failed SSH login from {log.get('ip', 'unknown')}",
-                            'source': log.get('ip', 'unknown'),
-                            'timestamp': log.get('timestamp', datetime.now().isoformat())
+                            'description': f"{count} failed SSH logins from {failure.get('ip', 'unknown')}",
+                            'source': failure.get('ip', 'unknown'),
+                            'count': count,
+                            'users': failure.get('users', []),
+                            'first_seen': failure.get('first_seen'),
+                            'timestamp': failure.get('last_seen', failure.get('timestamp', datetime.now().isoformat()))
                         })
         
         return jsonify({
@@ -1022,6 +1237,7 @@ def update_server(server_id):
             'port': int(data.get('port', servers[server_index]['port'])),
             'username': data.get('username', servers[server_index]['username']),
             'description': data.get('description', servers[server_index]['description']),
+            'keep_warm': bool(data.get('keep_warm', servers[server_index].get('keep_warm', False))),
             'updated_at': datetime.now().isoformat()
         })
         
@@ -1029,6 +1245,7 @@ def update_server(server_id):
         with open(servers_file, 'w', encoding='utf-8') as f:
             json.dump(servers, f, ensure_ascii=False, indent=2)
         
+        server_manager.warm_ssh_pool()
         return jsonify({'message': 'Сервер обновлён'})
     
     except Exception as e:
@@ -1108,6 +1325,24 @@ def test_server_connection(server_id):
     except Exception as e:
         return jsonify({'message': f'Ошибка тестирования соединения: {str(e)}'}), 500
 
+@app.route('/api/servers/<server_id>/host-key', methods=['DELETE'])
+@jwt_required()
+def forget_server_host_key(server_id):
+    """Forget stored SSH host key (server was reinstalled and its key changed)"""
+    server = server_manager.get_server_by_id(server_id)
+    if not server:
+        return jsonify({'success': False, 'error': 'Server not found'}), 404
+    
+    ssh_manager.close_connection(str(server_id))
+    removed = ssh_manager.forget_host_key(server['host'], server.get('port', 22))
+    return jsonify({'success': True, 'removed': removed})
+
+@app.route('/api/ssh/pool', methods=['GET'])
+@jwt_required()
+def get_ssh_pool_stats():
+    """SSH connection pool statistics (hits, handshakes, probes, channels)"""
+    return jsonify({'success': True, 'stats': ssh_manager.get_connection_stats()})
+
 @app.route('/api/servers/execute', methods=['POST'])
 @jwt_required()
 def execute_server_command():
@@ -1164,13 +1399,127 @@ def execute_server_command():
     except Exception as e:
         return jsonify({'message': f'Ошибка: {str(e)}', 'success': False}), 500
 
+# Fan-out задачи по флоту (job_id -> прогресс и итог)
+fleet_jobs = {}
+fleet_jobs_lock = threading.Lock()
+FLEET_JOBS_LIMIT = 100
+
+@app.route('/api/servers/execute/fleet', methods=['POST'])
+@jwt_required()
+def execute_fleet_command():
+    """Run command or custom action across servers; per-host results stream to room fleet_<job_id>"""
+    data = request.get_json() or {}
+    command = data.get('command')
+    
+    if data.get('action_id'):
+        action = server_manager.custom_actions.get(data['action_id'])
+        if not action:
+            return jsonify({'success': False, 'error': 'Action not found'}), 404
+        command = action['command']
+    if not command:
+        return jsonify({'success': False, 'error': 'Specify command or action_id'}), 400
+    
+    if data.get('server_ids'):
+        server_ids = [str(server_id) for server_id in data['server_ids']]
+    elif data.get('group'):
+        server_ids = server_manager.get_server_ids_by_group(data['group'])
+    elif data.get('tag'):
+        server_ids = server_manager.get_server_ids_by_tag(data['tag'])
+    elif data.get('all'):
+        server_ids = [str(server['id']) for server in server_manager.get_servers()]
+    else:
+        return jsonify({'success': False, 'error': 'Specify server_ids, group, tag or all'}), 400
+    
+    servers = server_manager.resolve_servers(server_ids)
+    if not servers:
+        return jsonify({'success': False, 'error': 'No matching servers'}), 404
+    
+    # Случайный id: задачи, запущенные в одну миллисекунду, не перетирают друг друга
+    job_id = f"job_{uuid.uuid4().hex}"
+    room = f'fleet_{job_id}'
+    job = {
+        'job_id': job_id,
+        'command': command,
+        'total': len(servers),
+        'completed': 0,
+        'status': 'running',
+        'results': [],
+        'summary': None,
+        'started_at': datetime.now().isoformat()
+    }
+    with fleet_jobs_lock:
+        fleet_jobs[job_id] = job
+        for old_job_id in list(fleet_jobs)[:-FLEET_JOBS_LIMIT]:
+            fleet_jobs.pop(old_job_id, None)
+    
+    def on_result(item):
+        with fleet_jobs_lock:
+            job['results'].append(item)
+            job['completed'] = len(job['results'])
+            completed = job['completed']
+        socketio.emit('fleet_command_result', dict(item, job_id=job_id, completed=completed, total=job['total']), to=room)
+    
+    def run_fleet():
+        try:
+            outcome = server_manager.execute_fleet_command(
+                servers, command,
+                max_workers=data.get('concurrency', 50),
+                timeout=data.get('timeout', 30),
+                on_result=on_result
+            )
+            job['summary'] = outcome['summary']
+            job['status'] = 'completed'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            # Подписчики всегда получают завершение, иначе задача "висит" в running
+            socketio.emit('fleet_command_complete', {
+                'job_id': job_id,
+                'status': job['status'],
+                'summary': job.get('summary'),
+                'error': job.get('error')
+            }, to=room)
+    
+    socketio.start_background_task(run_fleet)
+    
+    return jsonify({'success': True, 'job_id': job_id, 'room': room, 'total': len(servers)})
+
+@app.route('/api/servers/execute/fleet/<job_id>', methods=['GET'])
+@jwt_required()
+def get_fleet_command(job_id):
+    """Progress, per-host results and summary of fan-out job"""
+    with fleet_jobs_lock:
+        job = fleet_jobs.get(job_id)
+        job = dict(job, results=list(job['results'])) if job else None
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(dict(job, success=True))
+
 # SocketIO event handlers
+
+# Socket.IO сессии подключенных агентов (server_id -> sid)
+agent_sessions = {}
+
+def call_agent(server_id, event, data=None, timeout=30):
+    """Send request to connected agent and wait for its acknowledgement"""
+    sid = agent_sessions.get(server_id)
+    if not sid:
+        return None
+    return socketio.server.call(event, data, to=sid, namespace=AGENT_NAMESPACE, timeout=timeout)
+
+def agent_token_for(server_id):
+    """Control channel token of agent (HMAC of server_id, issued once at registration)"""
+    return hmac.new(app.config['SECRET_KEY'].encode('utf-8'), str(server_id).encode('utf-8'), hashlib.sha256).hexdigest()
+
 @socketio.on('connect')
 def handle_connect():
-    """Handle client connection"""
+    """Handle dashboard client connection"""
+    join_room(DASHBOARD_ROOM)
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    ssh_manager.close_terminals(request.sid)
     print('Client disconnected')
 
 @socketio.on('join_room')
@@ -1179,6 +1528,111 @@ def handle_join_room(data):
     if room:
         join_room(room)
         print(f'Client joined room: {room}')
+    # Ack: клиент ждёт подтверждения, прежде чем запускать то, что пишет в комнату
+    return {'success': bool(room), 'room': room}
+
+@socketio.on('connect', namespace=AGENT_NAMESPACE)
+def handle_agent_connect(auth=None):
+    """Agent control channel: accepted only with token issued at registration"""
+    auth = auth or {}
+    server_id = str(auth.get('server_id') or '')
+    token = str(auth.get('token') or '')
+    if not server_id or not hmac.compare_digest(token, agent_token_for(server_id)):
+        print(f'Rejected agent connection: {server_id or "unknown"}')
+        return False
+    
+    join_room(server_id)
+    agent_sessions[server_id] = request.sid
+    print(f'Agent connected: {server_id}')
+
+@socketio.on('disconnect', namespace=AGENT_NAMESPACE)
+def handle_agent_disconnect():
+    for server_id, sid in list(agent_sessions.items()):
+        if sid == request.sid:
+            del agent_sessions[server_id]
+
+@socketio.on('command_output', namespace=AGENT_NAMESPACE)
+def handle_command_output(data):
+    """Relay streamed command output from agent to subscribed browsers"""
+    if request.sid in agent_sessions.values() and data.get('request_id'):
+        socketio.emit('command_output', data, to=f"command_{data['request_id']}")
+
+@socketio.on('command_complete', namespace=AGENT_NAMESPACE)
+def handle_command_complete(data):
+    """Relay streamed command completion from agent to subscribed browsers"""
+    if request.sid in agent_sessions.values() and data.get('request_id'):
+        socketio.emit('command_complete', data, to=f"command_{data['request_id']}")
+
+def get_owned_terminal(data):
+    """PTY session from event data, only if it belongs to the calling browser tab"""
+    session = ssh_manager.get_terminal((data or {}).get('session_id'))
+    if session and session.owner == request.sid:
+        return session
+    return None
+
+@socketio.on('terminal_open')
+def handle_terminal_open(data):
+    """Open interactive PTY shell for this browser tab over pooled SSH transport"""
+    data = data or {}
+    try:
+        decode_token(data.get('token') or '')
+    except Exception:
+        return {'success': False, 'error': 'Unauthorized'}
+    
+    server = server_manager.get_server_by_id(data.get('server_id'))
+    if not server:
+        return {'success': False, 'error': 'Server not found'}
+    
+    sid = request.sid
+    session_id = f"term_{server['id']}_{int(time.time() * 1000)}"
+    
+    def on_output(chunk):
+        # Бинарный фрейм: байты PTY уходят в браузер без перекодирования
+        socketio.emit('terminal_output', {'session_id': session_id, 'data': chunk}, to=sid)
+    
+    def on_close(session):
+        socketio.emit('terminal_closed', {'session_id': session_id}, to=sid)
+    
+    try:
+        conn = server_manager.get_ssh_connection(server)
+        session = ssh_manager.open_terminal(
+            session_id, conn,
+            cols=int(data.get('cols', 80)),
+            rows=int(data.get('rows', 24)),
+            on_output=on_output,
+            on_close=on_close,
+            owner=sid
+        )
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+    
+    if not session:
+        return {'success': False, 'error': 'Failed to open terminal channel'}
+    return {'success': True, 'session_id': session_id}
+
+@socketio.on('terminal_input')
+def handle_terminal_input(data):
+    session = get_owned_terminal(data)
+    if session:
+        session.write(data.get('data', ''))
+
+@socketio.on('terminal_resize')
+def handle_terminal_resize(data):
+    session = get_owned_terminal(data)
+    if session and data.get('cols') and data.get('rows'):
+        session.resize(data['cols'], data['rows'])
+
+@socketio.on('terminal_ack')
+def handle_terminal_ack(data):
+    session = get_owned_terminal(data)
+    if session:
+        session.ack(data.get('bytes', 0))
+
+@socketio.on('terminal_close')
+def handle_terminal_close(data):
+    session = get_owned_terminal(data)
+    if session:
+        session.close()
 
 @socketio.on('cancel_installation')
 def handle_cancel_installation(data):
@@ -1376,7 +1830,8 @@ def restart_agent(agent_id):
 def update_agent(agent_id):
     """Update agent"""
     try:
-        result = server_manager.update_agent(agent_id)
+        panel_address, panel_port = get_panel_endpoint()
+        result = server_manager.update_agent(agent_id, panel_address, panel_port)
         return jsonify({'success': True, 'message': 'Agent updated successfully'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1391,6 +1846,169 @@ def remove_agent_endpoint(agent_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/agents/<agent_id>/request', methods=['POST'])
+@jwt_required()
+def agent_request(agent_id):
+    """Send control request to agent over Socket.IO and return its reply"""
+    data = request.get_json() or {}
+    event = data.get('event')
+    
+    if event not in ('execute_command', 'get_processes', 'manage_service', 'get_logs',
+                     'get_services', 'get_network_connections', 'get_connection_summary',
+                     'get_disk_info', 'get_agent_health'):
+        return jsonify({'success': False, 'error': 'Unsupported agent request'}), 400
+    
+    try:
+        result = call_agent(agent_id, event, data.get('payload', {}), timeout=data.get('timeout', 30))
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Agent did not respond: {str(e)}'}), 504
+    
+    if result is None:
+        return jsonify({'success': False, 'error': 'Agent is not connected'}), 404
+    
+    return jsonify({'success': True, 'data': result})
+
+@app.route('/api/agents/<agent_id>/commands/stream', methods=['POST'])
+@jwt_required()
+def start_agent_command_stream(agent_id):
+    """Start command on agent with output streamed to room command_<request_id>"""
+    data = request.get_json() or {}
+    command = data.get('command')
+    
+    if not command:
+        return jsonify({'success': False, 'error': 'Command is required'}), 400
+    
+    # request_id задаёт браузер: он заходит в комнату command_<request_id> до запуска,
+    # поэтому ранний вывод и command_complete коротких команд не теряются
+    request_id = str(data.get('request_id') or '')
+    if not re.fullmatch(r'[A-Za-z0-9_.-]{1,128}', request_id):
+        request_id = f"cmd_{agent_id}_{int(time.time() * 1000)}"
+    try:
+        result = call_agent(agent_id, 'execute_command_stream', {
+            'command': command,
+            'request_id': request_id,
+            'timeout': data.get('timeout', 600)
+        }, timeout=10)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Agent did not respond: {str(e)}'}), 504
+    
+    if result is None:
+        return jsonify({'success': False, 'error': 'Agent is not connected'}), 404
+    
+    return jsonify({'success': True, 'request_id': request_id, 'room': f'command_{request_id}'})
+
+@app.route('/api/agents/<agent_id>/commands/<request_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_agent_command(agent_id, request_id):
+    """Cancel streaming command running on agent"""
+    try:
+        result = call_agent(agent_id, 'cancel_command', {'request_id': request_id}, timeout=10)
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'Agent did not respond: {str(e)}'}), 504
+    
+    if result is None:
+        return jsonify({'success': False, 'error': 'Agent is not connected'}), 404
+    
+    return jsonify({'success': True, 'cancelled': result.get('cancelled', False)})
+
+AGENT_CONFIG_KEYS = ('heartbeat_interval', 'sample_interval', 'payload_profile', 'collectors',
+                     'collector_intervals', 'compression', 'gzip_min_size', 'alert_thresholds')
+AGENT_PAYLOAD_PROFILES = ('minimal', 'standard', 'full')
+AGENT_HEARTBEAT_INTERVAL_RANGE = (5, 3600)
+AGENT_MIN_SAMPLE_INTERVAL = 0.5
+
+def validate_agent_settings(settings):
+    """Coerce and bound agent settings; returns (settings, error)"""
+    settings = dict(settings)
+    try:
+        if 'heartbeat_interval' in settings:
+            settings['heartbeat_interval'] = float(settings['heartbeat_interval'])
+            low, high = AGENT_HEARTBEAT_INTERVAL_RANGE
+            if not low <= settings['heartbeat_interval'] <= high:
+                return None, f'heartbeat_interval must be between {low} and {high} seconds'
+        if 'sample_interval' in settings:
+            settings['sample_interval'] = float(settings['sample_interval'])
+            if settings['sample_interval'] < AGENT_MIN_SAMPLE_INTERVAL:
+                return None, f'sample_interval must be at least {AGENT_MIN_SAMPLE_INTERVAL} seconds'
+        if 'collector_intervals' in settings:
+            settings['collector_intervals'] = {
+                str(name): float(interval) for name, interval in settings['collector_intervals'].items()
+            }
+            if any(interval <= 0 for interval in settings['collector_intervals'].values()):
+                return None, 'collector_intervals must be positive'
+        if 'gzip_min_size' in settings:
+            settings['gzip_min_size'] = int(settings['gzip_min_size'])
+            if settings['gzip_min_size'] < 0:
+                return None, 'gzip_min_size must not be negative'
+        if 'compression' in settings:
+            settings['compression'] = bool(settings['compression'])
+        if 'collectors' in settings:
+            settings['collectors'] = {str(name): bool(on) for name, on in settings['collectors'].items()}
+        if 'alert_thresholds' in settings:
+            settings['alert_thresholds'] = {
+                str(name): float(value) for name, value in settings['alert_thresholds'].items()
+            }
+    except (TypeError, ValueError, AttributeError, OverflowError):
+        return None, 'Invalid agent settings values'
+    
+    # float() принимает 'nan' и 'inf' - такие значения агенту не отправляем
+    numbers = [settings.get('heartbeat_interval', 30), settings.get('sample_interval', 1)]
+    numbers += list(settings.get('collector_intervals', {}).values()) + list(settings.get('alert_thresholds', {}).values())
+    if not all(math.isfinite(number) for number in numbers):
+        return None, 'Invalid agent settings values'
+    
+    if settings.get('payload_profile', 'standard') not in AGENT_PAYLOAD_PROFILES:
+        return None, 'Unknown payload profile'
+    return settings, None
+
+@app.route('/api/agents/config', methods=['POST'])
+@jwt_required()
+def push_agent_config():
+    """Push versioned sampling/payload config to agents (list, group or whole fleet)"""
+    data = request.get_json() or {}
+    settings = data.get('settings') or {}
+    if not isinstance(settings, dict):
+        return jsonify({'success': False, 'error': 'Settings must be an object'}), 400
+    
+    unknown = [key for key in settings if key not in AGENT_CONFIG_KEYS]
+    if not settings or unknown:
+        return jsonify({'success': False, 'error': f'Unsupported settings: {unknown}' if unknown else 'Settings are required'}), 400
+    settings, error = validate_agent_settings(settings)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    if data.get('server_ids'):
+        server_ids = [str(server_id) for server_id in data['server_ids']]
+    elif data.get('group'):
+        server_ids = server_manager.get_server_ids_by_group(data['group'])
+    elif data.get('all'):
+        server_ids = [str(server['id']) for server in server_manager.get_servers()]
+    else:
+        return jsonify({'success': False, 'error': 'Specify server_ids, group or all'}), 400
+    
+    if not server_ids:
+        return jsonify({'success': False, 'error': 'No matching servers'}), 404
+    
+    version = server_manager.set_agent_config(server_ids, settings)
+    
+    # Подключённым агентам отправляем сразу, остальные получат с ответом на heartbeat
+    pushed = []
+    for server_id in server_ids:
+        sid = agent_sessions.get(server_id)
+        if sid:
+            config = server_manager.get_agent_config(server_id)
+            socketio.emit('update_config', {'version': version, 'config': config['settings']}, to=sid, namespace=AGENT_NAMESPACE)
+            pushed.append(server_id)
+    
+    return jsonify({'success': True, 'version': version, 'servers': server_ids, 'pushed_live': pushed})
+
+@app.route('/api/agents/<agent_id>/config', methods=['GET'])
+@jwt_required()
+def get_agent_config(agent_id):
+    """Get config currently assigned to agent"""
+    config = server_manager.get_agent_config(agent_id)
+    return jsonify({'success': True, 'config': config or {'version': 0, 'settings': {}}})
+
 # Duplicate function removed - using the real implementation above
 
 @app.route('/api/security/firewall', methods=['GET'])
@@ -1731,4 +2349,7 @@ def get_realtime_metrics():
 if __name__ == '__main__':
     # Run the application with eventlet
     port = int(os.getenv('PORT', 5000))
+    # С debug перезагрузчик запускает копию процесса - фоновые задачи только в ней
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     socketio.run(app, host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,10 @@
+"""
+Gunicorn config - picked up automatically from the working directory
+(gunicorn --worker-class eventlet -w 1 app:app)
+"""
+
+
+def post_worker_init(worker):
+    # Фоновые задачи панели запускаем в рабочем процессе, а не при импорте app
+    from app import start_background_services
+    start_background_services()
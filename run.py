@@ -9,7 +9,7 @@ import sys
 import eventlet
 eventlet.monkey_patch()
 
-from app import app, socketio
+from app import app, socketio, start_background_services
 
 if __name__ == '__main__':
     # Set production environment
@@ -20,7 +20,8 @@ if __name__ == '__main__':
     host = os.environ.get('HOST', '0.0.0.0')
     
     print(f"Starting Xpanel on {host}:{port}")
-    
+    start_background_services()
+        
     # Run with SocketIO and eventlet
     print("Using eventlet server for WebSocket support")
     socketio.run(
@@ -5,18 +5,65 @@ Server Manager - Handles VPS server connections and operations
 import paramiko
 import psutil
 import json
+import copy
 import uuid
-import os
 import io
+import hashlib
+import os
+import stat
+import posixpath
 from datetime import datetime
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agent_bundle import get_install_script, get_agent_source, AGENT_PATH, SERVICE_NAME
+from ssh_manager import ssh_manager
+from sftp_transfer import SFTPTransfer, PART_SUFFIX
+
+# Кэш листингов каталогов (server_id, path) -> записи; сбрасывается при записи в каталог
+DIR_CACHE_TTL = 10
+DIR_CACHE_MAX_ENTRIES = 256
+DIR_PAGE_LIMIT = 500
+DIR_READ_AHEAD = 64
+
+# Один скрипт собирает все метрики за одно выполнение (без top/free/df/uptime по отдельности)
+STATS_PROBE_SCRIPT = r'''
+read -r _ u n s i w q sq st _ < /proc/stat
+sleep 0.3
+read -r _ u2 n2 s2 i2 w2 q2 sq2 st2 _ < /proc/stat
+echo "cpu_ticks=$(( (u2+n2+s2+q2+sq2+st2) - (u+n+s+q+sq+st) )) $(( (u2+n2+s2+i2+w2+q2+sq2+st2) - (u+n+s+i+w+q+sq+st) ))"
+awk '/^MemTotal:/{t=$2} /^MemAvailable:/{a=$2} END{print "mem_kb=" t " " a}' /proc/meminfo
+df -Pk / | awk 'NR==2{print "disk_kb=" $2 " " $3 " " $4}'
+echo "uptime=$(cut -d' ' -f1 /proc/uptime)"
+echo "load=$(cut -d' ' -f1-3 /proc/loadavg)"
+echo "cpus=$(grep -c '^processor' /proc/cpuinfo)"
+echo "hostname=$(hostname)"
+'''
+
+# История метрик на сервер (живые heartbeat + буфер, досланный агентом после обрыва)
+STATS_HISTORY_MAX_SAMPLES = 2880
+STATS_HISTORY_KEYS = ('cpu_percent', 'memory_percent', 'disk_percent', 'load_average', 'uptime')
+
+# Агентless опрос серверов без агента
+AGENTLESS_POLL_INTERVAL = 30
+AGENTLESS_POLL_WORKERS = 20
+AGENT_FRESH_SECONDS = 120
+
+# Параллельность fan-out команд по флоту
+FLEET_DEFAULT_WORKERS = 50
+FLEET_MAX_WORKERS = 200
 
 class ServerManager:
     def __init__(self):
         self.servers = {}
         self.connections = {}
         self.custom_actions = {}
+        self.agent_config_lock = threading.Lock()
+        self.agent_configs = None
+        self.dir_cache = {}
+        self.dir_cache_lock = threading.Lock()
+        self.stats_history = {}
+        self.stats_history_lock = threading.Lock()
         
     def add_server(self, name, host, port=22, username=None, password=None, key_file=None):
         """Add a new server to management"""
@@ -67,6 +114,44 @@ class ServerManager:
             return True
         return False
     
+    def get_ssh_connection(self, server):
+        """Pooled SSH connection for server (transport is reused between actions)"""
+        conn = ssh_manager.get_connection(
+            str(server['id']),
+            server['host'],
+            server.get('port', 22),
+            server.get('username'),
+            password=server.get('password'),
+            key_file=server.get('key_file'),
+            key_data=server.get('ssh_key')
+        )
+        if not conn:
+            raise Exception(f"SSH connection to {server['host']} failed")
+        return conn
+    
+    def warm_ssh_pool(self):
+        """Sync pre-warmed SSH connections with servers marked keep_warm"""
+        warm_ids = set()
+        for server in self.get_servers():
+            if not server.get('keep_warm'):
+                continue
+            server_id = str(server['id'])
+            warm_ids.add(server_id)
+            ssh_manager.add_warm_server(
+                server_id,
+                server['host'],
+                server.get('port', 22),
+                server.get('username'),
+                password=server.get('password'),
+                key_file=server.get('key_file'),
+                key_data=server.get('ssh_key')
+            )
+        
+        for server_id in list(ssh_manager.warm_servers):
+            if server_id not in warm_ids:
+                ssh_manager.remove_warm_server(server_id)
+        return sorted(warm_ids)
+    
     def remove_agent_from_server(self, server_id):
         """Remove agent from remote server"""
         if server_id not in self.servers:
@@ -75,24 +160,8 @@ class ServerManager:
         server = self.servers[server_id]
         
         try:
-            # Connect to server
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            if server['key_file']:
-                ssh.connect(
-                    hostname=server['host'],
-                    port=server['port'],
-                    username=server['username'],
-                    key_filename=server['key_file']
-                )
-            else:
-                ssh.connect(
-                    hostname=server['host'],
-                    port=server['port'],
-                    username=server['username'],
-                    password=server['password']
-                )
+            # Connect to server (pooled)
+            conn = self.get_ssh_connection(server)
             
             # Commands to remove agent
             remove_commands = [
@@ -105,10 +174,7 @@ class ServerManager:
             ]
             
             for cmd in remove_commands:
-                stdin, stdout, stderr = ssh.exec_command(cmd)
-                stdout.read()  # Wait for command to complete
-            
-            ssh.close()
+                conn.execute_command(cmd, get_pty=False)  # Wait for command to complete
             
             # Update server status
             self.servers[server_id]['status'] = 'agent_removed'
@@ -183,36 +249,14 @@ class ServerManager:
         server = self.servers[server_id]
         
         try:
-            # Connect to server
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            if server['key_file']:
-                ssh.connect(
-                    hostname=server['host'],
-                    port=server['port'],
-                    username=server['username'],
-                    key_filename=server['key_file']
-                )
-            else:
-                ssh.connect(
-                    hostname=server['host'],
-                    port=server['port'],
-                    username=server['username'],
-                    password=server['password']
-                )
-            
-            # Execute command
-            stdin, stdout, stderr = ssh.exec_command(command)
-            output = stdout.read().decode('utf-8')
-            error = stderr.read().decode('utf-8')
-            
-            ssh.close()
+            # Execute command over pooled connection
+            result = self.get_ssh_connection(server).execute_command(command, get_pty=False)
+            error = result.get('error')
             
             if error:
                 raise Exception(f"Command failed: {error}")
             
-            return output
+            return result.get('output', '')
             
         except Exception as e:
             raise Exception(f"Failed to execute action: {str(e)}")
@@ -287,74 +331,287 @@ class ServerManager:
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def get_server_stats(self, server_id):
-        """Get server system statistics"""
-        if server_id not in self.servers:
-            return {'error': 'Server not found'}
+    def parse_stats_probe(self, output):
+        """Structured stats from STATS_PROBE_SCRIPT key=value output"""
+        raw = {}
+        for line in output.splitlines():
+            if '=' in line:
+                key, value = line.split('=', 1)
+                raw[key.strip()] = value.strip()
         
-        # Try to get stats via SSH command
-        commands = {
-            'cpu': "top -bn1 | grep 'Cpu(s)' | awk '{print $2}' | cut -d'%' -f1",
-            'memory': "free -m | awk 'NR==2{printf \"%.1f\", $3*100/$2}'",
-            'disk': "df -h / | awk 'NR==2{print $5}' | cut -d'%' -f1",
-            'uptime': "uptime -p",
-            'load': "uptime | awk -F'load average:' '{print $2}'"
-        }
+        def numbers(key):
+            try:
+                return [float(part) for part in raw.get(key, '').split()]
+            except ValueError:
+                return []
+        
+        stats = {'hostname': raw.get('hostname')}
+        
+        cpu_ticks = numbers('cpu_ticks')
+        if len(cpu_ticks) == 2 and cpu_ticks[1] > 0:
+            stats['cpu_percent'] = round(cpu_ticks[0] / cpu_ticks[1] * 100, 1)
+        
+        mem_kb = numbers('mem_kb')
+        if len(mem_kb) == 2 and mem_kb[0] > 0:
+            stats['memory_total'] = int(mem_kb[0] * 1024)
+            stats['memory_available'] = int(mem_kb[1] * 1024)
+            stats['memory_percent'] = round((mem_kb[0] - mem_kb[1]) / mem_kb[0] * 100, 1)
+        
+        disk_kb = numbers('disk_kb')
+        if len(disk_kb) == 3 and disk_kb[0] > 0:
+            stats['disk_total'] = int(disk_kb[0] * 1024)
+            stats['disk_used'] = int(disk_kb[1] * 1024)
+            stats['disk_percent'] = round(disk_kb[1] / (disk_kb[1] + disk_kb[2]) * 100, 1) if disk_kb[1] + disk_kb[2] else 0
+        
+        uptime = numbers('uptime')
+        if uptime:
+            stats['uptime'] = int(uptime[0])
+        
+        load = numbers('load')
+        if len(load) == 3:
+            stats['load_average'] = load
+        
+        cpus = numbers('cpus')
+        if cpus:
+            stats['cpu_count'] = int(cpus[0])
+        return stats
+    
+    def probe_server_stats(self, server, timeout=15):
+        """Collect all agentless metrics in one exec over pooled SSH transport"""
+        result = self.get_ssh_connection(server).execute_command(STATS_PROBE_SCRIPT, timeout=timeout, get_pty=False)
+        if not result.get('success'):
+            raise Exception(result.get('error') or f"Stats probe exited with {result.get('exit_code')}")
+        return self.parse_stats_probe(result.get('output', ''))
+    
+    def get_live_agent_keys(self):
+        """Server ids and IPs of agents that reported within AGENT_FRESH_SECONDS"""
+        now = datetime.now()
+        keys = {'ids': set(), 'ips': set()}
+        for cache_key, entry in list(getattr(self, 'agent_cache', {}).items()):
+            if entry.get('source') == 'ssh' or not entry.get('last_update'):
+                continue
+            if (now - datetime.fromisoformat(entry['last_update'])).total_seconds() >= AGENT_FRESH_SECONDS:
+                continue
+            keys['ids'].add(str(cache_key))
+            ip_address = (entry.get('host_identity') or {}).get('ip_address')
+            if ip_address:
+                keys['ips'].add(str(ip_address))
+        return keys
+    
+    def has_live_agent(self, server, live_keys=None):
+        """True if an agent on this server updated cache recently"""
+        live_keys = self.get_live_agent_keys() if live_keys is None else live_keys
+        # Агент пишет в кэш под своим id (hostname-MAC); при регистрации он запоминается
+        # у SSH-сервера как agent_server_id. По IP сопоставляем, только пока связи нет
+        if server.get('agent_server_id'):
+            return str(server['agent_server_id']) in live_keys['ids']
+        if str(server.get('id')) in live_keys['ids']:
+            return True
+        return any(str(key) in live_keys['ips'] for key in (server.get('host'), server.get('ip')) if key)
+    
+    def get_agentless_servers(self):
+        """SSH-managed servers whose agent has not reported recently (polled over SSH instead)"""
+        live_keys = self.get_live_agent_keys()
+        # Записи, созданные регистрацией агента, без SSH-адреса опросить нельзя
+        return [server for server in self.get_servers()
+                if server.get('host') and not self.has_live_agent(server, live_keys)]
+    
+    def poll_agentless_servers(self, on_stats=None, max_workers=AGENTLESS_POLL_WORKERS):
+        """One polling round: probe every server without a live agent in parallel"""
+        servers = self.get_agentless_servers()
+        if not servers:
+            return 0
+        
+        if not hasattr(self, 'agent_cache'):
+            self.agent_cache = {}
+        
+        def poll(server):
+            stats = self.probe_server_stats(server)
+            stats['last_update'] = datetime.now().isoformat()
+            stats['source'] = 'ssh'
+            return server, stats
+        
+        polled = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(servers)))) as pool:
+            futures = [pool.submit(poll, server) for server in servers]
+            for future in as_completed(futures):
+                try:
+                    server, stats = future.result()
+                except Exception as e:
+                    print(f"Agentless poll failed: {e}")
+                    continue
+                
+                # Кэш тот же, что у агентов - дашборды показывают сервер без изменений;
+                # агент, ответивший во время опроса, не перетираем
+                if self.has_live_agent(server):
+                    continue
+                self.agent_cache[server['id']] = stats
+                polled += 1
+                if on_stats:
+                    try:
+                        on_stats(server['id'], stats)
+                    except Exception as e:
+                        print(f"Error delivering agentless stats: {e}")
+        return polled
+    
+    def start_agentless_polling(self, interval=AGENTLESS_POLL_INTERVAL, on_stats=None):
+        """Background scheduler polling servers without agents every interval seconds"""
+        if getattr(self, 'agentless_thread', None) and self.agentless_thread.is_alive():
+            return self.agentless_thread
         
-        stats = {
-            'server_id': server_id,
-            'timestamp': datetime.now().isoformat(),
-            'status': self.servers[server_id]['status']
+        def loop():
+            while True:
+                started = time.time()
+                try:
+                    self.poll_agentless_servers(on_stats)
+                except Exception as e:
+                    print(f"Agentless polling error: {e}")
+                time.sleep(max(1.0, interval - (time.time() - started)))
+        
+        self.agentless_thread = threading.Thread(target=loop, daemon=True)
+        self.agentless_thread.start()
+        return self.agentless_thread
+    
+    def get_server_connection(self, server_id):
+        """Pooled SSH connection by server ID (raises if server is unknown or unreachable)"""
+        servers = self.resolve_servers([server_id])
+        if not servers:
+            raise Exception("Server not found")
+        return self.get_ssh_connection(servers[0])
+    
+    def describe_file_attr(self, attr):
+        """File entry for file browser from SFTPAttributes"""
+        mode = attr.st_mode or 0
+        return {
+            'name': getattr(attr, 'filename', ''),
+            'size': attr.st_size,
+            'permissions': stat.filemode(mode),
+            'modified': datetime.fromtimestamp(attr.st_mtime).strftime('%b %d %H:%M') if attr.st_mtime else '',
+            'mtime': attr.st_mtime,
+            'uid': attr.st_uid,
+            'gid': attr.st_gid,
+            'is_directory': stat.S_ISDIR(mode),
+            'is_link': stat.S_ISLNK(mode)
         }
+    
+    def list_server_directory(self, server_id, path):
+        """All entries of remote directory (dirs first, by name) via pipelined READDIR"""
+        conn = self.get_server_connection(server_id)
+        sftp = conn.get_sftp()
+        if not sftp:
+            raise Exception('SFTP is not available')
+        
+        with conn.sftp_lock:
+            if hasattr(sftp, 'listdir_iter'):
+                entries = list(sftp.listdir_iter(path, read_aheads=DIR_READ_AHEAD))
+            else:
+                entries = sftp.listdir_attr(path)
+        
+        files = [self.describe_file_attr(attr) for attr in entries]
+        files.sort(key=lambda item: (not item['is_directory'], item['name']))
+        return files
+    
+    def invalidate_file_cache(self, server_id, path=None):
+        """Drop cached listing of directory (or of every directory on server)"""
+        server_id = str(server_id)
+        with self.dir_cache_lock:
+            for key in list(self.dir_cache):
+                if key[0] == server_id and (path is None or key[1] == posixpath.normpath(path)):
+                    del self.dir_cache[key]
+    
+    def get_server_files(self, server_id, path='/', offset=0, limit=DIR_PAGE_LIMIT, refresh=False):
+        """Get page of file listing from server via SFTP (short-TTL per-path cache)"""
+        path = posixpath.normpath(path or '/')
+        key = (str(server_id), path)
+        now = time.time()
+        
+        with self.dir_cache_lock:
+            cached = self.dir_cache.get(key)
+        cache_hit = bool(cached) and not refresh and now - cached[0] < DIR_CACHE_TTL
         
-        if server_id in self.connections or self.connect_to_server(server_id):
-            for stat_name, command in commands.items():
-                result = self.execute_command(server_id, command)
-                if result['success']:
-                    stats[stat_name] = result['output'].strip()
-                else:
-                    stats[stat_name] = 'N/A'
+        if cache_hit:
+            files = cached[1]
         else:
-            # Server not connected, return placeholder data
-            stats.update({
-                'cpu': 'N/A',
-                'memory': 'N/A',
-                'disk': 'N/A',
-                'uptime': 'N/A',
-                'load': 'N/A'
-            })
+            try:
+                files = self.list_server_directory(server_id, path)
+            except Exception as e:
+                return {'success': False, 'error': str(e)}
+            
+            with self.dir_cache_lock:
+                self.dir_cache[key] = (now, files)
+                if len(self.dir_cache) > DIR_CACHE_MAX_ENTRIES:
+                    oldest = min(self.dir_cache, key=lambda item: self.dir_cache[item][0])
+                    del self.dir_cache[oldest]
         
-        return stats
+        offset = max(0, int(offset))
+        limit = max(1, int(limit))
+        return {
+            'success': True,
+            'files': files[offset:offset + limit],
+            'path': path,
+            'total': len(files),
+            'offset': offset,
+            'limit': limit,
+            'has_more': offset + limit < len(files),
+            'cached': cache_hit
+        }
     
-    def get_server_files(self, server_id, path='/'):
-        """Get file listing from server"""
-        command = f"ls -la {path}"
-        result = self.execute_command(server_id, command)
+    def get_server_file_stat(self, server_id, path):
+        """Size/mtime of remote file plus size of unfinished upload (for resume)"""
+        conn = self.get_server_connection(server_id)
+        sftp = conn.get_sftp()
+        if not sftp:
+            raise Exception('SFTP is not available')
         
-        if result['success']:
-            files = []
-            lines = result['output'].strip().split('\n')[1:]  # Skip first line (total)
-            
-            for line in lines:
-                if line.strip():
-                    parts = line.split()
-                    if len(parts) >= 9:
-                        files.append({
-                            'permissions': parts[0],
-                            'size': parts[4],
-                            'modified': ' '.join(parts[5:8]),
-                            'name': ' '.join(parts[8:]),
-                            'is_directory': parts[0].startswith('d')
-                        })
-            
-            return {'success': True, 'files': files, 'path': path}
+        with conn.sftp_lock:
+            try:
+                info = self.describe_file_attr(sftp.stat(path))
+                info['name'] = posixpath.basename(path)
+                info['exists'] = True
+            except IOError:
+                info = {'name': posixpath.basename(path), 'exists': False}
+            try:
+                info['part_size'] = sftp.stat(path + PART_SUFFIX).st_size
+            except IOError:
+                info['part_size'] = 0
+        info['path'] = path
+        return info
+    
+    def stream_server_file(self, server_id, path, offset=0, length=None, chunk_size=None):
+        """Generator of remote file chunks from offset (own SFTP session, pipelined reads)"""
+        conn = self.get_server_connection(server_id)
+        transfer = SFTPTransfer(conn, **({'chunk_size': chunk_size} if chunk_size else {}))
+        
+        def generate():
+            # Сессия открывается при первом чтении, чтобы не держать слот канала, если ответ не начали отдавать
+            sftp = conn.open_sftp_session()
+            if not sftp:
+                raise Exception('Failed to open SFTP session')
+            try:
+                for data in transfer.iter_remote(sftp, path, offset, length):
+                    yield data
+            finally:
+                conn.close_sftp_session(sftp)
         
-        return result
+        return generate()
+    
+    def upload_server_file(self, server_id, fileobj, path, offset=0, total=None, complete=True,
+                           sha256=None, on_progress=None, chunk_size=None):
+        """Write uploaded stream to remote path (resumable via offset, verified by sha256)"""
+        conn = self.get_server_connection(server_id)
+        transfer = SFTPTransfer(conn, on_progress=on_progress, **({'chunk_size': chunk_size} if chunk_size else {}))
+        try:
+            return transfer.upload_fileobj(fileobj, path, offset=offset, total=total, complete=complete,
+                                           verify=True, expected_sha256=sha256)
+        finally:
+            # Каталог изменился (.part или готовый файл) - листинг из кэша устарел
+            self.invalidate_file_cache(server_id, posixpath.dirname(path))
     
     def remove_server(self, server_id):
         """Remove server from management"""
         if server_id in self.connections:
             self.disconnect_from_server(server_id)
+        ssh_manager.close_connection(str(server_id))
         
         if server_id in self.servers:
             del self.servers[server_id]
@@ -548,30 +805,11 @@ class ServerManager:
                 if not server:
                     raise Exception('Server not found')
                 
-                # Connect via SSH and restart agent
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                
-                if server.get('ssh_key'):
-                    key = paramiko.RSAKey.from_private_key(io.StringIO(server['ssh_key']))
-                    ssh.connect(
-                        hostname=server['host'],
-                        port=server['port'],
-                        username=server['username'],
-                        pkey=key
-                    )
-                else:
-                    ssh.connect(
-                        hostname=server['host'],
-                        port=server['port'],
-                        username=server['username'],
-                        password=server.get('password', '')
-                    )
+                # Connect via SSH (pooled) and restart agent
+                conn = self.get_ssh_connection(server)
                 
                 # Restart agent service
-                stdin, stdout, stderr = ssh.exec_command('sudo systemctl restart xpanel-agent')
-                stdout.read()
-                ssh.close()
+                conn.execute_command('sudo systemctl restart xpanel-agent', get_pty=False)
                 
                 return {'success': True, 'message': 'Agent restarted successfully'}
             else:
@@ -580,8 +818,8 @@ class ServerManager:
         except Exception as e:
             raise Exception(f'Failed to restart agent: {str(e)}')
     
-    def update_agent(self, agent_id):
-        """Update agent on server"""
+    def update_agent(self, agent_id, panel_address, panel_port=5000):
+        """Update agent on server with the panel's bundled agent source"""
         try:
             servers_file = 'servers.json'
             if os.path.exists(servers_file):
@@ -592,38 +830,27 @@ class ServerManager:
                 if not server:
                     raise Exception('Server not found')
                 
-                # Connect via SSH and update agent
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                # Connect via SSH (pooled) and update agent
+                conn = self.get_ssh_connection(server)
                 
-                if server.get('ssh_key'):
-                    key = paramiko.RSAKey.from_private_key(io.StringIO(server['ssh_key']))
-                    ssh.connect(
-                        hostname=server['host'],
-                        port=server['port'],
-                        username=server['username'],
-                        pkey=key
-                    )
-                else:
-                    ssh.connect(
-                        hostname=server['host'],
-                        port=server['port'],
-                        username=server['username'],
-                        password=server.get('password', '')
-                    )
-                
-                # Update agent
-                update_commands = [
-                    'cd /opt/xpanel-agent',
-                    'sudo wget -O xpanel_agent.py https://raw.githubusercontent.com/xpanel/agent/main/xpanel_agent.py',
-                    'sudo systemctl restart xpanel-agent'
-                ]
-                
-                for cmd in update_commands:
-                    stdin, stdout, stderr = ssh.exec_command(cmd)
-                    stdout.read()
+                # Тот же агент, что ставят установщики; пишем во временный файл по SFTP
+                # (с проверкой sha256), на место кладём через sudo - каталог агента принадлежит root
+                source = get_agent_source(panel_address, panel_port).encode('utf-8')
+                temp_path = f'/tmp/xpanel_agent_{uuid.uuid4().hex}.py'
+                upload = SFTPTransfer(conn).upload_fileobj(
+                    io.BytesIO(source), temp_path, total=len(source),
+                    expected_sha256=hashlib.sha256(source).hexdigest()
+                )
+                if not upload['success']:
+                    raise Exception(f"Upload failed: {upload.get('error')}")
                 
-                ssh.close()
+                result = conn.execute_command(
+                    f'sudo install -m 755 {temp_path} {AGENT_PATH}; status=$?; rm -f {temp_path}; '
+                    f'[ $status -eq 0 ] && sudo systemctl restart {SERVICE_NAME}',
+                    get_pty=False
+                )
+                if not result.get('success'):
+                    raise Exception(result.get('error') or f"exit code {result.get('exit_code')}")
                 
                 return {'success': True, 'message': 'Agent updated successfully'}
             else:
@@ -644,25 +871,8 @@ class ServerManager:
                 if not server:
                     raise Exception('Server not found')
                 
-                # Connect via SSH and remove agent
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                
-                if server.get('ssh_key'):
-                    key = paramiko.RSAKey.from_private_key(io.StringIO(server['ssh_key']))
-                    ssh.connect(
-                        hostname=server['host'],
-                        port=server['port'],
-                        username=server['username'],
-                        pkey=key
-                    )
-                else:
-                    ssh.connect(
-                        hostname=server['host'],
-                        port=server['port'],
-                        username=server['username'],
-                        password=server.get('password', '')
-                    )
+                # Connect via SSH (pooled) and remove agent
+                conn = self.get_ssh_connection(server)
                 
                 # Remove agent
                 remove_commands = [
@@ -674,10 +884,7 @@ class ServerManager:
                 ]
                 
                 for cmd in remove_commands:
-                    stdin, stdout, stderr = ssh.exec_command(cmd)
-                    stdout.read()
-                
-                ssh.close()
+                    conn.execute_command(cmd, get_pty=False)
                 
                 return {'success': True, 'message': 'Agent removed successfully'}
             else:
@@ -730,7 +937,7 @@ class ServerManager:
                 return {
                     'processes': agent_data.get('processes', []),
                     'auth_failures': agent_data.get('auth_failures', []),
-                    'network_connections': agent_data.get('network_connections', []),
+                    'network_connections': agent_data.get('network_connections', {}),
                     'system_logs': agent_data.get('system_logs', [])
                 }
             
@@ -744,6 +951,16 @@ class ServerManager:
         if not hasattr(self, 'agent_cache'):
             self.agent_cache = {}
         
+        # Агент присылает только новые строки журнала - дописываем их к предыдущим
+        system_logs = data.get('system_logs', [])
+        if isinstance(system_logs, dict):
+            system_logs = system_logs.get('logs', [])
+        previous_logs = self.agent_cache.get(server_id, {}).get('system_logs', [])
+        system_logs = (previous_logs + system_logs)[-100:]
+        
+        # Идентичность хоста агент присылает только при изменении
+        host_identity = data.get('host_identity') or self.agent_cache.get(server_id, {}).get('host_identity')
+        
         self.agent_cache[server_id] = {
             'cpu_percent': data.get('cpu_percent', 0),
             'memory_percent': data.get('memory_percent', 0),
@@ -752,12 +969,181 @@ class ServerManager:
             'processes': data.get('processes', []),
             'services': data.get('services', []),
             'auth_failures': data.get('auth_failures', []),
-            'network_connections': data.get('network_connections', []),
-            'system_logs': data.get('system_logs', []),
+            'network_connections': data.get('network_connections', {}),
+            'system_logs': system_logs,
+            'aggregates': data.get('aggregates'),
+            'agent_health': data.get('agent_health'),
+            'host_identity': host_identity,
             'uptime': data.get('uptime', 0),
             'last_update': datetime.now().isoformat()
         }
+        self.record_stats_history(server_id, [dict(data, timestamp=data.get('timestamp') or datetime.now().isoformat())])
+    
+    @staticmethod
+    def summarize_agent_stats(sample):
+        """Flat history metrics from agent payload (nested cpu/memory/disk) or already flat sample"""
+        summary = {key: sample[key] for key in STATS_HISTORY_KEYS if key in sample}
+        
+        # Агент шлёт cpu.usage, memory.percent и disk[mountpoint].percent
+        cpu = sample.get('cpu')
+        if isinstance(cpu, dict) and 'usage' in cpu:
+            summary['cpu_percent'] = cpu['usage']
+        memory = sample.get('memory')
+        if isinstance(memory, dict) and 'percent' in memory:
+            summary['memory_percent'] = memory['percent']
+        disk = sample.get('disk')
+        if isinstance(disk, dict):
+            root = disk.get('/') or next((usage for usage in disk.values() if isinstance(usage, dict)), None)
+            if isinstance(root, dict) and 'percent' in root:
+                summary['disk_percent'] = root['percent']
+        
+        if sample.get('timestamp'):
+            summary['timestamp'] = sample['timestamp']
+        return summary
+    
+    def record_stats_history(self, server_id, samples):
+        """Merge samples into server history ordered by timestamp; returns compact samples added"""
+        compact = [
+            self.summarize_agent_stats(sample)
+            for sample in samples if isinstance(sample, dict) and sample.get('timestamp')
+        ]
+        if not compact:
+            return []
+        
+        with self.stats_history_lock:
+            # Досланные агентом выборки старше живых - вставляем по времени, дубликаты отбрасываем
+            merged = {sample['timestamp']: sample for sample in self.stats_history.get(server_id, [])}
+            merged.update((sample['timestamp'], sample) for sample in compact)
+            self.stats_history[server_id] = sorted(merged.values(), key=lambda s: s['timestamp'])[-STATS_HISTORY_MAX_SAMPLES:]
+        return compact
+    
+    def get_stats_history(self, server_id, since=None):
+        """Stored metric samples of server, optionally only newer than since (ISO timestamp)"""
+        with self.stats_history_lock:
+            history = list(self.stats_history.get(server_id, []))
+        if since:
+            history = [sample for sample in history if sample['timestamp'] > since]
+        return history
 
+    def load_agent_configs(self):
+        """Load versioned agent configs pushed from the panel (cached, file is read once)"""
+        # Конфиг нужен на каждый heartbeat - держим в памяти, set_agent_config обновляет кэш
+        if self.agent_configs is None:
+            configs_file = 'agent_configs.json'
+            if os.path.exists(configs_file):
+                with open(configs_file, 'r', encoding='utf-8') as f:
+                    self.agent_configs = json.load(f)
+            else:
+                self.agent_configs = {'version': 0, 'servers': {}}
+        return self.agent_configs
+    
+    def get_agent_config(self, server_id):
+        """Get current config ({'version', 'settings'}) for agent"""
+        try:
+            return self.load_agent_configs()['servers'].get(str(server_id))
+        except Exception as e:
+            print(f"Error loading agent config: {e}")
+            return None
+    
+    def set_agent_config(self, server_ids, settings):
+        """Merge settings into config of each agent under a new version number"""
+        with self.agent_config_lock:
+            # Правим копию: при ошибке записи кэш остаётся равен файлу
+            configs = copy.deepcopy(self.load_agent_configs())
+            
+            # Единый счётчик версий - агент применяет только более новую конфигурацию
+            version = configs.get('version', 0) + 1
+            configs['version'] = version
+            for server_id in server_ids:
+                current = configs['servers'].get(str(server_id), {}).get('settings', {})
+                merged = dict(current)
+                merged.update(settings)
+                configs['servers'][str(server_id)] = {
+                    'version': version,
+                    'settings': merged,
+                    'updated_at': datetime.now().isoformat()
+                }
+            
+            with open('agent_configs.json', 'w', encoding='utf-8') as f:
+                json.dump(configs, f, ensure_ascii=False, indent=2)
+            self.agent_configs = configs
+        
+        return version
+    
+    def get_server_ids_by_group(self, group):
+        """IDs of servers whose 'group' field matches"""
+        return [str(server['id']) for server in self.get_servers() if server.get('group') == group]
+    
+    def get_server_ids_by_tag(self, tag):
+        """IDs of servers having tag in their 'tags' list"""
+        return [str(server['id']) for server in self.get_servers() if tag in (server.get('tags') or [])]
+    
+    def resolve_servers(self, server_ids):
+        """Server records for IDs (servers.json first, then in-memory servers)"""
+        known = {str(server['id']): server for server in self.servers.values()}
+        known.update({str(server['id']): server for server in self.get_servers()})
+        return [known[str(server_id)] for server_id in server_ids if str(server_id) in known]
+    
+    def execute_fleet_command(self, servers, command, max_workers=FLEET_DEFAULT_WORKERS, timeout=30, on_result=None):
+        """Run command on many servers in parallel; on_result(item) is called per host as it completes"""
+        started = time.time()
+        results = []
+        
+        def run_on_server(server):
+            host_started = time.time()
+            try:
+                result = self.get_ssh_connection(server).execute_command(command, timeout=timeout, get_pty=False)
+            except Exception as e:
+                result = {'success': False, 'error': str(e), 'exit_code': -1}
+            
+            return {
+                'server_id': str(server['id']),
+                'name': server.get('name'),
+                'host': server['host'],
+                'success': result.get('success', False),
+                'exit_code': result.get('exit_code', -1),
+                'output': result.get('output', ''),
+                'error': result.get('error'),
+                'duration_ms': round((time.time() - host_started) * 1000, 1)
+            }
+        
+        workers = max(1, min(int(max_workers), FLEET_MAX_WORKERS, len(servers) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_on_server, server) for server in servers]
+            for future in as_completed(futures):
+                item = future.result()
+                results.append(item)
+                if on_result:
+                    try:
+                        on_result(item)
+                    except Exception as e:
+                        print(f"Error delivering fleet result: {e}")
+        
+        return {
+            'results': results,
+            'summary': self.summarize_fleet_results(results, time.time() - started)
+        }
+    
+    def summarize_fleet_results(self, results, elapsed, slowest=10):
+        """Aggregate fan-out results: exit-code histogram and slowest hosts"""
+        exit_codes = {}
+        for item in results:
+            code = str(item['exit_code'])
+            exit_codes[code] = exit_codes.get(code, 0) + 1
+        
+        by_duration = sorted(results, key=lambda item: item['duration_ms'], reverse=True)
+        return {
+            'total': len(results),
+            'succeeded': sum(1 for item in results if item['success']),
+            'failed': sum(1 for item in results if not item['success']),
+            'exit_codes': exit_codes,
+            'slowest_hosts': [
+                {key: item[key] for key in ('server_id', 'name', 'host', 'exit_code', 'duration_ms')}
+                for item in by_duration[:slowest]
+            ],
+            'duration_ms': round(elapsed * 1000, 1)
+        }
+    
     def update_server_status(self, server_id, status, agent_installed=None):
         """Update server status"""
         try:
@@ -832,493 +1218,20 @@ class ServerManager:
         server = self.servers[server_id]
         
         try:
-            # Connect to server
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
-            if server['key_file']:
-                ssh.connect(
-                    hostname=server['host'],
-                    port=server['port'],
-                    username=server['username'],
-                    key_filename=server['key_file']
-                )
-            else:
-                ssh.connect(
-                    hostname=server['host'],
-                    port=server['port'],
-                    username=server['username'],
-                    password=server['password']
-                )
-            
-            # Execute command
-            stdin, stdout, stderr = ssh.exec_command(command)
-            output = stdout.read().decode('utf-8')
-            error = stderr.read().decode('utf-8')
-            
-            ssh.close()
+            # Execute command over pooled connection
+            result = self.get_ssh_connection(server).execute_command(command, get_pty=False)
             
             return {
-                'success': True,
-                'output': output,
-                'error': error if error else None
+                'success': bool(result.get('success')),
+                'output': result.get('output', ''),
+                'error': result.get('error'),
+                'exit_code': result.get('exit_code')
             }
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-    def generate_install_script(self, panel_address):
+    def generate_install_script(self, panel_address, panel_port=5000):
         """Generate agent installation script"""
-        script_template = '''#!/bin/bash
-
-# Xpanel Agent Auto-Installation Script
-# Generated automatically by Xpanel Control Panel
-
-set -e
-
-# Colors for output
-RED='\\033[0;31m'
-GREEN='\\033[0;32m'
-YELLOW='\\033[1;33m'
-BLUE='\\033[0;34m'
-NC='\\033[0m' # No Color
-
-# Configuration
-AGENT_USER="xpanel-agent"
-AGENT_DIR="/opt/xpanel-agent"
-SERVICE_NAME="xpanel-agent"
-PANEL_ADDRESS="{panel_address}"
-PANEL_PORT="5000"
-
-echo -e "${BLUE}========================================${NC}"
-echo -e "${BLUE}    Xpanel Agent Auto-Installation${NC}"
-echo -e "${BLUE}========================================${NC}"
-
-# Function to print status
-print_status() {
-    echo -e "${GREEN}[INFO]${NC} $1"
-}
-
-print_warning() {
-    echo -e "${YELLOW}[WARNING]${NC} $1"
-}
-
-print_error() {
-    echo -e "${RED}[ERROR]${NC} $1"
-}
-
-# Check if running as root
-if [[ $EUID -ne 0 ]]; then
-   print_error "This script must be run as root (use sudo)"
-   exit 1
-fi
-
-# Detect package manager and install dependencies
-print_status "Installing dependencies..."
-if command -v apt-get &> /dev/null; then
-    apt-get update -qq
-    apt-get install -y python3 python3-pip python3-venv curl wget
-elif command -v yum &> /dev/null; then
-    yum install -y python3 python3-pip curl wget
-elif command -v dnf &> /dev/null; then
-    dnf install -y python3 python3-pip curl wget
-else
-    print_error "Unsupported package manager"
-    exit 1
-fi
-
-# Create agent user
-print_status "Creating agent user..."
-if ! id "$AGENT_USER" &>/dev/null; then
-    useradd -r -s /bin/false -d "$AGENT_DIR" "$AGENT_USER"
-fi
-
-# Create agent directory
-print_status "Creating agent directory..."
-mkdir -p "$AGENT_DIR"
-cd "$AGENT_DIR"
-
-# Download agent script
-print_status "Downloading agent..."
-cat > xpanel_agent.py << 'AGENT_SCRIPT_EOF'
-#!/usr/bin/env python3
-import os
-import sys
-import time
-import json
-import psutil
-import socket
-import requests
-import subprocess
-import threading
-from datetime import datetime
-import logging
-
-class XpanelAgent:
-    def __init__(self, panel_address="{panel_address}", panel_port=5000, server_id=None):
-        self.panel_address = panel_address
-        self.panel_port = panel_port
-        self.server_id = server_id or self.generate_server_id()
-        self.running = False
-        self.heartbeat_interval = 30
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('/opt/xpanel-agent/xpanel-agent.log'),
-                logging.StreamHandler()
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
-        
-    def generate_server_id(self):
-        hostname = socket.gethostname()
-        try:
-            import uuid
-            mac = ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) 
-                           for elements in range(0,2*6,2)][::-1])
-            return f"{hostname}-{mac}"
-        except:
-            return hostname
-    
-    def get_system_stats(self):
-        try:
-            cpu_percent = psutil.cpu_percent(interval=1)
-            cpu_count = psutil.cpu_count()
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            network = psutil.net_io_counters()
-            load_avg = os.getloadavg() if hasattr(os, 'getloadavg') else [0, 0, 0]
-            boot_time = psutil.boot_time()
-            uptime = time.time() - boot_time
-            
-            stats = {
-                'server_id': self.server_id,
-                'timestamp': datetime.now().isoformat(),
-                'cpu': {
-                    'usage': cpu_percent,
-                    'cores': cpu_count
-                },
-                'memory': {
-                    'total': memory.total,
-                    'available': memory.available,
-                    'used': memory.used,
-                    'percent': memory.percent
-                },
-                'disk': {
-                    'total': disk.total,
-                    'used': disk.used,
-                    'free': disk.free,
-                    'percent': (disk.used / disk.total) * 100
-                },
-                'network': {
-                    'bytes_sent': network.bytes_sent,
-                    'bytes_recv': network.bytes_recv,
-                    'packets_sent': network.packets_sent,
-                    'packets_recv': network.packets_recv
-                },
-                'load_average': load_avg,
-                'uptime': uptime
-            }
-            
-            return stats
-        except Exception as e:
-            self.logger.error(f"Error collecting system stats: {e}")
-            return None
-    
-    def send_heartbeat(self):
-        try:
-            stats = self.get_system_stats()
-            if not stats:
-                return False
-                
-            url = f"http://{self.panel_address}:{self.panel_port}/api/agent/heartbeat"
-            response = requests.post(
-                url,
-                json=stats,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                self.logger.debug("Heartbeat sent successfully")
-                return True
-            else:
-                self.logger.warning(f"Heartbeat failed: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error sending heartbeat: {e}")
-            return False
-    
-    def register_with_panel(self):
-        try:
-            server_info = {
-                'server_id': self.server_id,
-                'hostname': socket.gethostname(),
-                'ip_address': self.get_local_ip(),
-                'os_info': self.get_os_info(),
-                'agent_version': '1.0.0',
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            url = f"http://{self.panel_address}:{self.panel_port}/api/agent/register"
-            response = requests.post(
-                url,
-                json=server_info,
-                timeout=10,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                self.logger.info("Successfully registered with control panel")
-                return True
-            else:
-                self.logger.error(f"Registration failed: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error registering with panel: {e}")
-            return False
-    
-    def get_local_ip(self):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except:
-            return "127.0.0.1"
-    
-    def get_os_info(self):
-        try:
-            import platform
-            return {
-                'system': platform.system(),
-                'release': platform.release(),
-                'version': platform.version(),
-                'machine': platform.machine(),
-                'processor': platform.processor()
-            }
-        except:
-            return {'system': 'Unknown'}
-    
-    def heartbeat_loop(self):
-        while self.running:
-            self.send_heartbeat()
-            time.sleep(self.heartbeat_interval)
-    
-    def start(self):
-        self.logger.info(f"Starting Xpanel Agent (ID: {self.server_id})")
-        self.logger.info(f"Panel address: {self.panel_address}:{self.panel_port}")
-        
-        if not self.register_with_panel():
-            self.logger.error("Failed to register with panel, continuing anyway...")
-        
-        self.running = True
-        
-        heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
-        heartbeat_thread.start()
-        
-        self.logger.info("Agent started successfully")
-        
-        try:
-            while self.running:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.logger.info("Received interrupt signal, stopping agent...")
-            self.stop()
-    
-    def stop(self):
-        self.running = False
-        self.logger.info("Agent stopped")
-
-if __name__ == '__main__':
-    agent = XpanelAgent()
-    agent.start()
-AGENT_SCRIPT_EOF
-
-# Install Python dependencies
-print_status "Installing Python dependencies..."
-pip3 install psutil requests
-
-# Make agent executable
-chmod +x xpanel_agent.py
-chown -R $AGENT_USER:$AGENT_USER "$AGENT_DIR"
-
-# Create systemd service
-print_status "Creating systemd service..."
-cat > /etc/systemd/system/$SERVICE_NAME.service << SERVICE_EOF
-[Unit]
-Description=Xpanel Agent
-After=network.target
-
-[Service]
-Type=simple
-User=$AGENT_USER
-WorkingDirectory=$AGENT_DIR
-ExecStart=/usr/bin/python3 $AGENT_DIR/xpanel_agent.py
-Restart=always
-RestartSec=10
-
-[Install]
-WantedBy=multi-user.target
-SERVICE_EOF
-
-# Enable and start service
-print_status "Starting agent service..."
-systemctl daemon-reload
-systemctl enable $SERVICE_NAME
-systemctl start $SERVICE_NAME
-
-# Check service status
-if systemctl is-active --quiet $SERVICE_NAME; then
-    print_status "Agent installed and started successfully!"
-    print_status "Service status: $(systemctl is-active $SERVICE_NAME)"
-else
-    print_error "Failed to start agent service"
-    systemctl status $SERVICE_NAME
-    exit 1
-fi
-
-print_status "Installation completed successfully!"
-echo -e "${GREEN}Agent is now running and sending data to panel${NC}"
-'''
-
-        # Read agent script content
-        agent_script_path = "agent/xpanel_agent.py"
-        try:
-            with open(agent_script_path, 'r', encoding='utf-8') as f:
-                agent_script = f.read()
-        except FileNotFoundError:
-            # Fallback agent script if file not found
-            agent_script = self.get_fallback_agent_script()
-
-        return script_template.format(
-            panel_address=panel_address,
-            agent_script=agent_script
-        )
-
-    def get_fallback_agent_script(self):
-        """Fallback agent script content"""
-        return '''#!/usr/bin/env python3
-import os
-import sys
-import time
-import json
-import psutil
-import socket
-import requests
-import subprocess
-import threading
-from datetime import datetime
-import argparse
-import logging
-
-class XpanelAgent:
-    def __init__(self, panel_address="64.188.70.12", panel_port=5000):
-        self.panel_address = panel_address
-        self.panel_port = panel_port
-        self.server_id = self.generate_server_id()
-        self.running = False
-        self.heartbeat_interval = 30
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('/opt/xpanel-agent/xpanel-agent.log'),
-                logging.StreamHandler()
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
-        
-    def generate_server_id(self):
-        hostname = socket.gethostname()
-        try:
-            import uuid
-            mac = ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) 
-                           for elements in range(0,2*6,2)][::-1])
-            return f"{hostname}-{mac}"
-        except:
-            return hostname
-    
-    def get_system_stats(self):
-        try:
-            cpu_percent = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            network = psutil.net_io_counters()
-            
-            return {
-                'server_id': self.server_id,
-                'timestamp': datetime.now().isoformat(),
-                'cpu': {'usage': cpu_percent, 'cores': psutil.cpu_count()},
-                'memory': {
-                    'total': memory.total,
-                    'used': memory.used,
-                    'percent': memory.percent
-                },
-                'disk': {
-                    'total': disk.total,
-                    'used': disk.used,
-                    'percent': (disk.used / disk.total) * 100
-                },
-                'network': {
-                    'bytes_sent': network.bytes_sent,
-                    'bytes_recv': network.bytes_recv
-                }
-            }
-        except Exception as e:
-            self.logger.error(f"Error collecting stats: {e}")
-            return None
-    
-    def send_heartbeat(self):
-        try:
-            stats = self.get_system_stats()
-            if not stats:
-                return False
-                
-            url = f"http://{self.panel_address}:{self.panel_port}/api/agent/heartbeat"
-            response = requests.post(url, json=stats, timeout=10)
-            return response.status_code == 200
-        except Exception as e:
-            self.logger.error(f"Heartbeat error: {e}")
-            return False
-    
-    def heartbeat_loop(self):
-        while self.running:
-            self.send_heartbeat()
-            time.sleep(self.heartbeat_interval)
-    
-    def start(self):
-        self.logger.info(f"Starting Xpanel Agent (ID: {self.server_id})")
-        self.running = True
-        
-        heartbeat_thread = threading.Thread(target=self.heartbeat_loop, daemon=True)
-        heartbeat_thread.start()
-        
-        try:
-            while self.running:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            self.stop()
-    
-    def stop(self):
-        self.running = False
-        self.logger.info("Agent stopped")
-
-def main():
-    parser = argparse.ArgumentParser(description='Xpanel VPS Agent')
-    parser.add_argument('--panel-address', default='64.188.70.12')
-    parser.add_argument('--panel-port', type=int, default=5000)
-    args = parser.parse_args()
-    
-    agent = XpanelAgent(args.panel_address, args.panel_port)
-    agent.start()
-
-if __name__ == '__main__':
-    main()
-'''
+        # Скрипт встраивает то же ядро агента, что ставит SSH-установщик
+        return get_install_script(panel_address, panel_port)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+SFTP Transfer - Передача файлов поверх пулового SSH соединения
+Конвейерные чтение/запись чанками, докачка с offset, проверка sha256, события прогресса
+"""
+
+import os
+import time
+import shlex
+import hashlib
+import logging
+from typing import Callable, Dict, Iterator, Optional
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Сколько SFTP-запросов чтения держим в полете на один файл
+DEFAULT_MAX_REQUESTS = 64
+# Чанков в одном окне readv (ограничивает память под предвыборку)
+READV_WINDOW = 8
+PROGRESS_INTERVAL = 0.25
+PART_SUFFIX = '.part'
+
+
+class TransferProgress:
+    """Считает переданные байты и вызывает callback не чаще PROGRESS_INTERVAL"""
+    
+    def __init__(self, path: str, total: int, offset: int = 0, callback: Optional[Callable] = None):
+        self.path = path
+        self.total = total
+        self.transferred = offset
+        self.offset = offset
+        self.callback = callback
+        self.started = time.time()
+        self.last_report = 0.0
+    
+    def add(self, nbytes: int, force: bool = False):
+        self.transferred += nbytes
+        now = time.time()
+        if self.callback and (force or now - self.last_report >= PROGRESS_INTERVAL):
+            self.last_report = now
+            try:
+                self.callback(self.snapshot())
+            except Exception:
+                pass
+    
+    def rate(self) -> float:
+        elapsed = time.time() - self.started
+        return (self.transferred - self.offset) / elapsed if elapsed > 0 else 0.0
+    
+    def snapshot(self) -> Dict:
+        return {
+            'path': self.path,
+            'transferred': self.transferred,
+            'total': self.total,
+            'percent': round(self.transferred / self.total * 100, 1) if self.total else 100.0,
+            'rate_bps': round(self.rate())
+        }
+
+
+class SFTPTransfer:
+    """Передача одного или нескольких файлов через отдельную SFTP-сессию соединения"""
+    
+    def __init__(self, conn, chunk_size: int = DEFAULT_CHUNK_SIZE, max_requests: int = DEFAULT_MAX_REQUESTS,
+                 on_progress: Optional[Callable] = None):
+        self.conn = conn
+        self.chunk_size = max(32 * 1024, int(chunk_size))
+        self.max_requests = max(1, int(max_requests))
+        self.on_progress = on_progress
+        self.logger = logging.getLogger(f"SFTP-{conn.host}")
+    
+    def _readv(self, remote, chunks):
+        """Конвейерное чтение: все запросы окна уходят сразу, ответы приходят по порядку"""
+        try:
+            return remote.readv(chunks, max_concurrent_prefetch_requests=self.max_requests)
+        except TypeError:
+            # paramiko < 3: без ограничения числа запросов
+            return remote.readv(chunks)
+    
+    def _result(self, progress: TransferProgress, sha256: Optional[str], verified) -> Dict:
+        progress.add(0, force=True)
+        return {
+            'success': verified is not False,
+            'error': 'Checksum mismatch' if verified is False else None,
+            'path': progress.path,
+            'size': progress.total,
+            'resumed_from': progress.offset,
+            'sha256': sha256,
+            'verified': verified,
+            'duration_ms': round((time.time() - progress.started) * 1000, 1),
+            'rate_bps': round(progress.rate())
+        }
+    
+    def remote_sha256(self, remote_path: str) -> Optional[str]:
+        """sha256 файла на сервере (считается там, без повторной передачи)"""
+        result = self.conn.execute_command(f"sha256sum {shlex.quote(remote_path)}", timeout=600, get_pty=False)
+        if not result.get('success') or not result.get('output'):
+            return None
+        return result['output'].split()[0]
+    
+    def iter_remote(self, sftp, remote_path: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        """Генератор чанков удаленного файла начиная с offset (для потоковой отдачи в HTTP)"""
+        with sftp.open(remote_path, 'rb') as remote:
+            size = remote.stat().st_size
+            end = size if length is None else min(size, offset + length)
+            position = offset
+            while position < end:
+                window = []
+                while position < end and len(window) < READV_WINDOW:
+                    window.append((position, min(self.chunk_size, end - position)))
+                    position += window[-1][1]
+                for data in self._readv(remote, window):
+                    yield data
+    
+    def download(self, remote_path: str, local_path: str, resume: bool = True, verify: bool = True) -> Dict:
+        """Скачать файл: пишем в local_path.part, докачиваем с его размера, после проверки переименовываем"""
+        part_path = local_path + PART_SUFFIX
+        sftp = self.conn.open_sftp_session()
+        if not sftp:
+            return {'success': False, 'error': 'Не удалось открыть SFTP сессию'}
+        
+        try:
+            size = sftp.stat(remote_path).st_size
+            offset = os.path.getsize(part_path) if resume and os.path.exists(part_path) else 0
+            if offset > size:
+                offset = 0
+            
+            digest = hashlib.sha256()
+            if offset and verify:
+                with open(part_path, 'rb') as existing:
+                    for block in iter(lambda: existing.read(self.chunk_size), b''):
+                        digest.update(block)
+            
+            progress = TransferProgress(remote_path, size, offset, self.on_progress)
+            with open(part_path, 'ab' if offset else 'wb') as local:
+                for data in self.iter_remote(sftp, remote_path, offset):
+                    local.write(data)
+                    if verify:
+                        digest.update(data)
+                    progress.add(len(data))
+            
+            # sha256sum идет своим каналом: отдаем слот SFTP-сессии, иначе при занятых
+            # max_channels команда ждала бы слот, который держим мы сами
+            self.conn.close_sftp_session(sftp)
+            sftp = None
+            
+            sha256 = digest.hexdigest() if verify else None
+            verified = None
+            if verify:
+                remote_hash = self.remote_sha256(remote_path)
+                verified = (remote_hash == sha256) if remote_hash else None
+            
+            if verified is False:
+                os.remove(part_path)
+            else:
+                os.replace(part_path, local_path)
+            return self._result(progress, sha256, verified)
+        
+        except Exception as e:
+            self.logger.error(f"Ошибка скачивания {remote_path}: {e}")
+            return {'success': False, 'error': str(e), 'path': remote_path}
+        finally:
+            if sftp:
+                self.conn.close_sftp_session(sftp)
+    
+    def upload_fileobj(self, fileobj, remote_path: str, offset: int = 0, total: Optional[int] = None,
+                       complete: bool = True, verify: bool = True, expected_sha256: Optional[str] = None) -> Dict:
+        """Записать поток в remote_path.part с offset; при complete - проверить и переименовать"""
+        part_path = remote_path + PART_SUFFIX
+        sftp = self.conn.open_sftp_session()
+        if not sftp:
+            return {'success': False, 'error': 'Не удалось открыть SFTP сессию'}
+        
+        try:
+            if offset:
+                # Дописываем только ровно с конца .part: неверный offset молча испортил бы файл
+                try:
+                    actual = sftp.stat(part_path).st_size
+                except IOError:
+                    actual = 0
+                if actual != offset:
+                    return {
+                        'success': False,
+                        'error': f'Offset {offset} does not match uploaded size {actual}',
+                        'path': remote_path,
+                        'expected_offset': actual
+                    }
+            
+            progress = TransferProgress(remote_path, total or 0, offset, self.on_progress)
+            remote = sftp.open(part_path, 'r+b' if offset else 'wb')
+            try:
+                # Конвейерная запись: не ждем подтверждения каждого пакета, ошибки проверяются при close
+                remote.set_pipelined(True)
+                remote.seek(offset)
+                for block in iter(lambda: fileobj.read(self.chunk_size), b''):
+                    remote.write(block)
+                    progress.add(len(block))
+            finally:
+                remote.close()
+            
+            if not progress.total:
+                progress.total = progress.transferred
+            if not complete:
+                return self._result(progress, None, None)
+            
+            verified = None
+            sha256 = None
+            # sha256sum читает весь файл на сервере - считаем только когда есть с чем сравнить
+            if verify and expected_sha256:
+                # Слот SFTP-сессии на время sha256sum освобождаем (см. download)
+                self.conn.close_sftp_session(sftp)
+                sftp = None
+                sha256 = self.remote_sha256(part_path)
+                if sha256:
+                    verified = sha256 == expected_sha256.lower()
+                sftp = self.conn.open_sftp_session()
+                if not sftp:
+                    return {'success': False, 'error': 'Не удалось открыть SFTP сессию', 'path': remote_path}
+                        
+            if verified is False:
+                sftp.remove(part_path)
+            else:
+                sftp.posix_rename(part_path, remote_path)
+            return self._result(progress, sha256, verified)
+        
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки {remote_path}: {e}")
+            return {'success': False, 'error': str(e), 'path': remote_path}
+        finally:
+            if sftp:
+                self.conn.close_sftp_session(sftp)
+    
+    def upload(self, local_path: str, remote_path: str, resume: bool = True, verify: bool = True) -> Dict:
+        """Загрузить локальный файл: докачка с размера remote_path.part, проверка sha256"""
+        size = os.path.getsize(local_path)
+        offset = 0
+        if resume:
+            offset = self.remote_size(remote_path + PART_SUFFIX) or 0
+            if offset > size:
+                offset = 0
+        
+        expected = None
+        if verify:
+            digest = hashlib.sha256()
+            with open(local_path, 'rb') as local:
+                for block in iter(lambda: local.read(self.chunk_size), b''):
+                    digest.update(block)
+            expected = digest.hexdigest()
+        
+        with open(local_path, 'rb') as local:
+            local.seek(offset)
+            return self.upload_fileobj(local, remote_path, offset=offset, total=size,
+                                       verify=verify, expected_sha256=expected)
+    
+    def remote_size(self, remote_path: str) -> Optional[int]:
+        """Размер удаленного файла или None, если его нет"""
+        sftp = self.conn.get_sftp()
+        if not sftp:
+            return None
+        # Общий SFTP клиент - один запрос за раз
+        with self.conn.sftp_lock:
+            try:
+                return sftp.stat(remote_path).st_size
+            except IOError:
+                return None
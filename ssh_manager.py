@@ -5,6 +5,10 @@ SSH Manager - Улучшенный менеджер SSH подключений 
 """
 
 import paramiko
+import io
+import codecs
+import hashlib
+import select
 import socket
 import threading
 import time
@@ -15,30 +19,211 @@ from datetime import datetime
 from typing import Dict, Optional, Tuple, List
 import queue
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sftp_transfer import SFTPTransfer
+
+# Сколько exec-каналов одновременно открываем на одном транспорте
+# (OpenSSH по умолчанию MaxSessions 10, оставляем запас под SFTP)
+DEFAULT_MAX_CHANNELS = int(os.environ.get('XPANEL_SSH_MAX_CHANNELS', 8))
+
+# Здоровье пула: keepalive транспорта, фоновая проверка простаивающих соединений
+SSH_KEEPALIVE_INTERVAL = 30
+PROBE_INTERVAL = 15
+PROBE_IDLE_SECONDS = 30
+PROBE_TIMEOUT = 5
+IDLE_CLOSE_SECONDS = 1800
+# Проверки и прогрев идут параллельно: мертвый хост не задерживает обслуживание остальных
+MAINTENANCE_WORKERS = 16
+WARM_CONNECT_TIMEOUT = 10
+
+# Хранилище ключей хостов (формат OpenSSH known_hosts)
+KNOWN_HOSTS_FILE = 'ssh_known_hosts'
+
+# Буфер чтения потока: растет при большом выводе
+STREAM_BUFFER_MIN = 32 * 1024
+STREAM_BUFFER_MAX = 1024 * 1024
+
+# PTY терминал: чтение приостанавливается, пока браузер не подтвердит вывод сверх окна
+TERMINAL_WINDOW_BYTES = 256 * 1024
+TERMINAL_READ_SIZE = 64 * 1024
+
+
+class LineAssembler:
+    """Собирает строки из чанков потока (строка и UTF-8 символ могут быть разрезаны между чанками)"""
+    
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.tail = ''
+    
+    def feed(self, data: bytes) -> List[str]:
+        """Добавить чанк, вернуть завершенные строки"""
+        lines = (self.tail + self.decoder.decode(data)).split('\n')
+        self.tail = lines.pop()
+        return [line.rstrip('\r') for line in lines]
+    
+    def flush(self) -> List[str]:
+        """Вернуть незавершенный хвост"""
+        text = self.tail + self.decoder.decode(b'', final=True)
+        self.tail = ''
+        return [text.rstrip('\r')] if text else []
+
+
+class PrivateKeyCache:
+    """Кэш разобранных приватных ключей: файл - по пути+mtime, строка - по хешу содержимого"""
+    
+    KEY_CLASSES = (paramiko.RSAKey, paramiko.Ed25519Key, paramiko.ECDSAKey)
+    
+    def __init__(self):
+        self.keys = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key_file: str = None, key_data: str = None):
+        """Вернуть PKey (или None, если ключ не разбирается ни одним типом)"""
+        if key_file and os.path.exists(key_file):
+            stat = os.stat(key_file)
+            cache_key = ('file', os.path.abspath(key_file), stat.st_mtime_ns, stat.st_size)
+            load = lambda key_class: key_class.from_private_key_file(key_file)
+        elif key_data:
+            cache_key = ('data', hashlib.sha256(key_data.encode('utf-8')).hexdigest())
+            load = lambda key_class: key_class.from_private_key(io.StringIO(key_data))
+        else:
+            return None
+        
+        with self.lock:
+            if cache_key in self.keys:
+                self.hits += 1
+                return self.keys[cache_key]
+        
+        key = None
+        for key_class in self.KEY_CLASSES:
+            try:
+                key = load(key_class)
+                break
+            except Exception:
+                continue
+        
+        with self.lock:
+            self.misses += 1
+            if cache_key[0] == 'file':
+                # Старые версии того же файла больше не нужны
+                for stale in [k for k in self.keys if k[0] == 'file' and k[1] == cache_key[1]]:
+                    del self.keys[stale]
+            self.keys[cache_key] = key
+        return key
+    
+    def clear(self):
+        with self.lock:
+            self.keys.clear()
+
+
+class KnownHostsStore:
+    """Постоянное хранилище ключей хостов: первый ключ запоминается, смена ключа - отказ в подключении"""
+    
+    def __init__(self, filename: str = KNOWN_HOSTS_FILE):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.host_keys = paramiko.HostKeys()
+        if os.path.exists(filename):
+            try:
+                self.host_keys.load(filename)
+            except Exception as e:
+                logging.getLogger("SSHManager").error(f"Не удалось прочитать {filename}: {e}")
+    
+    @staticmethod
+    def host_entry(host: str, port: int = 22) -> str:
+        return host if int(port) == 22 else f'[{host}]:{port}'
+    
+    def prepare_client(self, client, host: str, port: int = 22):
+        """Передать клиенту известный ключ хоста (только его, без копии всего файла)"""
+        entry = self.host_entry(host, port)
+        with self.lock:
+            known = self.host_keys.lookup(entry)
+            if known:
+                for key_type, key in known.items():
+                    client.get_host_keys().add(entry, key_type, key)
+        client.set_missing_host_key_policy(TrustOnFirstUsePolicy(self))
+    
+    def add(self, entry: str, key):
+        with self.lock:
+            self.host_keys.add(entry, key.get_name(), key)
+            try:
+                with open(self.filename, 'a', encoding='utf-8') as f:
+                    f.write(f"{entry} {key.get_name()} {key.get_base64()}\n")
+            except Exception as e:
+                logging.getLogger("SSHManager").error(f"Не удалось сохранить ключ хоста {entry}: {e}")
+    
+    def remove(self, host: str, port: int = 22) -> bool:
+        """Забыть ключ хоста (сервер переустановлен) и переписать файл"""
+        entry = self.host_entry(host, port)
+        with self.lock:
+            if entry not in self.host_keys:
+                return False
+            del self.host_keys[entry]
+            self.host_keys.save(self.filename)
+        return True
+
+
+class TrustOnFirstUsePolicy(paramiko.MissingHostKeyPolicy):
+    """Неизвестный хост: запомнить ключ в KnownHostsStore (несовпадение ключа paramiko отклонит сам)"""
+    
+    def __init__(self, store: KnownHostsStore):
+        self.store = store
+    
+    def missing_host_key(self, client, hostname, key):
+        self.store.add(hostname, key)
+        client.get_host_keys().add(hostname, key.get_name(), key)
+
+
+private_key_cache = PrivateKeyCache()
+known_hosts = KnownHostsStore()
+
 
 class SSHConnection:
     """Класс для управления одним SSH соединением"""
     
     def __init__(self, host: str, port: int = 22, username: str = None, 
-                 password: str = None, key_file: str = None, timeout: int = 30):
+                 password: str = None, key_file: str = None, timeout: int = 30,
+                 key_data: str = None, max_channels: int = DEFAULT_MAX_CHANNELS,
+                 on_handshake=None):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.key_file = key_file
+        self.key_data = key_data
         self.timeout = timeout
         self.ssh_client = None
         self.sftp_client = None
+        # Общий SFTP клиент (листинги, stat) - один запрос за раз
+        self.sftp_lock = threading.Lock()
         self.connected = False
         self.last_activity = None
-        self.connection_lock = threading.Lock()
+        self.last_probe = None
+        self.on_handshake = on_handshake
+        # RLock: connect() вызывает disconnect() под этой же блокировкой
+        self.connection_lock = threading.RLock()
+        self.connecting = False
+        
+        # Параллельные каналы поверх одного транспорта
+        self.max_channels = max(1, int(max_channels))
+        self.channel_slots = threading.BoundedSemaphore(self.max_channels)
+        self.channel_lock = threading.Lock()
+        self.active_channels = 0
         
         # Настройка логирования
         self.logger = logging.getLogger(f"SSH-{host}")
         
+    def _load_private_key(self):
+        """Приватный ключ из файла или из строки (ssh_key в servers.json), через кэш"""
+        return private_key_cache.get(self.key_file, self.key_data)
+    
     def connect(self) -> bool:
         """Установить SSH соединение"""
         with self.connection_lock:
+            self.connecting = True
             try:
                 if self.connected and self.ssh_client:
                     # Проверяем активность соединения
@@ -53,7 +238,7 @@ class SSHConnection:
                 self.disconnect()
                 
                 self.ssh_client = paramiko.SSHClient()
-                self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                known_hosts.prepare_client(self.ssh_client, self.host, self.port)
                 
                 # Настройки подключения
                 connect_kwargs = {
@@ -66,19 +251,14 @@ class SSHConnection:
                 }
                 
                 # Аутентификация
-                if self.key_file and os.path.exists(self.key_file):
+                if (self.key_file and os.path.exists(self.key_file)) or self.key_data:
                     # SSH ключ
-                    try:
-                        key = paramiko.RSAKey.from_private_key_file(self.key_file)
+                    key = self._load_private_key()
+                    if key:
                         connect_kwargs['pkey'] = key
-                    except:
-                        try:
-                            key = paramiko.Ed25519Key.from_private_key_file(self.key_file)
-                            connect_kwargs['pkey'] = key
-                        except:
-                            # Если ключ не загружается, используем пароль
-                            if self.password:
-                                connect_kwargs['password'] = self.password
+                    elif self.password:
+                        # Если ключ не загружается, используем пароль
+                        connect_kwargs['password'] = self.password
                 elif self.password:
                     # Пароль
                     connect_kwargs['password'] = self.password
@@ -86,7 +266,23 @@ class SSHConnection:
                     self.logger.error("Не указан пароль или SSH ключ")
                     return False
                 
-                self.ssh_client.connect(**connect_kwargs)
+                started = time.time()
+                handshake_ok = False
+                try:
+                    self.ssh_client.connect(**connect_kwargs)
+                    handshake_ok = True
+                finally:
+                    if self.on_handshake:
+                        self.on_handshake((time.time() - started) * 1000, handshake_ok)
+                
+                # Keepalive: NAT/файрвол не рвет простаивающий транспорт, обрыв виден раньше
+                transport = self.ssh_client.get_transport()
+                transport.set_keepalive(SSH_KEEPALIVE_INTERVAL)
+                try:
+                    transport.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                except Exception:
+                    pass
+                
                 self.connected = True
                 self.last_activity = datetime.now()
                 
@@ -96,6 +292,9 @@ class SSHConnection:
             except paramiko.AuthenticationException as e:
                 self.logger.error(f"Ошибка аутентификации SSH: {e}")
                 return False
+            except paramiko.BadHostKeyException as e:
+                self.logger.error(f"Ключ хоста {self.host} не совпадает с сохраненным в {known_hosts.filename}: {e}")
+                return False
             except paramiko.SSHException as e:
                 self.logger.error(f"Ошибка SSH: {e}")
                 return False
@@ -105,6 +304,30 @@ class SSHConnection:
             except Exception as e:
                 self.logger.error(f"Неожиданная ошибка SSH: {e}")
                 return False
+            finally:
+                self.connecting = False
+    
+    def acquire_channel(self, timeout: float = 30) -> bool:
+        """Занять слот канала (не больше max_channels одновременных команд на транспорт)"""
+        if not self.channel_slots.acquire(timeout=timeout):
+            return False
+        with self.channel_lock:
+            self.active_channels += 1
+        return True
+    
+    def release_channel(self):
+        """Освободить слот канала"""
+        with self.channel_lock:
+            self.active_channels -= 1
+        self.channel_slots.release()
+    
+    def _channels_busy(self) -> Dict:
+        return {
+            'success': False,
+            'error': f'Все {self.max_channels} SSH каналов к {self.host} заняты',
+            'exit_code': -1,
+            'timestamp': datetime.now().isoformat()
+        }
     
     def disconnect(self):
         """Закрыть SSH соединение"""
@@ -124,8 +347,8 @@ class SSHConnection:
             except Exception as e:
                 self.logger.error(f"Ошибка при закрытии SSH соединения: {e}")
     
-    def execute_command(self, command: str, timeout: int = 30) -> Dict:
-        """Выполнить команду на удаленном сервере"""
+    def execute_command(self, command: str, timeout: int = 30, get_pty: bool = True) -> Dict:
+        """Выполнить команду на удаленном сервере (get_pty=False - stderr отдельно от stdout)"""
         if not self.connected or not self.ssh_client:
             if not self.connect():
                 return {
@@ -134,13 +357,16 @@ class SSHConnection:
                     'exit_code': -1
                 }
         
+        if not self.acquire_channel(timeout):
+            return self._channels_busy()
+        
         try:
             self.last_activity = datetime.now()
             
             stdin, stdout, stderr = self.ssh_client.exec_command(
                 command, 
                 timeout=timeout,
-                get_pty=True
+                get_pty=get_pty
             )
             
             # Читаем вывод
@@ -170,10 +396,14 @@ class SSHConnection:
                 'exit_code': -1,
                 'timestamp': datetime.now().isoformat()
             }
+        finally:
+            self.release_channel()
 
-    def execute_command_stream(self, command: str, timeout: int = 600, on_output=None) -> Dict:
+    def execute_command_stream(self, command: str, timeout: int = 600, on_output=None,
+                               batch_interval: float = 0) -> Dict:
         """
         Выполнить команду на сервере и построчно стримить вывод через callback on_output.
+        batch_interval > 0 - строки копятся и отдаются одним вызовом (через '\\n') не чаще раза в интервал.
         Возвращает итог как и обычный execute_command.
         """
         if not self.connected or not self.ssh_client:
@@ -183,6 +413,8 @@ class SSHConnection:
                     'error': 'Не удалось установить SSH соединение',
                     'exit_code': -1
                 }
+        if not self.acquire_channel(min(timeout, 30)):
+            return self._channels_busy()
         try:
             self.last_activity = datetime.now()
             stdin, stdout, stderr = self.ssh_client.exec_command(
@@ -191,65 +423,84 @@ class SSHConnection:
                 get_pty=True
             )
             channel = stdout.channel
-            channel.settimeout(1.0)
 
-            start = time.time()
+            deadline = time.time() + timeout
+            bufsize = STREAM_BUFFER_MIN
             collected_output = []
             collected_error = []
+            streams = (
+                (channel.recv_ready, channel.recv, collected_output, LineAssembler()),
+                (channel.recv_stderr_ready, channel.recv_stderr, collected_error, LineAssembler())
+            )
+            pending = []
+            last_flush = time.time()
 
-            # Читаем вывод по мере появления
-            while True:
-                if channel.recv_ready():
-                    data = channel.recv(4096)
-                    if not data:
-                        break
-                    text = data.decode('utf-8', errors='ignore')
-                    collected_output.append(text)
-                    if on_output:
-                        # Разбиваем на строки для аккуратной печати
-                        for line in text.split('\n'):
-                            if line.strip():
-                                try:
-                                    on_output(line)
-                                except Exception:
-                                    pass
-
-                if channel.recv_stderr_ready():
-                    data_err = channel.recv_stderr(4096)
-                    if data_err:
-                        err_text = data_err.decode('utf-8', errors='ignore')
-                        collected_error.append(err_text)
-                        if on_output:
-                            for line in err_text.split('\n'):
-                                if line.strip():
-                                    try:
-                                        on_output(line)
-                                    except Exception:
-                                        pass
-
-                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
-                    break
+            def deliver(lines, force=False):
+                nonlocal last_flush
+                if not on_output:
+                    return
+                pending.extend(line for line in lines if line.strip())
+                if not pending:
+                    return
+                if batch_interval <= 0:
+                    batch = pending[:]
+                elif force or (time.time() - last_flush) >= batch_interval:
+                    batch = ['\n'.join(pending)]
+                    last_flush = time.time()
+                else:
+                    return
+                pending.clear()
+                for item in batch:
+                    try:
+                        on_output(item)
+                    except Exception:
+                        pass
 
-                if (time.time() - start) > timeout:
+            # Ждем событий канала через select: fileno() канала срабатывает на stdout, stderr и закрытие
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
                     try:
                         channel.close()
                     except Exception:
                         pass
+                    deliver([], force=True)
                     return {
                         'success': False,
                         'error': f'Команда превысила таймаут {timeout} секунд',
                         'exit_code': -1,
                         'timestamp': datetime.now().isoformat(),
-                        'output': ''.join(collected_output)
+                        'output': b''.join(collected_output).decode('utf-8', errors='ignore')
                     }
 
-                time.sleep(0.1)
+                wait = min(remaining, batch_interval if (pending and batch_interval > 0) else 1.0)
+                select.select([channel], [], [], wait)
+                
+                for ready, recv, collected, assembler in streams:
+                    while ready():
+                        data = recv(bufsize)
+                        if not data:
+                            break
+                        collected.append(data)
+                        deliver(assembler.feed(data))
+                        # Буфер растет, пока чтения заполняют его целиком (большой вывод)
+                        if len(data) == bufsize and bufsize < STREAM_BUFFER_MAX:
+                            bufsize *= 2
+                deliver([])
+                
+                if (channel.exit_status_ready() or channel.closed) and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+            
+            # Хвосты без перевода строки
+            for _ready, _recv, _collected, assembler in streams:
+                deliver(assembler.flush())
+            deliver([], force=True)
 
             exit_code = channel.recv_exit_status()
             return {
                 'success': exit_code == 0,
-                'output': ''.join(collected_output).strip(),
-                'error': ''.join(collected_error).strip() if collected_error else None,
+                'output': b''.join(collected_output).decode('utf-8', errors='ignore').strip(),
+                'error': b''.join(collected_error).decode('utf-8', errors='ignore').strip() if collected_error else None,
                 'exit_code': exit_code,
                 'timestamp': datetime.now().isoformat()
             }
@@ -267,6 +518,8 @@ class SSHConnection:
                 'exit_code': -1,
                 'timestamp': datetime.now().isoformat()
             }
+        finally:
+            self.release_channel()
     
     def get_sftp(self):
         """Получить SFTP клиент"""
@@ -283,32 +536,75 @@ class SSHConnection:
                 
         return self.sftp_client
     
-    def upload_file(self, local_path: str, remote_path: str) -> bool:
-        """Загрузить файл на сервер"""
-        sftp = self.get_sftp()
-        if not sftp:
-            return False
-            
+    def open_sftp_session(self):
+        """Отдельная SFTP-сессия для передачи файла (занимает слот канала, параллельные передачи не мешают друг другу)"""
+        if not self.connected or not self.ssh_client:
+            if not self.connect():
+                return None
+        if not self.acquire_channel(30):
+            return None
         try:
-            sftp.put(local_path, remote_path)
+            self.last_activity = datetime.now()
+            return self.ssh_client.open_sftp()
+        except Exception as e:
+            self.release_channel()
+            self.logger.error(f"Ошибка создания SFTP сессии: {e}")
+            return None
+    
+    def close_sftp_session(self, sftp):
+        try:
+            sftp.close()
+        except Exception:
+            pass
+        self.release_channel()
+    
+    def upload_file(self, local_path: str, remote_path: str, on_progress=None) -> bool:
+        """Загрузить файл на сервер (с докачкой и проверкой sha256)"""
+        result = SFTPTransfer(self, on_progress=on_progress).upload(local_path, remote_path)
+        if result['success']:
             self.logger.info(f"Файл {local_path} загружен как {remote_path}")
-            return True
+        else:
+            self.logger.error(f"Ошибка загрузки файла: {result.get('error')}")
+        return result['success']
+    
+    def download_file(self, remote_path: str, local_path: str, on_progress=None) -> bool:
+        """Скачать файл с сервера (с докачкой и проверкой sha256)"""
+        result = SFTPTransfer(self, on_progress=on_progress).download(remote_path, local_path)
+        if result['success']:
+            self.logger.info(f"Файл {remote_path} скачан как {local_path}")
+        else:
+            self.logger.error(f"Ошибка скачивания файла: {result.get('error')}")
+        return result['success']
+    
+    def open_terminal(self, cols: int = 80, rows: int = 24, term: str = 'xterm-256color'):
+        """Открыть интерактивный шелл с PTY на существующем транспорте (занимает слот канала)"""
+        if not self.connected or not self.ssh_client:
+            if not self.connect():
+                return None
+        if not self.acquire_channel(5):
+            return None
+        try:
+            channel = self.ssh_client.get_transport().open_session()
+            channel.get_pty(term=term, width=cols, height=rows)
+            channel.invoke_shell()
+            self.last_activity = datetime.now()
+            return channel
         except Exception as e:
-            self.logger.error(f"Ошибка загрузки файла: {e}")
-            return False
+            self.release_channel()
+            self.logger.error(f"Ошибка открытия терминала: {e}")
+            return None
     
-    def download_file(self, remote_path: str, local_path: str) -> bool:
-        """Скачать файл с сервера"""
-        sftp = self.get_sftp()
-        if not sftp:
+    def probe(self, timeout: float = PROBE_TIMEOUT) -> bool:
+        """Проверить транспорт круговым запросом (открыть/закрыть канал) - ловит полуоткрытые соединения"""
+        if not self.is_alive():
             return False
-            
         try:
-            sftp.get(remote_path, local_path)
-            self.logger.info(f"Файл {remote_path} скачан как {local_path}")
+            channel = self.ssh_client.get_transport().open_session(timeout=timeout)
+            channel.close()
+            self.last_probe = datetime.now()
             return True
         except Exception as e:
-            self.logger.error(f"Ошибка скачивания файла: {e}")
+            self.logger.warning(f"Проверка соединения с {self.host} не прошла: {e}")
             return False
     
     def is_alive(self) -> bool:
@@ -323,40 +619,266 @@ class SSHConnection:
             return False
 
 
+class TerminalSession:
+    """Интерактивная PTY-сессия (вкладка браузера) поверх общего SSH транспорта"""
+    
+    def __init__(self, session_id: str, conn: SSHConnection, channel, on_output, on_close=None,
+                 owner: str = None, window: int = TERMINAL_WINDOW_BYTES):
+        self.session_id = session_id
+        self.conn = conn
+        self.channel = channel
+        self.on_output = on_output
+        self.on_close = on_close
+        self.owner = owner
+        self.window = window
+        self.unacked = 0
+        self.flow = threading.Condition()
+        self.closed = False
+        self.created_at = datetime.now()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+    
+    def start(self):
+        self.reader.start()
+    
+    def _read_loop(self):
+        """Читать вывод шелла и отдавать его пачками; при переполнении окна ждать ack"""
+        channel = self.channel
+        buffer = bytearray()
+        try:
+            while not self.closed:
+                # Управление потоком: не читаем канал, пока клиент не догонит -
+                # окно SSH канала заполнится и удаленная сторона притормозит сама
+                with self.flow:
+                    while self.unacked >= self.window and not self.closed:
+                        self.flow.wait(1.0)
+                if self.closed:
+                    break
+                
+                select.select([channel], [], [], 1.0)
+                while channel.recv_ready() and len(buffer) < TERMINAL_READ_SIZE:
+                    buffer.extend(channel.recv(TERMINAL_READ_SIZE - len(buffer)))
+                
+                if not buffer:
+                    if channel.closed or channel.eof_received:
+                        break
+                    continue
+                
+                data = bytes(buffer)
+                buffer.clear()
+                with self.flow:
+                    self.unacked += len(data)
+                self.bytes_out += len(data)
+                self.conn.last_activity = datetime.now()
+                self.on_output(data)
+        except Exception as e:
+            if not self.closed:
+                self.conn.logger.error(f"Ошибка терминала {self.session_id}: {e}")
+        finally:
+            self.close()
+    
+    def write(self, data):
+        """Ввод пользователя (строка или байты) в шелл"""
+        # Канал берем один раз: close() из потока чтения может обнулить его в любой момент
+        channel = self.channel
+        if self.closed or channel is None:
+            return False
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        try:
+            channel.sendall(data)
+        except (socket.error, paramiko.SSHException, EOFError) as e:
+            self.conn.logger.warning(f"Терминал {self.session_id} закрыт при записи: {e}")
+            self.close()
+            return False
+        self.bytes_in += len(data)
+        self.conn.last_activity = datetime.now()
+        return True
+    
+    def resize(self, cols: int, rows: int):
+        """Изменить размер окна PTY"""
+        channel = self.channel
+        if self.closed or channel is None:
+            return False
+        try:
+            channel.resize_pty(width=int(cols), height=int(rows))
+        except (socket.error, paramiko.SSHException, EOFError):
+            self.close()
+            return False
+        return True
+    
+    def ack(self, nbytes: int):
+        """Клиент отрисовал nbytes вывода - освобождаем окно"""
+        with self.flow:
+            self.unacked = max(0, self.unacked - int(nbytes))
+            self.flow.notify_all()
+    
+    def close(self):
+        """Закрыть канал и освободить слот соединения"""
+        with self.flow:
+            self.closed = True
+            channel, self.channel = self.channel, None
+            self.flow.notify_all()
+        
+        if channel is None:
+            return
+        try:
+            channel.close()
+        except Exception:
+            pass
+        self.conn.release_channel()
+        if self.on_close:
+            try:
+                self.on_close(self)
+            except Exception:
+                pass
+    
+    def get_info(self) -> Dict:
+        return {
+            'session_id': self.session_id,
+            'host': self.conn.host,
+            'created_at': self.created_at.isoformat(),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'unacked': self.unacked
+        }
+
+
 class SSHManager:
     """Менеджер SSH соединений"""
     
-    def __init__(self):
+    def __init__(self, max_channels: int = DEFAULT_MAX_CHANNELS):
         self.connections: Dict[str, SSHConnection] = {}
         self.connection_pool_lock = threading.Lock()
+        self.max_channels = max_channels
+        self.terminals: Dict[str, TerminalSession] = {}
         self.logger = logging.getLogger("SSHManager")
         
+        # Серверы, для которых соединение держим прогретым (server_id -> параметры подключения)
+        self.warm_servers: Dict[str, Dict] = {}
+        
+        # Статистика пула
+        self.stats_lock = threading.Lock()
+        self.pool_stats = {
+            'hits': 0,
+            'misses': 0,
+            'handshakes': 0,
+            'handshake_failures': 0,
+            'handshake_ms_total': 0.0,
+            'probes': 0,
+            'probe_failures': 0
+        }
+        self.handshake_times = deque(maxlen=1000)
+        
+        # Пул фонового обслуживания (проверки, прогрев) и задачи, которые уже в работе
+        self.maintenance_pool = ThreadPoolExecutor(max_workers=MAINTENANCE_WORKERS, thread_name_prefix='ssh-maintenance')
+        self.maintenance_inflight = set()
+        self.maintenance_lock = threading.Lock()
+        
         # Запускаем поток для очистки неактивных соединений
         self.cleanup_thread = threading.Thread(target=self._cleanup_connections, daemon=True)
         self.cleanup_thread.start()
     
     def get_connection(self, server_id: str, host: str, port: int = 22, 
                       username: str = None, password: str = None, 
-                      key_file: str = None) -> Optional[SSHConnection]:
+                      key_file: str = None, key_data: str = None, timeout: int = None) -> Optional[SSHConnection]:
         """Получить SSH соединение для сервера"""
+        stale = None
+        
+        # Под общей блокировкой только ищем/регистрируем объект соединения
         with self.connection_pool_lock:
-            # Проверяем существующее соединение
-            if server_id in self.connections:
-                conn = self.connections[server_id]
-                if conn.is_alive():
-                    return conn
-                else:
-                    # Удаляем мертвое соединение
-                    conn.disconnect()
-                    del self.connections[server_id]
+            conn = self.connections.get(server_id)
+            if conn is not None and conn.is_alive():
+                self._count('hits')
+                return conn
             
-            # Создаем новое соединение
-            conn = SSHConnection(host, port, username, password, key_file)
-            if conn.connect():
+            self._count('misses')
+            if conn is None or not conn.connecting:
+                # Мертвое соединение заменяем новым (данные сервера могли измениться)
+                stale = conn
+                conn = SSHConnection(host, port, username, password, key_file,
+                                     timeout=timeout or 30, key_data=key_data, max_channels=self.max_channels,
+                                     on_handshake=self._record_handshake)
+                # Помечаем до выхода из-под блокировки: иначе параллельный запрос, пришедший
+                # до conn.connect(), заменил бы еще не подключенное соединение своим
+                conn.connecting = True
                 self.connections[server_id] = conn
-                return conn
-            else:
-                return None
+        
+        if stale is not None:
+            stale.disconnect()
+        
+        # Handshake идет вне общей блокировки: медленный сервер не держит остальные.
+        # Параллельные запросы к тому же серверу ждут на connection_lock соединения
+        if conn.connect():
+            return conn
+        
+        with self.connection_pool_lock:
+            if self.connections.get(server_id) is conn:
+                del self.connections[server_id]
+        return None
+    
+    def open_terminal(self, session_id: str, conn: SSHConnection, cols: int, rows: int,
+                      on_output, on_close=None, owner: str = None) -> Optional[TerminalSession]:
+        """Открыть PTY-сессию на пуловом соединении"""
+        channel = conn.open_terminal(cols, rows)
+        if channel is None:
+            return None
+        
+        def forget(session):
+            self.terminals.pop(session.session_id, None)
+            if on_close:
+                on_close(session)
+        
+        session = TerminalSession(session_id, conn, channel, on_output, forget, owner=owner)
+        self.terminals[session_id] = session
+        session.start()
+        return session
+    
+    def get_terminal(self, session_id: str) -> Optional[TerminalSession]:
+        return self.terminals.get(session_id)
+    
+    def close_terminals(self, owner: str):
+        """Закрыть все сессии владельца (вкладка браузера отключилась)"""
+        for session in list(self.terminals.values()):
+            if session.owner == owner:
+                session.close()
+    
+    def _count(self, name: str, value=1):
+        with self.stats_lock:
+            self.pool_stats[name] += value
+    
+    def _record_handshake(self, elapsed_ms: float, ok: bool):
+        """Колбэк SSHConnection после каждого handshake"""
+        with self.stats_lock:
+            self.pool_stats['handshakes'] += 1
+            self.pool_stats['handshake_ms_total'] += elapsed_ms
+            if not ok:
+                self.pool_stats['handshake_failures'] += 1
+            self.handshake_times.append(time.time())
+    
+    def add_warm_server(self, server_id: str, host: str, port: int = 22, username: str = None,
+                        password: str = None, key_file: str = None, key_data: str = None):
+        """Держать соединение с сервером открытым (часто используемые серверы)"""
+        self.warm_servers[server_id] = {
+            'host': host,
+            'port': port,
+            'username': username,
+            'password': password,
+            'key_file': key_file,
+            'key_data': key_data
+        }
+    
+    def remove_warm_server(self, server_id: str):
+        self.warm_servers.pop(server_id, None)
+    
+    def forget_host_key(self, host: str, port: int = 22) -> bool:
+        """Удалить сохраненный ключ хоста (после переустановки сервера)"""
+        return known_hosts.remove(host, port)
+    
+    def set_max_channels(self, max_channels: int):
+        """Изменить лимит параллельных каналов (для новых соединений)"""
+        self.max_channels = max(1, int(max_channels))
     
     def execute_command(self, server_id: str, host: str, port: int, username: str,
                        password: str, key_file: str, command: str, timeout: int = 30) -> Dict:
@@ -419,40 +941,129 @@ class SSHManager:
             self.connections.clear()
     
     def _cleanup_connections(self):
-        """Очистка неактивных соединений (фоновый поток)"""
+        """Фоновый поток: проверка простаивающих соединений, закрытие старых, прогрев"""
         while True:
             try:
-                time.sleep(60)  # Проверяем каждую минуту
-                
-                with self.connection_pool_lock:
-                    dead_connections = []
-                    
-                    for server_id, conn in self.connections.items():
-                        if not conn.is_alive():
-                            dead_connections.append(server_id)
-                        elif conn.last_activity:
-                            # Закрываем соединения неактивные более 30 минут
-                            inactive_time = datetime.now() - conn.last_activity
-                            if inactive_time.total_seconds() > 1800:  # 30 минут
-                                dead_connections.append(server_id)
-                    
-                    for server_id in dead_connections:
-                        self.logger.info(f"Закрываем неактивное соединение: {server_id}")
-                        self.connections[server_id].disconnect()
-                        del self.connections[server_id]
-                        
+                time.sleep(PROBE_INTERVAL)
+                self._probe_connections()
+                self._warm_up()
             except Exception as e:
                 self.logger.error(f"Ошибка в cleanup_connections: {e}")
     
+    def _probe_connections(self):
+        """Закрыть мертвые и давно неиспользуемые соединения; простаивающие проверить круговым запросом"""
+        now = datetime.now()
+        dead_connections = []
+        to_probe = []
+        
+        with self.connection_pool_lock:
+            for server_id, conn in self.connections.items():
+                if conn.connecting or conn.active_channels:
+                    continue
+                if not conn.is_alive():
+                    dead_connections.append(server_id)
+                    continue
+                
+                idle = (now - conn.last_activity).total_seconds() if conn.last_activity else 0
+                # Успешная проверка подтверждает транспорт так же, как работа по нему:
+                # следующая - не раньше PROBE_IDLE_SECONDS (last_activity остается мерой простоя)
+                last_seen = max(filter(None, (conn.last_activity, conn.last_probe)), default=None)
+                unverified = (now - last_seen).total_seconds() if last_seen else 0
+                if idle > IDLE_CLOSE_SECONDS and server_id not in self.warm_servers:
+                    # Закрываем соединения неактивные более 30 минут
+                    dead_connections.append(server_id)
+                elif unverified > PROBE_IDLE_SECONDS:
+                    to_probe.append((server_id, conn))
+        
+        # Проверки идут параллельно и вне общей блокировки: зависший хост не держит пул и другие проверки
+        for server_id, conn in to_probe:
+            self._submit_maintenance(('probe', server_id), self._probe_one, server_id, conn)
+        
+        for server_id in dead_connections:
+            self._drop_connection(server_id)
+    
+    def _submit_maintenance(self, key, func, *args):
+        """Запустить задачу обслуживания в пуле, если такая же еще не выполняется"""
+        with self.maintenance_lock:
+            if key in self.maintenance_inflight:
+                return False
+            self.maintenance_inflight.add(key)
+        
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                self.logger.error(f"Ошибка обслуживания {key}: {e}")
+            finally:
+                with self.maintenance_lock:
+                    self.maintenance_inflight.discard(key)
+        
+        self.maintenance_pool.submit(run)
+        return True
+    
+    def _probe_one(self, server_id: str, conn: SSHConnection):
+        self._count('probes')
+        if not conn.probe(timeout=PROBE_TIMEOUT):
+            self._count('probe_failures')
+            self._drop_connection(server_id, conn)
+    
+    def _drop_connection(self, server_id: str, expected: SSHConnection = None):
+        """Убрать соединение из пула и закрыть (если по нему не идет работа)"""
+        with self.connection_pool_lock:
+            conn = self.connections.get(server_id)
+            if conn is None or conn.active_channels or (expected is not None and conn is not expected):
+                return
+            del self.connections[server_id]
+        self.logger.info(f"Закрываем неактивное соединение: {server_id}")
+        conn.disconnect()
+    
+    def _warm_up(self):
+        """Поднять соединения для прогреваемых серверов, если их нет в пуле"""
+        for server_id, params in list(self.warm_servers.items()):
+            with self.connection_pool_lock:
+                conn = self.connections.get(server_id)
+                if conn is not None and (conn.connecting or conn.is_alive()):
+                    continue
+            self._submit_maintenance(('warm', server_id), self._warm_one, server_id, params)
+    
+    def _warm_one(self, server_id: str, params: Dict):
+        self.get_connection(server_id, timeout=WARM_CONNECT_TIMEOUT, **params)
+    
     def get_connection_stats(self) -> Dict:
         """Получить статистику соединений"""
         with self.connection_pool_lock:
             active_connections = sum(1 for conn in self.connections.values() if conn.is_alive())
-            return {
+            stats = {
                 'total_connections': len(self.connections),
                 'active_connections': active_connections,
+                'active_channels': sum(conn.active_channels for conn in self.connections.values()),
+                'max_channels': self.max_channels,
+                'channels': {server_id: conn.active_channels for server_id, conn in self.connections.items()},
+                'terminals': len(self.terminals),
                 'servers': list(self.connections.keys())
             }
+        
+        with self.stats_lock:
+            pool = dict(self.pool_stats)
+            now = time.time()
+            recent_handshakes = sum(1 for started in self.handshake_times if now - started <= 60)
+        
+        lookups = pool['hits'] + pool['misses']
+        stats.update({
+            'warm_servers': list(self.warm_servers.keys()),
+            'key_cache_hits': private_key_cache.hits,
+            'key_cache_misses': private_key_cache.misses,
+            'hits': pool['hits'],
+            'misses': pool['misses'],
+            'hit_rate': round(pool['hits'] / lookups * 100, 1) if lookups else 0,
+            'handshakes': pool['handshakes'],
+            'handshake_failures': pool['handshake_failures'],
+            'handshakes_per_sec': round(recent_handshakes / 60, 3),
+            'avg_handshake_ms': round(pool['handshake_ms_total'] / pool['handshakes'], 1) if pool['handshakes'] else 0,
+            'probes': pool['probes'],
+            'probe_failures': pool['probe_failures']
+        })
+        return stats
 
 
 # Глобальный экземпляр SSH менеджера
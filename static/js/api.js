@@ -92,8 +92,8 @@ class XpanelAPI {
         });
     }
 
-    async getServerFiles(serverId, path = '/') {
-        return this.request(`/servers/${serverId}/files?path=${encodeURIComponent(path)}`);
+    async getServerFiles(serverId, path = '/', offset = 0, refresh = false) {
+        return this.request(`/servers/${serverId}/files?path=${encodeURIComponent(path)}&offset=${offset}${refresh ? '&refresh=1' : ''}`);
     }
 
     async removeServer(serverId) {
@@ -39,7 +39,7 @@ class FilesManager {
         this.loadFiles();
     }
 
-    async loadFiles(path = this.currentPath) {
+    async loadFiles(path = this.currentPath, refresh = false) {
         if (!this.currentServer) {
             this.clearFilesList();
             return;
@@ -47,10 +47,11 @@ class FilesManager {
 
         try {
             this.showLoading();
-            const result = await api.getServerFiles(this.currentServer, path);
+            const result = await api.getServerFiles(this.currentServer, path, 0, refresh);
             
             if (result.success) {
                 this.files = result.files || [];
+                this.hasMore = result.has_more;
                 this.currentPath = result.path || path;
                 this.renderFilesList();
                 this.updatePathDisplay();
@@ -63,6 +64,21 @@ class FilesManager {
         }
     }
 
+    async loadMoreFiles() {
+        if (!this.currentServer || !this.hasMore) return;
+
+        try {
+            const result = await api.getServerFiles(this.currentServer, this.currentPath, this.files.length);
+            if (result.success) {
+                this.files = this.files.concat(result.files || []);
+                this.hasMore = result.has_more;
+                this.renderFilesList();
+            }
+        } catch (error) {
+            console.error('Failed to load more files:', error);
+        }
+    }
+
     renderFilesList() {
         const filesList = document.getElementById('files-list');
         if (!filesList) return;
@@ -91,14 +107,8 @@ class FilesManager {
             `;
         }
 
-        // Sort files: directories first, then files
-        const sortedFiles = [...this.files].sort((a, b) => {
-            if (a.is_directory && !b.is_directory) return -1;
-            if (!a.is_directory && b.is_directory) return 1;
-            return a.name.localeCompare(b.name);
-        });
-
-        filesHtml += sortedFiles.map(file => `
+        // Server returns pages already sorted: directories first, then files
+        filesHtml += this.files.map(file => `
             <div class="file-item" onclick="handleFileClick('${file.name}', ${file.is_directory})">
                 <i class="fas ${file.is_directory ? 'fa-folder' : this.getFileIcon(file.name)} file-icon ${file.is_directory ? 'directory' : ''}"></i>
                 <div class="file-name">${file.name}</div>
@@ -107,6 +117,17 @@ class FilesManager {
             </div>
         `).join('');
 
+        if (this.hasMore) {
+            filesHtml += `
+                <div class="file-item" onclick="window.filesManager.loadMoreFiles()">
+                    <i class="fas fa-ellipsis-h file-icon"></i>
+                    <div class="file-name">Показать ещё...</div>
+                    <div class="file-size"></div>
+                    <div class="file-date"></div>
+                </div>
+            `;
+        }
+
         filesList.innerHTML = filesHtml;
     }
 
@@ -240,7 +261,7 @@ window.navigateToParent = function() {
 
 window.refreshFiles = function() {
     if (window.filesManager) {
-        window.filesManager.loadFiles();
+        window.filesManager.loadFiles(window.filesManager.currentPath, true);
     }
 };
 
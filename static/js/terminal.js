@@ -10,15 +10,41 @@ class TerminalManager {
         this.commandHistory = [];
         this.historyIndex = -1;
         this.sessionStartTime = null;
+        this.socket = null;
+        this.decoder = null;
+        this.currentLine = null;
+        this.inputQueue = '';
+        this.inputTimer = null;
         this.init();
     }
 
     init() {
         this.setupEventHandlers();
+        this.initSocket();
         this.loadServers();
         this.updateConnectionStatus('disconnected');
     }
 
+    initSocket() {
+        if (typeof io === 'undefined') return;
+
+        // PTY session lives on the server; output arrives as binary frames
+        this.socket = io();
+        this.socket.on('terminal_output', (message) => this.handleOutput(message));
+        this.socket.on('terminal_closed', (message) => {
+            if (message.session_id === this.sessionId) {
+                this.sessionId = null;
+                this.disconnectFromServer();
+            }
+        });
+
+        let resizeTimer = null;
+        window.addEventListener('resize', () => {
+            clearTimeout(resizeTimer);
+            resizeTimer = setTimeout(() => this.sendResize(), 200);
+        });
+    }
+
     setupEventHandlers() {
         // Server selection
         const serverSelect = document.getElementById('server-select');
@@ -114,43 +140,53 @@ class TerminalManager {
     async connectToServer() {
         if (!this.currentServer) return;
 
-        try {
-            this.updateConnectionStatus('connecting');
-            this.addTerminalLine(`Connecting to ${this.currentServer.name} (${this.currentServer.host})...`, 'info');
+        if (!this.socket) {
+            this.updateConnectionStatus('error');
+            this.addTerminalLine('Connection failed: WebSocket is not available', 'error');
+            return;
+        }
 
-            // Simulate connection process
-            await this.delay(1000);
-            this.addTerminalLine('Establishing SSH connection...', 'info');
-            await this.delay(1500);
-            this.addTerminalLine('Authentication successful', 'success');
-            await this.delay(500);
+        this.updateConnectionStatus('connecting');
+        this.addTerminalLine(`Connecting to ${this.currentServer.name} (${this.currentServer.host})...`, 'info');
+
+        const size = this.getTerminalSize();
+        this.socket.emit('terminal_open', {
+            token: this.auth.getToken(),
+            server_id: this.currentServer.id,
+            cols: size.cols,
+            rows: size.rows
+        }, (result) => {
+            if (!result || !result.success) {
+                this.updateConnectionStatus('error');
+                this.addTerminalLine(`Connection failed: ${result ? result.error : 'no response'}`, 'error');
+                return;
+            }
 
-            // Set connected state
             this.isConnected = true;
-            this.sessionId = this.generateSessionId();
+            this.sessionId = result.session_id;
             this.sessionStartTime = new Date();
-            
+            this.decoder = new TextDecoder('utf-8');
+            this.currentLine = null;
+
             this.updateConnectionStatus('connected');
             this.enableTerminalInput();
             this.updateConnectionInfo();
             this.startSessionTimer();
-
-            this.addTerminalLine(`Welcome to ${this.currentServer.name}`, 'success');
-            this.addTerminalLine(`Last login: ${new Date().toLocaleString()}`, 'info');
             this.updatePrompt();
-
-        } catch (error) {
-            this.updateConnectionStatus('error');
-            this.addTerminalLine(`Connection failed: ${error.message}`, 'error');
-        }
+        });
     }
 
     disconnectFromServer() {
         if (!this.isConnected) return;
 
+        if (this.sessionId && this.socket) {
+            this.socket.emit('terminal_close', { session_id: this.sessionId });
+        }
+
         this.isConnected = false;
         this.sessionId = null;
         this.sessionStartTime = null;
+        this.currentLine = null;
         
         this.updateConnectionStatus('disconnected');
         this.disableTerminalInput();
@@ -165,7 +201,8 @@ class TerminalManager {
         const promptElement = document.getElementById('terminal-prompt');
         if (promptElement) {
             if (this.isConnected && this.currentServer) {
-                promptElement.textContent = `${this.currentServer.username}@${this.currentServer.name}:~$`;
+                // Приглашение печатает сам шелл в выводе
+                promptElement.textContent = '>';
             } else {
                 promptElement.textContent = '$';
             }
@@ -274,12 +311,82 @@ class TerminalManager {
         }
     }
 
-    generateSessionId() {
-        return 'sess_' + Math.random().toString(36).substr(2, 9);
+    getTerminalSize() {
+        const output = document.getElementById('terminal-output');
+        if (!output) return { cols: 80, rows: 24 };
+
+        // Approximate monospace cell size of .terminal-output
+        return {
+            cols: Math.max(40, Math.floor(output.clientWidth / 8.4)),
+            rows: Math.max(10, Math.floor(output.clientHeight / 18))
+        };
+    }
+
+    sendResize() {
+        if (!this.isConnected || !this.sessionId) return;
+        const size = this.getTerminalSize();
+        this.socket.emit('terminal_resize', { session_id: this.sessionId, cols: size.cols, rows: size.rows });
+    }
+
+    sendInput(data) {
+        if (!this.isConnected || !this.sessionId) return;
+
+        // Batch keystrokes/paste into one frame per few ms
+        this.inputQueue += data;
+        if (this.inputTimer) return;
+        this.inputTimer = setTimeout(() => {
+            this.inputTimer = null;
+            if (this.inputQueue && this.sessionId) {
+                this.socket.emit('terminal_input', { session_id: this.sessionId, data: this.inputQueue });
+            }
+            this.inputQueue = '';
+        }, 8);
     }
 
-    delay(ms) {
-        return new Promise(resolve => setTimeout(resolve, ms));
+    handleOutput(message) {
+        if (message.session_id !== this.sessionId) return;
+
+        const bytes = new Uint8Array(message.data);
+        this.writeOutput(this.decoder.decode(bytes, { stream: true }));
+
+        // Flow control: server pauses reading until rendered output is acknowledged
+        this.socket.emit('terminal_ack', { session_id: this.sessionId, bytes: bytes.length });
+    }
+
+    writeOutput(text) {
+        const output = document.getElementById('terminal-output');
+        if (!output) return;
+
+        // Plain-text view: drop ANSI escape sequences and bells
+        const clean = text
+            .replace(/\x1b\][^\x07\x1b]*(\x07|\x1b\\)/g, '')
+            .replace(/\x1b\[[0-9;?]*[ -\/]*[@-~]/g, '')
+            .replace(/\x1b[()][A-Za-z0-9]/g, '')
+            .replace(/\x1b[=>]/g, '')
+            .replace(/\x07/g, '');
+
+        clean.split('\n').forEach((part, index) => {
+            if (index > 0 || !this.currentLine) {
+                this.currentLine = document.createElement('div');
+                this.currentLine.className = 'terminal-line output';
+                output.appendChild(this.currentLine);
+            }
+
+            let lineText = this.currentLine.textContent;
+            let chunk = part.replace(/\r+$/, '');
+            // Bare carriage return (progress bars) rewrites the line
+            const rewrite = chunk.lastIndexOf('\r');
+            if (rewrite !== -1) {
+                lineText = '';
+                chunk = chunk.slice(rewrite + 1);
+            }
+            for (const char of chunk) {
+                lineText = char === '\b' ? lineText.slice(0, -1) : lineText + char;
+            }
+            this.currentLine.textContent = lineText;
+        });
+
+        this.scrollToBottom();
     }
 
     handleKeyDown(e) {
@@ -295,6 +402,15 @@ class TerminalManager {
                 this.historyIndex = -1;
                 break;
 
+            case 'c':
+            case 'd':
+                if (e.ctrlKey) {
+                    e.preventDefault();
+                    this.sendInput(input.value + (e.key === 'c' ? '\x03' : '\x04'));
+                    input.value = '';
+                }
+                break;
+
             case 'ArrowUp':
                 e.preventDefault();
                 this.navigateHistory(-1);
@@ -307,7 +423,9 @@ class TerminalManager {
 
             case 'Tab':
                 e.preventDefault();
-                // TODO: Implement tab completion
+                // Completion is done by the remote shell
+                this.sendInput(input.value + '\t');
+                input.value = '';
                 break;
 
             case 'l':
@@ -342,88 +460,24 @@ class TerminalManager {
         }
     }
 
-    async executeCommand(command) {
-        if (!command.trim() || !this.isConnected) return;
-
-        // Add command to history
-        this.commandHistory.push(command);
-        if (this.commandHistory.length > 100) {
-            this.commandHistory.shift();
-        }
-
-        // Display command with prompt
-        const prompt = `${this.currentServer.username}@${this.currentServer.name}:~$`;
-        this.addTerminalLine(`${prompt} ${command}`, 'command');
-
-        // Handle local commands
-        if (this.handleLocalCommand(command)) {
-            return;
-        }
+    executeCommand(command) {
+        if (!this.isConnected) return;
 
-        try {
-            // Show loading indicator
-            const loadingLine = this.addTerminalLine('Executing command...', 'info');
-            
-            // Simulate command execution
-            await this.delay(500 + Math.random() * 1000);
-            
-            // Remove loading indicator
-            this.removeLastLine();
-            
-            // Simulate command output based on command type
-            this.simulateCommandOutput(command);
+        if (command.trim()) {
+            // Add command to history
+            this.commandHistory.push(command);
+            if (this.commandHistory.length > 100) {
+                this.commandHistory.shift();
+            }
 
-        } catch (error) {
-            this.removeLastLine();
-            this.addTerminalLine(`Error: ${error.message}`, 'error');
+            // Handle local commands
+            if (this.handleLocalCommand(command)) {
+                return;
+            }
         }
 
-        this.scrollToBottom();
-    }
-
-    simulateCommandOutput(command) {
-        const cmd = command.toLowerCase().trim();
-
-        if (cmd === 'ls' || cmd === 'ls -la' || cmd === 'dir') {
-            this.addTerminalLine('total 24', 'output');
-            this.addTerminalLine('drwxr-xr-x 2 user user 4096 Dec 15 23:29 .', 'output');
-            this.addTerminalLine('drwxr-xr-x 3 user user 4096 Dec 15 23:28 ..', 'output');
-            this.addTerminalLine('-rw-r--r-- 1 user user  220 Dec 15 23:28 .bash_logout', 'output');
-            this.addTerminalLine('-rw-r--r-- 1 user user 3771 Dec 15 23:28 .bashrc', 'output');
-            this.addTerminalLine('-rw-r--r-- 1 user user  807 Dec 15 23:28 .profile', 'output');
-            this.addTerminalLine('drwxr-xr-x 2 user user 4096 Dec 15 23:29 documents', 'output');
-        } else if (cmd === 'pwd') {
-            this.addTerminalLine('/home/' + this.currentServer.username, 'output');
-        } else if (cmd === 'whoami') {
-            this.addTerminalLine(this.currentServer.username, 'output');
-        } else if (cmd === 'date') {
-            this.addTerminalLine(new Date().toString(), 'output');
-        } else if (cmd === 'uptime') {
-            this.addTerminalLine('23:29:53 up 5 days, 12:34, 1 user, load average: 0.15, 0.10, 0.05', 'output');
-        } else if (cmd.startsWith('echo ')) {
-            this.addTerminalLine(command.substring(5), 'output');
-        } else if (cmd === 'ps aux' || cmd === 'ps') {
-            this.addTerminalLine('USER       PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND', 'output');
-            this.addTerminalLine('root         1  0.0  0.1  19356  1544 ?        Ss   Dec10   0:01 /sbin/init', 'output');
-            this.addTerminalLine('root         2  0.0  0.0      0     0 ?        S    Dec10   0:00 [kthreadd]', 'output');
-            this.addTerminalLine('user      1234  0.0  0.2  21532  2048 pts/0    Ss   23:29   0:00 -bash', 'output');
-        } else if (cmd === 'df -h' || cmd === 'df') {
-            this.addTerminalLine('Filesystem      Size  Used Avail Use% Mounted on', 'output');
-            this.addTerminalLine('/dev/sda1        20G  8.5G   11G  45% /', 'output');
-            this.addTerminalLine('tmpfs           2.0G     0  2.0G   0% /dev/shm', 'output');
-        } else if (cmd === 'free -h' || cmd === 'free') {
-            this.addTerminalLine('              total        used        free      shared  buff/cache   available', 'output');
-            this.addTerminalLine('Mem:           4.0G        1.2G        1.8G         64M        1.0G        2.6G', 'output');
-            this.addTerminalLine('Swap:          2.0G          0B        2.0G', 'output');
-        } else if (cmd === 'top') {
-            this.addTerminalLine('top - 23:29:53 up 5 days, 12:34,  1 user,  load average: 0.15, 0.10, 0.05', 'output');
-            this.addTerminalLine('Tasks: 95 total,   1 running,  94 sleeping,   0 stopped,   0 zombie', 'output');
-            this.addTerminalLine('%Cpu(s):  2.3 us,  1.0 sy,  0.0 ni, 96.7 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st', 'output');
-            this.addTerminalLine('Press q to quit...', 'info');
-        } else {
-            // Unknown command
-            this.addTerminalLine(`bash: ${command}: command not found`, 'error');
-        }
+        // The PTY echoes input back, so nothing is printed locally
+        this.sendInput(command + '\r');
     }
 
     handleLocalCommand(command) {
@@ -439,11 +493,6 @@ class TerminalManager {
                 this.showHelp();
                 return true;
 
-            case 'exit':
-            case 'logout':
-                this.disconnectFromServer();
-                return true;
-
             default:
                 return false;
         }
@@ -454,11 +503,10 @@ class TerminalManager {
             'Available local commands:',
             '  clear, cls  - Clear terminal',
             '  help        - Show this help',
-            '  exit        - Disconnect from server',
             '  Ctrl+L      - Clear terminal',
             '  ↑/↓         - Navigate command history',
             '',
-            'All other commands are executed on the connected server.'
+            'Everything else is sent to the remote shell (Tab, Ctrl+C, Ctrl+D included).'
         ];
         
         helpText.forEach(line => {
@@ -51,6 +51,14 @@ class XpanelWebSocket {
             this.emit('terminal_output', data);
         });
 
+        this.socket.on('command_output', (data) => {
+            this.emit('command_output', data);
+        });
+
+        this.socket.on('command_complete', (data) => {
+            this.emit('command_complete', data);
+        });
+
         this.socket.on('file_update', (data) => {
             this.emit('file_update', data);
         });
@@ -127,6 +135,37 @@ class XpanelWebSocket {
         }
     }
 
+    // Start command on agent with live output (command_output / command_complete events)
+    async startCommandStream(serverId, command) {
+        // Join the output room before the agent starts the command, otherwise
+        // early output and command_complete of short commands are lost
+        const requestId = `cmd_${serverId}_${Date.now()}_${Math.random().toString(36).slice(2, 8)}`;
+        if (this.socket && this.isConnected) {
+            await new Promise(resolve => this.socket.emit('join_room', { room: `command_${requestId}` }, resolve));
+        }
+
+        const response = await fetch(`/api/agents/${serverId}/commands/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${XpanelUtils.getAuthToken()}`
+            },
+            body: JSON.stringify({ command: command, request_id: requestId })
+        });
+        return response.json();
+    }
+
+    // Cancel streaming command
+    async cancelCommandStream(serverId, requestId) {
+        const response = await fetch(`/api/agents/${serverId}/commands/${requestId}/cancel`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${XpanelUtils.getAuthToken()}`
+            }
+        });
+        return response.json();
+    }
+
     // Event handler management
     on(event, handler) {
         if (!this.eventHandlers[event]) {
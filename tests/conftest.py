@@ -0,0 +1,51 @@
+"""Shared test setup: import paths and placeholders for psutil/paramiko where they are not installed"""
+
+import importlib.util
+import os
+import sys
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'agent'))
+
+
+def placeholder_module(name, **attrs):
+    """Register minimal module if the real one is missing (tests do not exercise it)"""
+    if importlib.util.find_spec(name) is not None:
+        return
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+
+
+psutil_error = type('Error', (Exception,), {})
+placeholder_module(
+    'psutil',
+    Error=psutil_error,
+    NoSuchProcess=type('NoSuchProcess', (psutil_error,), {}),
+    AccessDenied=type('AccessDenied', (psutil_error,), {})
+)
+
+
+class HostKeys(dict):
+    def load(self, filename):
+        pass
+    
+    def lookup(self, entry):
+        return self.get(entry)
+
+
+ssh_exception = type('SSHException', (Exception,), {})
+placeholder_module(
+    'paramiko',
+    SSHClient=object,
+    HostKeys=HostKeys,
+    MissingHostKeyPolicy=object,
+    RSAKey=object,
+    Ed25519Key=object,
+    ECDSAKey=object,
+    SSHException=ssh_exception,
+    AuthenticationException=type('AuthenticationException', (ssh_exception,), {}),
+    BadHostKeyException=type('BadHostKeyException', (ssh_exception,), {})
+)
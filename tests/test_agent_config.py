@@ -0,0 +1,67 @@
+"""Panel-pushed collection settings are coerced and bounded; invalid values keep previous config"""
+
+import logging
+import types
+
+from production_agent import ProductionAgent
+
+
+def make_agent():
+    """Agent with only the state apply_collection_settings touches (no threads, no network)"""
+    agent = object.__new__(ProductionAgent)
+    agent.logger = logging.getLogger('test-agent')
+    agent.heartbeat_collectors = {}
+    agent.collector_cache = {}
+    agent.transport = types.SimpleNamespace(compression=True, gzip_min_size=1024)
+    agent.sampler = types.SimpleNamespace(interval=1.0)
+    agent.heartbeat_interval = 30
+    agent.alert_thresholds = {'cpu': 80}
+    agent.config = {}
+    agent.config_version = 0
+    agent.saved = 0
+    
+    def save_config():
+        agent.saved += 1
+    
+    agent.save_config = save_config
+    agent.apply_collection_settings({})
+    return agent
+
+
+def test_numeric_settings_are_clamped():
+    agent = make_agent()
+    
+    result = agent.update_remote_config({
+        'heartbeat_interval': '1',
+        'sample_interval': 0.01,
+        'collector_intervals': {'disk': -1, 'processes': '5'},
+        'gzip_min_size': '2048'
+    }, 1)
+    
+    assert result == {'success': True, 'applied': True, 'version': 1}
+    assert agent.heartbeat_interval == 5
+    assert agent.sampler.interval == 0.5
+    assert agent.collector_intervals == {'processes': 5.0}
+    assert agent.transport.gzip_min_size == 2048
+    
+    agent.update_remote_config({'heartbeat_interval': 100000}, 2)
+    assert agent.heartbeat_interval == 3600
+
+
+def test_invalid_settings_keep_previous_config():
+    agent = make_agent()
+    agent.update_remote_config({'heartbeat_interval': 60, 'payload_profile': 'full'}, 1)
+    saved = agent.saved
+    
+    for version, settings in enumerate(({'heartbeat_interval': 'often', 'payload_profile': 'minimal'},
+                                        {'sample_interval': 'nan'},
+                                        {'collectors': ['disk']}), start=2):
+        result = agent.update_remote_config(settings, version)
+        assert result['success'] is False
+        assert result['version'] == 1
+    
+    assert agent.heartbeat_interval == 60
+    assert agent.payload_profile == 'full'
+    assert agent.sampler.interval == 1.0
+    assert agent.config_version == 1
+    assert agent.saved == saved
@@ -0,0 +1,39 @@
+"""ProcReader must read /proc files larger than its initial buffer"""
+
+from production_agent import ProcReader
+
+
+def make_proc_root(tmp_path, cpus):
+    """Fake /proc with a /proc/stat of one line per CPU"""
+    lines = ['cpu  %d 0 %d %d 0 0 0 0 0 0' % (cpus * 10, cpus * 5, cpus * 100)]
+    lines += ['cpu%d 10 0 5 100 0 0 0 0 0 0' % i for i in range(cpus)]
+    lines.append('intr 0')
+    (tmp_path / 'stat').write_text('\n'.join(lines) + '\n')
+    (tmp_path / 'net').mkdir()
+    for name in ('meminfo', 'net/dev', 'diskstats', 'loadavg'):
+        (tmp_path / name).write_text('')
+    return tmp_path
+
+
+def test_read_grows_buffer_for_large_file(tmp_path):
+    proc_root = make_proc_root(tmp_path, cpus=4096)
+    expected = (proc_root / 'stat').read_bytes()
+    assert len(expected) > 64 * 1024
+    
+    reader = ProcReader(proc_root=str(proc_root))
+    try:
+        assert reader.read('stat') == expected
+        # Повторное чтение идёт в уже расширенный буфер
+        assert reader.read('stat') == expected
+        assert len(reader.read_cpu_times()) == 4097
+    finally:
+        reader.close()
+
+
+def test_read_small_initial_buffer(tmp_path):
+    proc_root = make_proc_root(tmp_path, cpus=64)
+    reader = ProcReader(proc_root=str(proc_root), buffer_size=16)
+    try:
+        assert reader.read('stat') == (proc_root / 'stat').read_bytes()
+    finally:
+        reader.close()
@@ -0,0 +1,106 @@
+"""Chunked upload resumes only from the real end of .part and never hashes while holding a channel slot"""
+
+import hashlib
+import io
+import threading
+
+from sftp_transfer import SFTPTransfer
+
+
+class FakeRemoteFile(io.BytesIO):
+    def __init__(self, files, path, data=b''):
+        super().__init__(data)
+        self.files = files
+        self.path = path
+    
+    def set_pipelined(self, pipelined):
+        pass
+    
+    def close(self):
+        if not self.closed:
+            self.files[self.path] = self.getvalue()
+        super().close()
+
+
+class FakeSFTP:
+    def __init__(self, files):
+        self.files = files
+    
+    def stat(self, path):
+        if path not in self.files:
+            raise IOError(path)
+        return type('Attr', (), {'st_size': len(self.files[path])})
+    
+    def open(self, path, mode):
+        return FakeRemoteFile(self.files, path, self.files.get(path, b'') if 'r+' in mode else b'')
+    
+    def posix_rename(self, source, target):
+        self.files[target] = self.files.pop(source)
+    
+    def remove(self, path):
+        del self.files[path]
+    
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """One channel slot: SFTP sessions and commands compete for it like on SSHConnection"""
+    host = 'fake'
+    
+    def __init__(self):
+        self.files = {}
+        self.slots = threading.BoundedSemaphore(1)
+        self.sftp_lock = threading.Lock()
+    
+    def open_sftp_session(self):
+        if not self.slots.acquire(timeout=1):
+            return None
+        return FakeSFTP(self.files)
+    
+    def close_sftp_session(self, sftp):
+        self.slots.release()
+    
+    def get_sftp(self):
+        return FakeSFTP(self.files)
+    
+    def execute_command(self, command, timeout=None, get_pty=False):
+        if not self.slots.acquire(timeout=1):
+            return {'success': False, 'error': 'No free channel'}
+        try:
+            path = command.split()[-1].strip("'")
+            return {'success': True, 'output': f'{hashlib.sha256(self.files[path]).hexdigest()}  {path}'}
+        finally:
+            self.slots.release()
+
+
+def test_offset_mismatch_is_rejected():
+    conn = FakeConnection()
+    conn.files['/data/file.bin.part'] = b'x' * 10
+    transfer = SFTPTransfer(conn)
+    
+    result = transfer.upload_fileobj(io.BytesIO(b'tail'), '/data/file.bin', offset=4, complete=False)
+    
+    assert result['success'] is False
+    assert result['expected_offset'] == 10
+    assert conn.files['/data/file.bin.part'] == b'x' * 10
+    
+    result = transfer.upload_fileobj(io.BytesIO(b'tail'), '/data/file.bin', offset=10, complete=False)
+    assert result['success'] is True
+    assert conn.files['/data/file.bin.part'] == b'x' * 10 + b'tail'
+
+
+def test_verified_upload_with_single_channel():
+    conn = FakeConnection()
+    transfer = SFTPTransfer(conn)
+    data = b'payload' * 1000
+    
+    result = transfer.upload_fileobj(io.BytesIO(data), '/data/file.bin', total=len(data),
+                                     expected_sha256=hashlib.sha256(data).hexdigest())
+    
+    assert result['success'] is True
+    assert result['verified'] is True
+    assert conn.files['/data/file.bin'] == data
+    assert '/data/file.bin.part' not in conn.files
+    # Слот возвращен
+    assert conn.slots.acquire(blocking=False)
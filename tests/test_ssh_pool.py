@@ -0,0 +1,44 @@
+"""Concurrent requests for one server share a single handshake in the connection pool"""
+
+import threading
+import time
+
+from ssh_manager import SSHConnection, SSHManager
+
+
+def test_concurrent_get_connection_single_handshake(monkeypatch):
+    handshakes = []
+    disconnects = []
+    
+    def connect(self):
+        with self.connection_lock:
+            if self.connected:
+                return True
+            handshakes.append(self)
+            time.sleep(0.2)
+            self.connected = True
+            self.connecting = False
+            return True
+    
+    monkeypatch.setattr(SSHConnection, 'connect', connect)
+    monkeypatch.setattr(SSHConnection, 'is_alive', lambda self: self.connected)
+    monkeypatch.setattr(SSHConnection, 'disconnect', lambda self: disconnects.append(self))
+    
+    manager = SSHManager()
+    results = []
+    start = threading.Barrier(8)
+    
+    def request():
+        start.wait()
+        results.append(manager.get_connection('web-1', 'web-1.example', username='root', password='secret'))
+    
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(handshakes) == 1
+    assert disconnects == []
+    assert len({id(conn) for conn in results}) == 1
+    assert manager.connections['web-1'] is results[0]
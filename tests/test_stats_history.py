@@ -0,0 +1,60 @@
+"""Agent heartbeat payloads (nested) and replayed samples share one compact stats history"""
+
+from server_manager import ServerManager
+
+
+def agent_sample(timestamp, cpu, memory, disk):
+    """Heartbeat in the shape production_agent sends"""
+    return {
+        'server_id': 'web-1',
+        'timestamp': timestamp,
+        'cpu': {'usage': cpu, 'usage_per_core': [cpu]},
+        'memory': {'percent': memory, 'total': 1024},
+        'disk': {'/boot': {'percent': 90.0}, '/': {'percent': disk, 'total': 2048}},
+        'load_average': [0.5, 0.4, 0.3],
+        'uptime': 3600,
+        'processes': {'total': 100, 'top_cpu': [], 'top_memory': []}
+    }
+
+
+def test_summarize_maps_nested_agent_metrics():
+    summary = ServerManager.summarize_agent_stats(agent_sample('2026-01-01T00:00:10', 12.5, 40.0, 7.5))
+    
+    assert summary == {
+        'cpu_percent': 12.5,
+        'memory_percent': 40.0,
+        'disk_percent': 7.5,
+        'load_average': [0.5, 0.4, 0.3],
+        'uptime': 3600,
+        'timestamp': '2026-01-01T00:00:10'
+    }
+
+
+def test_summarize_keeps_flat_samples():
+    summary = ServerManager.summarize_agent_stats({'timestamp': 't', 'cpu_percent': 3, 'disk_percent': 1})
+    
+    assert summary == {'cpu_percent': 3, 'disk_percent': 1, 'timestamp': 't'}
+
+
+def test_replayed_samples_merge_with_live_history():
+    manager = ServerManager()
+    
+    manager.update_agent_data('web-1', {
+        'cpu_percent': 50,
+        'memory_percent': 60,
+        'disk_percent': 70,
+        'timestamp': '2026-01-01T00:01:00'
+    })
+    added = manager.record_stats_history('web-1', [
+        agent_sample('2026-01-01T00:00:30', 20, 30, 40),
+        agent_sample('2026-01-01T00:00:00', 10, 20, 30),
+        {'cpu': {'usage': 99}}
+    ])
+    
+    assert len(added) == 2
+    history = manager.get_stats_history('web-1')
+    assert [sample['timestamp'] for sample in history] == [
+        '2026-01-01T00:00:00', '2026-01-01T00:00:30', '2026-01-01T00:01:00'
+    ]
+    assert [sample['cpu_percent'] for sample in history] == [10, 20, 50]
+    assert manager.get_stats_history('web-1', since='2026-01-01T00:00:30') == history[2:]